@@ -0,0 +1,134 @@
+"""
+Recall and latency of gallery search against exhaustive image-guided detection.
+
+A gallery of augmented sample/ images (random crops, flips and scales) is
+searched for reference crops two ways:
+  - exhaustive: image_based_detection on every gallery image (target
+    feature maps cached, so only the reference crop and class head run per
+    image), ranking images by their best box score
+  - GalleryIndex: exhaustive over the stored boxes, then IVF with each
+    --nprobe value after train()
+Recall@k is the share of the exhaustive top-k images the index returns in
+its own top-k; the score gap is the mean difference between the best
+exhaustive and the best indexed box score of those images.
+
+Run from the repository root:
+    python -m benchmarks.gallery_benchmark --model owlv2 --images 64 --queries 8 --top-k 5 --lists 16 --nprobe 1,2,4,8
+"""
+import argparse
+import os
+import random
+import time
+
+from PIL import Image, ImageOps
+
+from config.constants import GALLERY_BOXES_PER_IMAGE, MODEL_NAMES
+from models.feature_store import ImageFeatureStore
+from models.gallery import GalleryIndex
+from models.model_loader import get_model_loader
+from models.modelpredictor import ModelPredictor
+from utils.image_utils import list_image_paths, load_image_by_path
+
+
+def augmented_gallery(images, count, seed=0):
+    """Return count images derived from images by random crops, flips and rescaling"""
+    generator = random.Random(seed)
+    gallery = []
+    for i in range(count):
+        image = images[i % len(images)]
+        scale = generator.uniform(0.6, 1.0)
+        width, height = round(image.width * scale), round(image.height * scale)
+        left, top = generator.randint(0, image.width - width), generator.randint(0, image.height - height)
+        image = image.crop((left, top, left + width, top + height))
+        if generator.random() < 0.5:
+            image = ImageOps.mirror(image)
+        long_side = generator.randint(480, 1280)
+        ratio = long_side / max(image.size)
+        gallery.append(image.resize((round(image.width * ratio), round(image.height * ratio)), Image.BILINEAR))
+    return gallery
+
+
+def reference_crops(images, count, reference, seed=1):
+    """Return the reference image followed by count - 1 random crops of the sample images"""
+    generator = random.Random(seed)
+    crops = [reference]
+    while len(crops) < count:
+        image = images[generator.randrange(len(images))]
+        size = round(min(image.size) * generator.uniform(0.15, 0.3))
+        left, top = generator.randint(0, image.width - size), generator.randint(0, image.height - size)
+        crops.append(image.crop((left, top, left + size, top + size)))
+    return crops
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    parser.add_argument("--images", type=int, default=64, help="gallery size")
+    parser.add_argument("--queries", type=int, default=8, help="reference crops searched")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--boxes-per-image", type=int, default=GALLERY_BOXES_PER_IMAGE)
+    parser.add_argument("--lists", type=int, default=16, help="IVF lists")
+    parser.add_argument("--nprobe", default="1,2,4,8")
+    parser.add_argument("--sample-dir", default="sample")
+    parser.add_argument("--reference", default=os.path.join("sample", "one_coin.jpg"))
+    args = parser.parse_args()
+
+    samples = [load_image_by_path(path) for path in list_image_paths(args.sample_dir)]
+    if not samples:
+        raise SystemExit(f"No images found in {args.sample_dir}")
+    images = augmented_gallery(samples, args.images)
+    keys = [f"gallery-{i}" for i in range(len(images))]
+    references = reference_crops(samples, args.queries, load_image_by_path(args.reference))
+
+    model, processor = get_model_loader(args.model).get_components()
+    # every gallery feature map stays cached, the exhaustive baseline runs the backbone once per image
+    predictor = ModelPredictor(model, processor, feature_store=ImageFeatureStore(max_items=len(images)))
+
+    start = time.perf_counter()
+    predictor.precompute_target_features(images, keys)
+    backbone = time.perf_counter() - start
+
+    exhaustive, exhaustive_time = [], 0.0
+    for reference in references:
+        start = time.perf_counter()
+        best = {}
+        for key, image in zip(keys, images):
+            _, scores, _ = predictor.image_based_detection(image, reference, target_key=key, threshold=0.0)
+            best[key] = float(scores.max()) if len(scores) else 0.0
+        exhaustive_time += time.perf_counter() - start
+        exhaustive.append(best)
+
+    gallery = GalleryIndex(predictor.model_name)
+    start = time.perf_counter()
+    predictor.add_to_gallery(gallery, images, keys, boxes_per_image=args.boxes_per_image)
+    build = time.perf_counter() - start
+
+    def evaluate(label, nprobe=None):
+        recall, gap, elapsed = 0.0, [], 0.0
+        for reference, best in zip(references, exhaustive):
+            start = time.perf_counter()
+            matches = predictor.search_gallery(gallery, reference, top_k=args.top_k, threshold=0.0, nprobe=nprobe)
+            elapsed += time.perf_counter() - start
+            expected = sorted(best, key=best.get, reverse=True)[:args.top_k]
+            found = {key: float(scores[0]) for key, _, scores in matches}
+            recall += len(set(expected) & set(found)) / len(expected)
+            gap += [best[key] - found[key] for key in expected if key in found]
+        print(f"  {label:<22} recall@{args.top_k} {recall / len(references):6.3f}  "
+              f"score gap {sum(gap) / max(len(gap), 1):+.4f}  {elapsed / len(references) * 1000:9.2f} ms/query")
+
+    print(f"---| {args.model}: {len(images)} images, {args.queries} queries, "
+          f"{gallery.stats()['rows']} indexed boxes ({gallery.stats()['vector_bytes'] / 2 ** 20:.1f} MB) |---")
+    print(f"  backbone over the gallery {backbone:.2f} s, index build {build:.2f} s (backbone included)")
+    print(f"  {'exhaustive':<22} recall@{args.top_k} {1:6.3f}  score gap {0:+.4f}  "
+          f"{exhaustive_time / len(references) * 1000:9.2f} ms/query (cached feature maps)")
+    evaluate("index, all boxes")
+
+    start = time.perf_counter()
+    gallery.train(lists=args.lists)
+    print(f"  trained {len(gallery.centroids)} IVF lists in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for nprobe in (int(value) for value in args.nprobe.split(",")):
+        evaluate(f"index, IVF nprobe {nprobe}", nprobe)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Startup cost of the command line paths, measured with `python -X importtime`.
+
+Three paths run in fresh interpreters:
+  - help:      `python -m queryvision --help` (argument parsing only)
+  - menu:      `import main`, everything loaded before the interactive task menu
+  - detection: `python -m queryvision detect` on one sample image (time to first detection)
+
+For each path the wall time is compared with its budget, the heaviest
+top-level imports are listed, and the help / menu paths are checked not to
+import torch, transformers, cv2, gradio or matplotlib. The exit status is 1
+when a budget is exceeded, so the script can gate CI.
+
+Run from the repository root:
+    python -m benchmarks.import_benchmark --help-budget-ms 300 --detection-budget-ms 20000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ("torch", "transformers", "cv2", "gradio", "matplotlib")
+
+
+def run_importtime(command):
+    """Run a python command with -X importtime; return (wall seconds, {top-level package: self time in us})"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", *command],
+                               capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    elapsed = time.perf_counter() - start
+
+    packages = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue
+        # self times add up without double counting, nested imports are charged to their own package
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_time)
+    return elapsed, packages
+
+
+def report(name, command, budget_ms, repeats, check_heavy):
+    """Time one startup path and print its breakdown; returns True when within budget"""
+    runs = [run_importtime(command) for _ in range(repeats)]
+    elapsed, packages = min(runs, key=lambda run: run[0])
+    heavy = [module for module in HEAVY_MODULES if module in packages]
+    within_budget = elapsed * 1000 <= budget_ms
+
+    print(f"---| {name}: {elapsed * 1000:.0f} ms (budget {budget_ms:.0f} ms) "
+          f"{'OK' if within_budget else 'OVER BUDGET'} |---")
+    for package, self_time in sorted(packages.items(), key=lambda item: -item[1])[:8]:
+        print(f"  {package:<28} {self_time / 1000:8.1f} ms")
+    if check_heavy and heavy:
+        print(f"  heavy modules imported: {', '.join(heavy)}")
+        within_budget = False
+    return within_budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="owlv2")
+    parser.add_argument("--image", default=os.path.join("sample", "coin.jpg"))
+    parser.add_argument("--help-budget-ms", type=float, default=300)
+    parser.add_argument("--menu-budget-ms", type=float, default=500)
+    parser.add_argument("--detection-budget-ms", type=float, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip-detection", action="store_true", help="only time the paths that load no model")
+    args = parser.parse_args()
+
+    ok = report("help", ["-m", "queryvision", "--help"], args.help_budget_ms, args.repeats, check_heavy=True)
+    ok &= report("menu", ["-c", "import main"], args.menu_budget_ms, args.repeats, check_heavy=True)
+
+    if not args.skip_detection:
+        with tempfile.TemporaryDirectory() as directory:
+            command = ["-m", "queryvision", "detect", "--model", args.model, "--input", args.image,
+                       "--queries", "coin", "--out", os.path.join(directory, "out.jsonl")]
+            # one run is enough, the model load dominates and warms the page cache for the others
+            ok &= report("detection", command, args.detection_budget_ms, 1, check_heavy=False)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Peak resident memory and throughput of the text pipeline with and without a memory budget.
+
+Large copies of the sample/ images (--resolution on the long side, JPEG)
+are detected by the PipelineRunner once per --budgets entry, every case in a
+fresh process so its peak RSS is its own: "none" is the unbounded pipeline
+at --batch-size, a number is a MemoryBudget in MB (the --memory-budget of
+`detect`), which caps the batch size and the bytes of images in flight.
+For each case the script prints the batch size used, peak RSS, the largest
+rise of the high-water mark during one vision_encode call (the per-batch
+activation peak), the peak bytes in flight and images/sec.
+
+Run from the repository root:
+    python -m benchmarks.memory_benchmark --model owlv2 --images 32 --batch-size 8 --budgets none,7000,4000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from config.constants import MODEL_NAMES
+from utils.image_utils import list_image_paths, load_image_by_path
+
+
+def write_images(sample_dir, directory, count, resolution):
+    """Save count JPEGs cycling over sample_dir, resized to resolution pixels on the long side"""
+    images = [load_image_by_path(path) for path in list_image_paths(sample_dir)]
+    if not images:
+        raise SystemExit(f"No images found in {sample_dir}")
+    paths = []
+    for i in range(count):
+        image = images[i % len(images)]
+        scale = resolution / max(image.size)
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BILINEAR)
+        paths.append(os.path.join(directory, f"image-{i:04d}.jpg"))
+        image.save(paths[-1], quality=90)
+    return paths
+
+
+def run_case(name, budget_mb, paths, texts, batch_size, save_dir):
+    """Detect every image in paths in this (fresh) process and return its memory and throughput"""
+    from models.model_loader import MODEL_LOADERS
+    from models.modelpredictor import ModelPredictor
+    from models.pipeline import PipelineRunner
+    from utils.memory import MemoryBudget
+    from utils.metrics import METRICS
+
+    model, processor = MODEL_LOADERS[name]().get_components()
+    memory_budget = MemoryBudget(budget_mb) if budget_mb is not None else None
+    predictor = ModelPredictor(model, processor, memory_budget=memory_budget)
+    runner = PipelineRunner(predictor, texts, batch_size=batch_size, save_dir=save_dir)
+
+    start = time.perf_counter()
+    runner.run(paths)
+    elapsed = time.perf_counter() - start
+    vision = METRICS.snapshot()["stages"].get("vision_encode", {})
+    return {
+        "batch_size": runner.batch_size,
+        "peak_rss_mb": METRICS.memory().get("peak_rss_bytes", 0) / 2 ** 20,
+        "vision_peak_growth_mb": vision.get("peak_rss_growth_mb", 0.0),
+        "peak_in_flight_mb": memory_budget.peak_in_flight / 2 ** 20 if memory_budget is not None else None,
+        "images_per_sec": len(paths) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    parser.add_argument("--images", type=int, default=32)
+    parser.add_argument("--resolution", type=int, default=4000, help="long side of the generated JPEGs")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--budgets", default="none,7000,4000", help='"none" or a budget in MB, comma-separated')
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--render", action="store_true", help="also annotate and save every image")
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    texts = [query.strip() for query in args.queries.split(",") if query.strip()]
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_images(args.sample_dir, directory, args.images, args.resolution)
+        save_dir = os.path.join(directory, "annotated") if args.render else None
+
+        print(f"---| {args.model}: {args.images} images at {args.resolution} px, requested batch {args.batch_size} |---")
+        print(f"{'budget':>8} {'batch':>6} {'peak RSS':>11} {'vision peak':>13} {'in flight':>11} {'images/sec':>11}")
+        for budget in args.budgets.split(","):
+            budget_mb = None if budget == "none" else float(budget)
+            with context.Pool(1) as pool:
+                case = pool.apply(run_case, (args.model, budget_mb, paths, texts, args.batch_size, save_dir))
+            in_flight = "-" if case["peak_in_flight_mb"] is None else f"{case['peak_in_flight_mb']:.0f} MB"
+            print(f"{budget:>8} {case['batch_size']:>6} {case['peak_rss_mb']:>8.0f} MB "
+                  f"{case['vision_peak_growth_mb']:>10.0f} MB {in_flight:>11} {case['images_per_sec']:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
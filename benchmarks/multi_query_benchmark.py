@@ -0,0 +1,109 @@
+"""
+Cost per additional query of fused multi-query detection.
+
+For every query count, half text queries and half reference crops, one
+target image is searched three ways:
+  - separate: one text_based_detection / image_based_detection call per
+    query, the target vision pass redone by every call
+  - fused: one multi_query_detection call, the target encoded once
+  - fused, cached target: the same call with the target feature map
+    already in the feature store, i.e. class head and post-processing only
+Query embeddings are warmed first, so all three measure the target side.
+The marginal cost per extra query is the slope between the smallest and
+the largest query count; fused should grow with the class head, separate
+with the backbone. "encode new" is the first fused call, which also
+encodes every query.
+
+Run from the repository root:
+    python -m benchmarks.multi_query_benchmark --model owlv2 --query-counts 1,2,4,8,16 --repeats 3
+"""
+import argparse
+import os
+import time
+
+from config.constants import MODEL_NAMES
+from models.feature_store import ImageFeatureStore
+from models.model_loader import get_model_loader
+from models.modelpredictor import ModelPredictor
+from models.query_cache import QueryEmbeddingCache
+from utils.image_utils import list_image_paths, load_image_by_path
+
+TEXTS = ("coin", "box", "a cardboard box", "a metal coin", "a person", "a car", "a bottle", "a cup")
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def make_queries(count, samples):
+    """Return count // 2 (rounded up) text queries and a dict of the remaining reference crops"""
+    texts = [TEXTS[i % len(TEXTS)] + (f" {i // len(TEXTS)}" if i >= len(TEXTS) else "")
+             for i in range((count + 1) // 2)]
+    references = {}
+    for i in range(count // 2):
+        image = samples[i % len(samples)]
+        size = min(image.size) // 3
+        offset = (i // len(samples)) * size // 4
+        references[f"crop {i}"] = image.crop((offset, offset, offset + size, offset + size))
+    return texts, references
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    parser.add_argument("--query-counts", default="1,2,4,8,16")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--target", default=os.path.join("sample", "coin.jpg"))
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    model, processor = get_model_loader(args.model).get_components()
+    query_cache = QueryEmbeddingCache()
+    # no feature store entries survive, every call encodes the target again
+    uncached = ModelPredictor(model, processor, query_cache=query_cache, feature_store=ImageFeatureStore(max_items=0))
+    cached = ModelPredictor(model, processor, query_cache=query_cache)
+    target = load_image_by_path(args.target)
+    samples = [load_image_by_path(path) for path in list_image_paths(args.sample_dir)]
+
+    def separate(texts, references):
+        for text in texts:
+            uncached.text_based_detection(target, [text])
+        for crop in references.values():
+            uncached.image_based_detection(target, crop)
+
+    counts = [int(count) for count in args.query_counts.split(",")]
+    timings = {}
+    print(f"---| {args.model}: target {target.width}x{target.height} |---")
+    print(f"{'queries':>8} {'encode new':>12} {'separate':>12} {'fused':>12} {'fused, cached target':>22}")
+    for count in counts:
+        texts, references = make_queries(count, samples)
+        start = time.perf_counter()
+        uncached.multi_query_detection(target, texts, references)
+        # first call: target and every query encoded
+        encode = time.perf_counter() - start
+        cached.multi_query_detection(target, texts, references, target_key="target")
+
+        timings[count] = (
+            best_time(lambda: separate(texts, references), args.repeats),
+            best_time(lambda: uncached.multi_query_detection(target, texts, references), args.repeats),
+            best_time(lambda: cached.multi_query_detection(target, texts, references, target_key="target"),
+                      args.repeats),
+        )
+        separate_time, fused_time, cached_time = timings[count]
+        print(f"{count:>8} {encode * 1000:>9.1f} ms {separate_time * 1000:>9.1f} ms {fused_time * 1000:>9.1f} ms "
+              f"{cached_time * 1000:>19.1f} ms")
+
+    if len(counts) > 1:
+        low, high = min(counts), max(counts)
+        slopes = [(after - before) / (high - low) * 1000 for before, after in zip(timings[low], timings[high])]
+        print(f"---| per additional query: separate {slopes[0]:.1f} ms, fused {slopes[1]:.1f} ms, "
+              f"fused with cached target {slopes[2]:.1f} ms |---")
+
+
+if __name__ == "__main__":
+    main()
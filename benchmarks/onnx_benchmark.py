@@ -0,0 +1,127 @@
+"""
+Parity and latency of the ONNX Runtime backend against the eager model.
+
+The model is exported with models.backends.export_onnx (unless --onnx-dir
+already holds the graphs), then every sample/ image is detected with both
+backends. Raw outputs (feature map, boxes, logits, query embeddings) are
+compared element-wise and detections are matched by IoU; latency is
+reported per component and end to end. The exit status is 1 when parity
+fails, so this doubles as the backend's parity check.
+
+Run from the repository root:
+    python -m benchmarks.onnx_benchmark --model owlv2 --onnx-dir onnx/owlv2
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from torchvision.ops import box_iou
+
+from config.constants import DEVICE, MODEL_NAMES
+from models.backends import OnnxRuntimeBackend, TorchBackend, export_onnx
+from models.model_loader import MODEL_LOADERS
+from models.modelpredictor import ModelPredictor
+from utils.image_utils import list_image_paths, load_image_by_path
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def detections_match(first, second, min_iou=0.99):
+    """Same number of detections, same labels and every box matched at min_iou"""
+    (a_boxes, _, a_labels), (b_boxes, _, b_labels) = first, second
+    if len(a_boxes) != len(b_boxes) or sorted(a_labels) != sorted(b_labels):
+        return False
+    return len(a_boxes) == 0 or bool((box_iou(a_boxes, b_boxes).max(dim=1).values >= min_iou).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    parser.add_argument("--onnx-dir", help="exported graphs, a temporary export is used if not given")
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--atol", type=float, default=1e-3, help="max abs difference of raw outputs")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+    if DEVICE != "cpu":
+        raise SystemExit("the onnx backend runs on CPU, compare with CUDA_VISIBLE_DEVICES= set")
+
+    texts = args.queries.split(",")
+    images = [load_image_by_path(path) for path in list_image_paths(args.sample_dir)]
+    model, processor = MODEL_LOADERS[args.model](precision="fp32").get_components()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        onnx_dir = args.onnx_dir or tmp_dir
+        if not os.path.exists(os.path.join(onnx_dir, "export.json")):
+            with contextlib.redirect_stdout(io.StringIO()):
+                export_onnx(model, processor, onnx_dir)
+        backends = {"torch": TorchBackend(model), "onnx": OnnxRuntimeBackend(onnx_dir)}
+
+        eager = ModelPredictor(model, processor, backend=backends["torch"])
+        onnx = ModelPredictor(model, processor, backend=backends["onnx"])
+
+        # raw outputs of every component on the first sample batch
+        pixel_values = eager.preprocess_images(images)
+        text_inputs = processor(text=texts, return_tensors="pt")
+        outputs = {}
+        for name, backend in backends.items():
+            feature_map = backend.image_features(pixel_values)
+            text_embeds = backend.text_features(text_inputs["input_ids"], text_inputs["attention_mask"])
+            query_embeds = text_embeds.unsqueeze(0).expand(len(feature_map), -1, -1)
+            outputs[name] = {
+                "image encoder": feature_map.float(),
+                "text encoder": text_embeds.float(),
+                "box head": backend.box_predictions(feature_map).float(),
+                "class head": backend.class_logits(feature_map, query_embeds).float(),
+            }
+
+        component_inputs = {
+            "image encoder": lambda backend: backend.image_features(pixel_values),
+            "text encoder": lambda backend: backend.text_features(text_inputs["input_ids"],
+                                                                  text_inputs["attention_mask"]),
+            "box head": lambda backend: backend.box_predictions(outputs["torch"]["image encoder"]),
+            "class head": lambda backend: backend.class_logits(
+                outputs["torch"]["image encoder"],
+                outputs["torch"]["text encoder"].unsqueeze(0).expand(len(images), -1, -1)),
+        }
+
+        parity = True
+        print(f"---| {args.model}: {len(images)} images, {len(texts)} queries |---")
+        print(f"{'component':>16} {'max |diff|':>11} {'torch ms':>9} {'onnx ms':>9} {'speedup':>8}")
+        for component, run in component_inputs.items():
+            diff = (outputs["torch"][component] - outputs["onnx"][component]).abs().max().item()
+            parity &= diff <= args.atol
+            torch_time = best_time(lambda: run(backends["torch"]), args.repeats)
+            onnx_time = best_time(lambda: run(backends["onnx"]), args.repeats)
+            print(f"{component:>16} {diff:>11.2e} {torch_time * 1000:>9.1f} {onnx_time * 1000:>9.1f} "
+                  f"{torch_time / onnx_time:>7.2f}x")
+
+        # end to end, text embeddings cached by both predictors after the first call
+        with contextlib.redirect_stdout(io.StringIO()):
+            eager_detections = eager.text_based_detection_batch(images, texts)
+            onnx_detections = onnx.text_based_detection_batch(images, texts)
+        matched = sum(detections_match(a, b) for a, b in zip(eager_detections, onnx_detections))
+        parity &= matched == len(images)
+        torch_time = best_time(lambda: eager.text_based_detection_batch(images, texts), args.repeats)
+        onnx_time = best_time(lambda: onnx.text_based_detection_batch(images, texts), args.repeats)
+        print(f"{'end to end':>16} {'':>11} {torch_time * 1000:>9.1f} {onnx_time * 1000:>9.1f} "
+              f"{torch_time / onnx_time:>7.2f}x")
+        print(f"  detections matching eager: {matched}/{len(images)} images, parity {'OK' if parity else 'FAILED'}")
+
+    sys.exit(0 if parity else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Post-processing cost of models.postprocess against the HF post-processors.
+
+Random logits and boxes shaped like OWLv2 outputs (3600 candidate boxes per
+image at 960x960) are post-processed by post_process_detections and by the
+HF image processor's post_process_object_detection (text-based, no NMS) and
+post_process_image_guided_detection (image-based, per-image NMS loop).
+No model weights are needed. The exit status is 1 when per-query
+thresholds (as used by multi_query_detection) let a query below its own
+threshold take a box from one above it, so this doubles as their check.
+
+Run from the repository root:
+    python -m benchmarks.postprocess_benchmark --images 8 --boxes 3600 --queries 4
+"""
+import argparse
+import sys
+import time
+from types import SimpleNamespace
+
+import torch
+from transformers import Owlv2ImageProcessor
+
+from config.constants import NMS_THRESHOLD
+from models.postprocess import post_process_detections
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_outputs(images, boxes, queries, seed=0):
+    """Logits and normalized (center_x, center_y, width, height) boxes with realistic overlap"""
+    generator = torch.Generator().manual_seed(seed)
+    logits = torch.randn(images, boxes, queries, generator=generator) * 2 - 4
+    centers = torch.rand(images, boxes, 2, generator=generator)
+    sizes = torch.rand(images, boxes, 2, generator=generator) * 0.2 + 0.02
+    return logits, torch.cat([centers, sizes], dim=-1)
+
+
+def per_query_thresholds_hold():
+    """
+    Check boxes take the best query above its own threshold: a text query
+    scoring 0.5 (threshold 0.3) keeps its box when a reference scores 0.55
+    but needs 0.6, exactly as text-only detection of the same box
+    """
+    thresholds = torch.tensor([0.3, 0.6])
+    scores = torch.tensor([[[0.5, 0.55],    # reference below its threshold: text keeps the box
+                            [0.4, 0.7],     # both pass: the reference scores higher
+                            [0.2, 0.5]]])   # neither passes
+    logits = torch.logit(scores)
+    pred_boxes = torch.tensor([[[0.2, 0.2, 0.1, 0.1], [0.5, 0.5, 0.1, 0.1], [0.8, 0.8, 0.1, 0.1]]])
+    fused = post_process_detections(logits, pred_boxes, [(100, 100)], thresholds)[0]
+    text_only = post_process_detections(logits[..., :1], pred_boxes, [(100, 100)], float(thresholds[0]))[0]
+
+    expected_scores = torch.tensor([0.7, 0.5])
+    return (fused["labels"].tolist() == [1, 0]
+            and torch.allclose(fused["scores"], expected_scores)
+            and torch.equal(fused["boxes"][1], text_only["boxes"][0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--boxes", type=int, default=3600)
+    parser.add_argument("--queries", type=int, default=4)
+    parser.add_argument("--threshold", type=float, default=0.05)
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    logits, pred_boxes = random_outputs(args.images, args.boxes, args.queries)
+    target_sizes = torch.tensor([(1080, 1920)] * args.images)
+    candidates = int((logits.max(dim=-1).values.sigmoid() > args.threshold).sum())
+    hf_processor = Owlv2ImageProcessor()
+
+    # text-based: HF applies no NMS, ours runs per-query NMS and top-k on top
+    ours_text = best_time(
+        lambda: post_process_detections(logits, pred_boxes, target_sizes, args.threshold, pad_to_square=True),
+        args.repeats
+    )
+    hf_text = best_time(
+        lambda: hf_processor.post_process_object_detection(
+            SimpleNamespace(logits=logits, pred_boxes=pred_boxes), threshold=args.threshold,
+            target_sizes=target_sizes
+        ),
+        args.repeats
+    )
+
+    # image-based: class-agnostic NMS on one query per image
+    guided_logits = logits[..., :1]
+    ours_image = best_time(
+        lambda: post_process_detections(guided_logits, pred_boxes, target_sizes, args.threshold,
+                                        class_agnostic=True, pad_to_square=True),
+        args.repeats
+    )
+    hf_image = best_time(
+        lambda: hf_processor.post_process_image_guided_detection(
+            SimpleNamespace(logits=guided_logits, target_pred_boxes=pred_boxes), threshold=args.threshold,
+            nms_threshold=NMS_THRESHOLD, target_sizes=target_sizes
+        ),
+        args.repeats
+    )
+
+    results = post_process_detections(logits, pred_boxes, target_sizes, args.threshold, pad_to_square=True)
+    kept = sum(len(result["boxes"]) for result in results)
+    print(f"---| {args.images} images x {args.boxes} boxes x {args.queries} queries, "
+          f"{candidates} candidates above {args.threshold} |---")
+    print(f"  text-based  : {ours_text * 1000:8.2f} ms ours (NMS + top-k, {kept} kept)  "
+          f"{hf_text * 1000:8.2f} ms HF post_process_object_detection (no NMS)")
+    print(f"  image-based : {ours_image * 1000:8.2f} ms ours  "
+          f"{hf_image * 1000:8.2f} ms HF post_process_image_guided_detection ({hf_image / ours_image:.1f}x)")
+
+    thresholds_ok = per_query_thresholds_hold()
+    print(f"  per-query thresholds : {'OK' if thresholds_ok else 'FAILED'}")
+    sys.exit(0 if thresholds_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Compare inference precision modes (fp32, bf16, int8) on the sample/ images.
+
+Each mode runs in a fresh interpreter so resident memory is measured per
+mode. Detections are matched to the fp32 ones by IoU and reported as box
+IoU / score deviation next to latency and resident memory.
+
+Run from the repository root:
+    python -m benchmarks.precision_benchmark --model owlv2 --modes fp32,bf16,int8
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import torch
+from torchvision.ops import box_iou
+
+from models.model_loader import MODEL_LOADERS, PRECISIONS
+
+
+def resident_memory_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 2**20
+    except OSError:
+        # ru_maxrss is the high-water mark (KB on Linux), the best we have elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(args):
+    """Run one precision mode and print its timings and detections as JSON"""
+    from models.modelpredictor import ModelPredictor
+    from utils.image_utils import list_image_paths, load_image_by_path
+
+    texts = args.queries.split(",")
+    paths = list_image_paths(args.sample_dir)
+    images = [load_image_by_path(path) for path in paths]
+
+    model, processor = MODEL_LOADERS[args.model](precision=args.worker).get_components()
+    predictor = ModelPredictor(model, processor)
+    predictor.text_based_detection(images[0], texts)  # warm-up
+
+    latencies = []
+    for _ in range(args.repeats):
+        for image in images:
+            start = time.perf_counter()
+            predictor.text_based_detection(image, texts)
+            latencies.append(time.perf_counter() - start)
+
+    detections = {}
+    for path, image in zip(paths, images):
+        boxes, scores, labels = predictor.text_based_detection(image, texts)
+        detections[path] = {"boxes": boxes.tolist(), "scores": scores.tolist(), "labels": labels}
+
+    latencies.sort()
+    print(json.dumps({
+        "mean_ms": 1000 * sum(latencies) / len(latencies),
+        "p50_ms": 1000 * latencies[len(latencies) // 2],
+        "rss_mb": resident_memory_mb(),
+        "detections": detections,
+    }))
+
+
+def compare(reference, candidate):
+    """Match candidate boxes to reference boxes by IoU; return mean IoU, mean |score diff| and recall"""
+    ious, score_diffs, matched, total = [], [], 0, 0
+    for path, ref in reference.items():
+        cand = candidate[path]
+        total += len(ref["boxes"])
+        if not ref["boxes"] or not cand["boxes"]:
+            continue
+
+        iou = box_iou(torch.tensor(ref["boxes"]), torch.tensor(cand["boxes"]))
+        best_iou, best_index = iou.max(dim=1)
+        for i, (value, j) in enumerate(zip(best_iou.tolist(), best_index.tolist())):
+            if value >= 0.5 and ref["labels"][i] == cand["labels"][j]:
+                matched += 1
+                ious.append(value)
+                score_diffs.append(abs(ref["scores"][i] - cand["scores"][j]))
+
+    return {
+        "mean_iou": sum(ious) / len(ious) if ious else float("nan"),
+        "mean_score_diff": sum(score_diffs) / len(score_diffs) if score_diffs else float("nan"),
+        "recall_vs_fp32": matched / total if total else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_LOADERS, default="owlv2")
+    parser.add_argument("--modes", default=",".join(PRECISIONS))
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sample-dir", default="sample")
+    parser.add_argument("--worker", choices=PRECISIONS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    modes = args.modes.split(",")
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+
+    results = {}
+    for mode in modes:
+        command = [sys.executable, "-m", "benchmarks.precision_benchmark", "--worker", mode,
+                   "--model", args.model, "--queries", args.queries,
+                   "--repeats", str(args.repeats), "--sample-dir", args.sample_dir]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"---| {args.model}: precision comparison on {args.sample_dir}/ |---")
+    print(f"{'mode':>6} {'mean ms':>9} {'p50 ms':>9} {'RSS MB':>9} {'mean IoU':>9} {'|d score|':>10} {'recall':>7}")
+    for mode, result in results.items():
+        deviation = compare(results["fp32"]["detections"], result["detections"])
+        print(
+            f"{mode:>6} {result['mean_ms']:>9.1f} {result['p50_ms']:>9.1f} {result['rss_mb']:>9.0f} "
+            f"{deviation['mean_iou']:>9.3f} {deviation['mean_score_diff']:>10.4f} {deviation['recall_vs_fp32']:>7.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
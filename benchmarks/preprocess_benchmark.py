@@ -0,0 +1,95 @@
+"""
+Parity and speed of models.preprocess against the HF image processors.
+
+Every sample/ image plus synthetic sizes (upscales, odd aspect ratios, a
+12 MP photo) is converted by the HF Owlv2ImageProcessor / OwlViTImageProcessor
+and by FastImagePreprocessor; the script prints the largest and mean absolute
+pixel_values difference and both timings, and exits 1 when a difference
+exceeds --atol, so it doubles as the parity test of the fast path.
+
+Draft-mode JPEG decoding (FastImagePreprocessor.load) is then compared with a
+full decode of the same files, saved at the synthetic sizes: this path is not
+bit-identical (the DCT downscale replaces part of the anti-aliasing), so its
+deviation is reported but not checked. No model weights are needed.
+
+Run from the repository root:
+    python -m benchmarks.preprocess_benchmark --repeats 5 --atol 1e-4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+from transformers import Owlv2ImageProcessor, OwlViTImageProcessor
+
+from models.preprocess import FastImagePreprocessor
+from utils.image_utils import list_image_paths, load_image_by_path
+
+# (width, height) of the synthetic images, resized from the first sample image
+SYNTHETIC_SIZES = ((300, 200), (961, 960), (700, 1500), (1920, 1080), (4000, 3000))
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sample-dir", default="sample")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--atol", type=float, default=1e-4, help="largest allowed pixel_values difference")
+    args = parser.parse_args()
+
+    paths = list_image_paths(args.sample_dir)
+    if not paths:
+        raise SystemExit(f"No images found in {args.sample_dir}")
+    images = [(os.path.basename(path), load_image_by_path(path)) for path in paths]
+    synthetic = [(f"{width}x{height}", images[0][1].resize((width, height), Image.BICUBIC))
+                 for width, height in SYNTHETIC_SIZES]
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as jpeg_dir:
+        jpeg_paths = []
+        for name, image in synthetic:
+            jpeg_paths.append(os.path.join(jpeg_dir, f"{name}.jpg"))
+            image.save(jpeg_paths[-1], quality=90)
+
+        for hf_processor in (Owlv2ImageProcessor(), OwlViTImageProcessor()):
+            fast = FastImagePreprocessor.from_processor(hf_processor)
+            print(f"---| {type(hf_processor).__name__} -> {fast.kind} {fast.width}x{fast.height} |---")
+            for name, image in images + synthetic:
+                expected = hf_processor(images=[image], return_tensors="pt")["pixel_values"]
+                difference = (fast([image]) - expected).abs()
+                hf_time = best_time(lambda: hf_processor(images=[image], return_tensors="pt"), args.repeats)
+                fast_time = best_time(lambda: fast([image]), args.repeats)
+                failed = difference.max() > args.atol
+                failures += bool(failed)
+                print(f"  {name:<22} {image.width:>5}x{image.height:<5} max diff {difference.max():.2e} "
+                      f"mean {difference.mean():.2e}  HF {hf_time * 1000:8.1f} ms  fast {fast_time * 1000:7.1f} ms "
+                      f"({hf_time / fast_time:4.1f}x){'  FAILED' if failed else ''}")
+
+            print("  draft decode (decode + preprocess, deviation from a full decode):")
+            for path in jpeg_paths:
+                full = fast([load_image_by_path(path)])
+                draft_image, original_size = fast.load(path)
+                difference = (fast([draft_image]) - full).abs()
+                full_time = best_time(lambda: fast([load_image_by_path(path)]), args.repeats)
+                draft_time = best_time(lambda: fast([fast.load(path)[0]]), args.repeats)
+                print(f"  {os.path.basename(path):<22} decoded at {draft_image.width:>4}x{draft_image.height:<4} "
+                      f"max diff {difference.max():.2e} mean {difference.mean():.2e}  "
+                      f"full {full_time * 1000:7.1f} ms  draft {draft_time * 1000:7.1f} ms "
+                      f"({full_time / draft_time:4.1f}x)")
+
+    print(f"---| {failures} image(s) above --atol {args.atol:g} |---")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Query embeddings persisted across processes by QueryEmbeddingCache.
+
+Two fresh interpreters detect the same text queries in one sample image with
+a query cache file (cache_path) in a temporary directory: the first starts
+cold, encodes every query and writes the file on flush(), the second loads
+it and should encode nothing. For each run the script prints the query cache
+hits / misses counted in METRICS, the queries encoded and the text encoder
+time. The exit status is 1 when the second run misses, so this doubles as
+the check that the cache file is written and read back.
+
+Run from the repository root:
+    python -m benchmarks.query_cache_benchmark --model owlv2 --queries "coin,box,a metal coin"
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from config.constants import MODEL_NAMES
+
+CHILD_CODE = """
+import json
+from models.model_loader import get_model_loader
+from models.modelpredictor import ModelPredictor
+from models.query_cache import QueryEmbeddingCache
+from utils.image_utils import load_image_by_path
+from utils.metrics import METRICS
+
+model, processor = get_model_loader({name!r}).get_components()
+predictor = ModelPredictor(model, processor, query_cache=QueryEmbeddingCache(cache_path={path!r}))
+predictor.text_based_detection(load_image_by_path({image!r}), {queries!r})
+predictor.query_cache.flush()
+snapshot = METRICS.snapshot()
+print(json.dumps({{"counters": snapshot["counters"], "text_encode": snapshot["stages"].get("text_encode", {{}})}}))
+"""
+
+
+def run_process(name, path, image, queries):
+    """Detect the queries in a fresh interpreter and return its METRICS counters and text encoder stage"""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_CODE.format(name=name, path=path, image=image, queries=queries)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    parser.add_argument("--queries", default="coin,box,a metal coin")
+    parser.add_argument("--image", default=os.path.join("sample", "coin.jpg"))
+    args = parser.parse_args()
+
+    queries = [query.strip() for query in args.queries.split(",") if query.strip()]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "query_embeddings.pt")
+        runs = [run_process(args.model, path, args.image, queries) for _ in range(2)]
+
+    print(f"---| {args.model}: {len(queries)} queries, cache file reused by a second process |---")
+    print(f"{'process':>8} {'hits':>6} {'misses':>7} {'encoded':>8} {'text encode':>13}")
+    for label, run in zip(("first", "second"), runs):
+        counters = run["counters"]
+        encode = f"{run['text_encode']['total_s'] * 1000:.1f} ms" if run["text_encode"].get("count") else "-"
+        print(f"{label:>8} {counters.get('query_cache_hits', 0):>6} {counters.get('query_cache_misses', 0):>7} "
+              f"{counters.get('queries_encoded', 0):>8} {encode:>13}")
+
+    second = runs[1]["counters"]
+    warm = second.get("query_cache_hits", 0) == len(queries) and not second.get("query_cache_misses", 0)
+    print(f"---| second process served from the cache file: {'OK' if warm else 'FAILED'} |---")
+    sys.exit(0 if warm else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Annotation cost of render_detections against plot_detection.
+
+Random boxes with a handful of labels are drawn on a synthetic image, once
+with plot_detection and once with render_detections (copy and in-place),
+then saved as JPEG. No model is needed.
+
+Run from the repository root:
+    python -m benchmarks.render_benchmark --boxes 300 --width 1920 --height 1080
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from config.constants import JPEG_QUALITY
+from utils.visualization import _label_patch, plot_detection, render_detections, save_image
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def random_detections(count, width, height, labels, seed=0):
+    """Random xyxy boxes, scores and labels inside a width x height image"""
+    generator = torch.Generator().manual_seed(seed)
+    corners = torch.rand(count, 2, generator=generator) * torch.tensor([width * 0.9, height * 0.9])
+    sizes = torch.rand(count, 2, generator=generator) * torch.tensor([width * 0.1, height * 0.1]) + 8
+    boxes = torch.cat([corners, corners + sizes], dim=1)
+    scores = torch.rand(count, generator=generator)
+    return boxes, scores, [labels[i % len(labels)] for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--boxes", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--queries", default="coin,box,person,car")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--quality", type=int, default=JPEG_QUALITY)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    image = Image.fromarray(rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8))
+    boxes, scores, labels = random_detections(args.boxes, args.width, args.height, args.queries.split(","))
+
+    def baseline():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return plot_detection(image, boxes, scores, labels)
+
+    plot_time = best_time(baseline, args.repeats)
+    # first image of a run: every label/score string still has to be rasterized
+    _label_patch.cache_clear()
+    cold_time = best_time(lambda: render_detections(image, boxes, scores, labels), 1)
+    render_time = best_time(lambda: render_detections(image, boxes, scores, labels), args.repeats)
+    # in-place drawing needs a fresh canvas per run, copied outside the timed call
+    canvases = [image.copy() for _ in range(args.repeats)]
+    in_place_time = best_time(
+        lambda: render_detections(canvases.pop(), boxes, scores, labels, in_place=True), args.repeats
+    )
+
+    annotated = render_detections(image, boxes, scores, labels)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "annotated.jpg")
+        default_save = best_time(lambda: annotated.save(path), args.repeats)
+        default_size = os.path.getsize(path)
+        quality_save = best_time(lambda: save_image(annotated, path, quality=args.quality), args.repeats)
+        quality_size = os.path.getsize(path)
+
+    print(f"---| {args.boxes} boxes on {args.width}x{args.height} |---")
+    print(f"  plot_detection              : {plot_time * 1000:8.2f} ms")
+    print(f"  render_detections (cold)    : {cold_time * 1000:8.2f} ms ({plot_time / cold_time:.1f}x)")
+    print(f"  render_detections (copy)    : {render_time * 1000:8.2f} ms ({plot_time / render_time:.1f}x)")
+    print(f"  render_detections (in place): {in_place_time * 1000:8.2f} ms ({plot_time / in_place_time:.1f}x)")
+    print(f"  JPEG save default quality   : {default_save * 1000:8.2f} ms, {default_size / 1024:.0f} KB")
+    print(f"  JPEG save quality={args.quality:<3}      : {quality_save * 1000:8.2f} ms, {quality_size / 1024:.0f} KB")
+    print(f"  matplotlib imported         : {'matplotlib' in sys.modules}")
+
+
+if __name__ == "__main__":
+    main()
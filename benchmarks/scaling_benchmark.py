@@ -0,0 +1,55 @@
+"""
+Throughput of the multi-process runner over worker count x threads per worker.
+
+The sample/ images are replicated to build a larger input, which is run
+through models.sharded_runner.ShardedRunner for every combination of worker
+count and torch threads per worker. Combinations using more threads than
+CPU cores are skipped.
+
+Run from the repository root:
+    python -m benchmarks.scaling_benchmark --model owlv2 --workers 1,2,4,8 --threads 1,2,4 --replicate 16
+"""
+import argparse
+import contextlib
+import io
+import os
+
+from models.model_loader import MODEL_LOADERS
+from models.sharded_runner import ShardedRunner
+from utils.image_utils import list_image_paths
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_LOADERS, default="owlv2")
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--threads", default=f"1,2,4,{cores}")
+    parser.add_argument("--replicate", type=int, default=16, help="copies of the sample/ images in the input")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    texts = args.queries.split(",")
+    paths = list_image_paths(args.sample_dir) * args.replicate
+    grid = [(int(workers), int(threads)) for workers in args.workers.split(",")
+            for threads in sorted(set(args.threads.split(",")), key=int)
+            if int(workers) * int(threads) <= cores]
+
+    print(f"---| {args.model}: {len(paths)} images, {cores} CPU cores |---")
+    print(f"{'workers':>8} {'threads':>8} {'images/s':>9} {'speedup':>8}")
+    baseline = None
+    for workers, threads in grid:
+        runner = ShardedRunner(args.model, texts, workers=workers, threads_per_worker=threads,
+                               batch_size=args.batch_size)
+        # the predictor prints per batch, keep the table readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = runner.run(paths)
+        baseline = baseline or report["images_per_sec"]
+        print(f"{workers:>8} {threads:>8} {report['images_per_sec']:>9.2f} "
+              f"{report['images_per_sec'] / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
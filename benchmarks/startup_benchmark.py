@@ -0,0 +1,74 @@
+"""
+Measure model start-up time: hub/HF-cache load, fast-load copy and warm registry.
+
+Every cold measurement runs in a fresh interpreter so nothing is shared with
+earlier loads in the same process (the OS page cache is still warm).
+
+Run from the repository root:
+    python -m benchmarks.startup_benchmark --models owlv2,owlvit --fast-load-dir model_cache
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from models.model_loader import MODEL_LOADERS, ModelRegistry
+
+CHILD_CODE = """
+import json, time
+start = time.perf_counter()
+from models.model_loader import MODEL_LOADERS
+imported = time.perf_counter()
+MODEL_LOADERS[{name!r}](model_path={path!r})
+loaded = time.perf_counter()
+print(json.dumps({{"import_s": imported - start, "load_s": loaded - imported}}))
+"""
+
+
+def cold_start(name, path, repeats):
+    """Return the best import and load time of `repeats` fresh interpreters"""
+    best = None
+    for _ in range(repeats):
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD_CODE.format(name=name, path=path)],
+            capture_output=True, text=True, check=True
+        )
+        timing = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or timing["load_s"] < best["load_s"]:
+            best = timing
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", default="owlv2,owlvit")
+    parser.add_argument("--fast-load-dir", default="model_cache")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(fast_load_dir=args.fast_load_dir)
+
+    for name in args.models.split(","):
+        if name not in MODEL_LOADERS:
+            raise SystemExit(f"unknown model {name!r}, choose from {sorted(MODEL_LOADERS)}")
+
+        hub = cold_start(name, None, args.repeats)
+
+        # first registry load writes the fast-load copy
+        registry.get(name)
+        fast = cold_start(name, registry.fast_load_path(name), args.repeats)
+
+        start = time.perf_counter()
+        registry.get(name)
+        warm = time.perf_counter() - start
+
+        print(f"---| {name} |---")
+        print(f"  import model stack : {hub['import_s']:.2f} s")
+        print(f"  hub / HF cache load : {hub['load_s']:.2f} s")
+        print(f"  fast-load copy      : {fast['load_s']:.2f} s ({hub['load_s'] / fast['load_s']:.2f}x)")
+        print(f"  warm registry get   : {warm * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Reproducible latency / throughput suite over both models and both detection modes.
+
+`run` times text_based_detection and image_based_detection of OWLv2 and
+OWL-ViT on the sample/ images for every batch size x resolution and writes
+the latency distribution, throughput, peak RSS and per-stage means of each
+case, plus the environment (versions, threads, git commit), to JSON. Every
+case is measured in a fresh process (the model is loaded again), so its peak
+RSS belongs to that case alone.
+
+`compare` matches the cases of two runs and exits 1 when a case got slower
+(p50 latency or throughput) or bigger (peak RSS) beyond --tolerance, so it
+can gate CI.
+
+Nothing is downloaded with --offline (models come from the local hub cache)
+or with --model-dir pointing at local model directories.
+
+Run from the repository root:
+    python -m benchmarks.suite run --out bench/base.json --offline
+    python -m benchmarks.suite run --out bench/new.json --model-dir owlv2=model_cache/owlv2 --models owlv2
+    python -m benchmarks.suite compare bench/base.json bench/new.json --tolerance 0.1
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from PIL import Image
+
+from config.constants import MODEL_NAMES, PRECISION, PRECISIONS
+from utils.image_utils import list_image_paths, load_image_by_path
+from utils.metrics import METRICS
+
+MODES = ("text", "image")
+
+# numbers the image mode's feature store keys, shared by every case so no call finds a cached target
+_target_keys = itertools.count()
+
+
+def resize_long_side(image, long_side):
+    """Scale image so its longer side is long_side pixels"""
+    scale = long_side / max(image.size)
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+
+
+def load_images(sample_dir, resolution, count):
+    """Load `count` images by cycling over sample_dir, at native size or resized to `resolution`"""
+    paths = list_image_paths(sample_dir)
+    if not paths:
+        raise FileNotFoundError(f"No images found in {sample_dir}")
+    images = [load_image_by_path(path) for path in paths]
+    if resolution != "native":
+        images = [resize_long_side(image, int(resolution)) for image in images]
+    return [images[i % len(images)] for i in range(count)]
+
+
+def latency_summary(durations):
+    """Return mean and percentiles in milliseconds of a list of durations in seconds"""
+    durations = sorted(durations)
+
+    def percentile(q):
+        return round(1000 * durations[min(len(durations) - 1, int(q * len(durations)))], 3)
+
+    return {
+        "mean": round(1000 * sum(durations) / len(durations), 3),
+        "p50": percentile(0.50),
+        "p90": percentile(0.90),
+        "p99": percentile(0.99),
+        "min": round(1000 * durations[0], 3),
+        "max": round(1000 * durations[-1], 3),
+    }
+
+
+def detection_call(predictor, mode, images, texts, reference, batch_size):
+    """Return a callable running one detection call over batch_size images; every call sees new targets"""
+    def text_call():
+        batch = images[:batch_size]
+        if batch_size == 1:
+            return [predictor.text_based_detection(batch[0], texts)]
+        return predictor.text_based_detection_batch(batch, texts, batch_size=batch_size)
+
+    def image_call():
+        # fresh keys so the vision tower runs on every call instead of hitting the feature store
+        batch = images[:batch_size]
+        keys = [f"suite-{next(_target_keys)}" for _ in batch]
+        if batch_size > 1:
+            predictor.precompute_target_features(batch, keys)
+        return [predictor.image_based_detection(image, reference, target_key=key) for image, key in zip(batch, keys)]
+
+    return text_call if mode == "text" else image_call
+
+
+def run_case(name, settings, mode, resolution, batch_size):
+    """Load one model and run one case; executed in a fresh process so peak RSS belongs to this case"""
+    import torch
+    from config.constants import DEVICE
+    from models.model_loader import MODEL_LOADERS
+    from models.modelpredictor import ModelPredictor
+
+    if settings["threads"]:
+        torch.set_num_threads(settings["threads"])
+    start = time.perf_counter()
+    model, processor = MODEL_LOADERS[name](model_path=settings["model_dirs"].get(name),
+                                           precision=settings["precision"]).get_components()
+    load_seconds = time.perf_counter() - start
+    predictor = ModelPredictor(model, processor)
+    reference = load_image_by_path(settings["reference"])
+
+    images = load_images(settings["sample_dir"], resolution, batch_size)
+    call = detection_call(predictor, mode, images, settings["texts"], reference, batch_size)
+    for _ in range(settings["warmup"]):
+        call()
+
+    METRICS.reset()
+    durations = []
+    for _ in range(settings["repeats"]):
+        call_start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - call_start)
+
+    stages = METRICS.snapshot()["stages"]
+    case = {
+        "model": name,
+        "mode": mode,
+        "resolution": resolution,
+        "batch_size": batch_size,
+        "calls": len(durations),
+        "latency_ms": latency_summary(durations),
+        "images_per_sec": round(batch_size * len(durations) / sum(durations), 3),
+        "peak_rss_mb": round(METRICS.memory().get("peak_rss_bytes", 0) / 2 ** 20, 1),
+        "stage_mean_ms": {stage: summary["mean_ms"] for stage, summary in stages.items()
+                          if summary["count"]},
+    }
+    print(f"  {case_label(case):<32} p50 {case['latency_ms']['p50']:>9.1f} ms  "
+          f"{case['images_per_sec']:>8.2f} images/sec  peak RSS {case['peak_rss_mb']:.0f} MB")
+
+    return {"load_seconds": round(load_seconds, 3), "device": DEVICE, "threads": torch.get_num_threads(),
+            "case": case}
+
+
+def environment():
+    """Describe the machine and software versions of a run"""
+    import torch
+    import transformers
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def case_key(case):
+    return case["model"], case["mode"], str(case["resolution"]), case["batch_size"]
+
+
+def case_label(case):
+    return f"{case['model']} {case['mode']} {case['resolution']} b{case['batch_size']}"
+
+
+def run(args):
+    if args.offline:
+        # inherited by the model processes, which then only read the local hub cache
+        os.environ["HF_HUB_OFFLINE"] = "1"
+        os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+    if any("=" not in entry for entry in args.model_dir):
+        raise SystemExit("run: --model-dir expects NAME=DIR, e.g. owlv2=model_cache/owlv2")
+    model_dirs = dict(entry.split("=", 1) for entry in args.model_dir)
+    settings = {
+        "texts": [query.strip() for query in args.queries.split(",") if query.strip()],
+        "modes": args.modes.split(","),
+        "resolutions": args.resolutions.split(","),
+        "batch_sizes": [int(size) for size in args.batch_sizes.split(",")],
+        "repeats": args.repeats,
+        "warmup": args.warmup,
+        "precision": args.precision,
+        "threads": args.threads,
+        "model_dirs": model_dirs,
+        "sample_dir": args.sample_dir,
+        "reference": args.reference,
+    }
+    result = {"environment": environment(), "settings": settings, "models": {}, "cases": []}
+
+    context = multiprocessing.get_context("spawn")
+    for name in args.models.split(","):
+        print(f"---| {name} |---")
+        for mode, resolution, batch_size in itertools.product(settings["modes"], settings["resolutions"],
+                                                              settings["batch_sizes"]):
+            # the process high-water mark never goes down, so a case sharing a process with a larger
+            # earlier one would report that case's peak RSS
+            with context.Pool(1) as pool:
+                case_result = pool.apply(run_case, (name, settings, mode, resolution, batch_size))
+            result["cases"].append(case_result.pop("case"))
+            # load time, device and threads of the model's first case
+            result["models"].setdefault(name, case_result)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"---| {len(result['cases'])} cases written to {args.out} |---")
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    for section, fields in (("environment", ("cpu_count", "torch", "transformers", "processor")),
+                            ("settings", ("precision", "threads", "texts"))):
+        for field in fields:
+            before, after = baseline[section].get(field), candidate[section].get(field)
+            if before != after:
+                print(f"  note: {field} differs ({before} -> {after}), timings may not be comparable")
+
+    base_cases = {case_key(case): case for case in baseline["cases"]}
+    regressions = 0
+    print(f"{'case':<32} {'p50 ms':>19} {'images/sec':>19} {'peak RSS MB':>17}")
+    for case in candidate["cases"]:
+        base = base_cases.get(case_key(case))
+        if base is None:
+            print(f"{case_label(case):<32} (new case)")
+            continue
+
+        latency = case["latency_ms"]["p50"] / base["latency_ms"]["p50"] - 1
+        throughput = case["images_per_sec"] / base["images_per_sec"] - 1
+        rss = case["peak_rss_mb"] / base["peak_rss_mb"] - 1 if base["peak_rss_mb"] else 0.0
+        flags = [name for name, regressed in (("latency", latency > args.tolerance),
+                                              ("throughput", throughput < -args.tolerance),
+                                              ("memory", rss > args.rss_tolerance)) if regressed]
+        regressions += bool(flags)
+        print(f"{case_label(case):<32} {base['latency_ms']['p50']:>8.1f} {latency:>+9.1%} "
+              f"{base['images_per_sec']:>8.2f} {throughput:>+9.1%} {base['peak_rss_mb']:>7.0f} {rss:>+8.1%}"
+              f"  {'REGRESSION: ' + ', '.join(flags) if flags else 'ok'}")
+
+    print(f"---| {regressions} regressed case(s), tolerance {args.tolerance:.0%} "
+          f"(memory {args.rss_tolerance:.0%}) |---")
+    sys.exit(1 if regressions else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and write a JSON result")
+    run_parser.add_argument("--out", required=True)
+    run_parser.add_argument("--models", default=",".join(MODEL_NAMES))
+    run_parser.add_argument("--modes", default=",".join(MODES))
+    run_parser.add_argument("--batch-sizes", default="1,4")
+    run_parser.add_argument("--resolutions", default="native,640,1280",
+                            help="long image side in pixels, or native")
+    run_parser.add_argument("--queries", default="coin,box")
+    run_parser.add_argument("--reference", default=os.path.join("sample", "one_coin.jpg"),
+                            help="query crop of the image mode")
+    run_parser.add_argument("--repeats", type=int, default=10, help="timed calls per case")
+    run_parser.add_argument("--warmup", type=int, default=2, help="untimed calls per case")
+    run_parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    run_parser.add_argument("--threads", type=int, help="torch intra-op threads, torch's default if not given")
+    run_parser.add_argument("--model-dir", action="append", default=[], metavar="NAME=DIR",
+                            help="load a model from a local directory, e.g. owlv2=model_cache/owlv2")
+    run_parser.add_argument("--offline", action="store_true", help="only use the local hugging face cache")
+    run_parser.add_argument("--sample-dir", default="sample")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two runs, exit 1 on a regression")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10,
+                                help="allowed relative p50 latency increase / throughput drop")
+    compare_parser.add_argument("--rss-tolerance", type=float, default=0.10, help="allowed relative peak RSS increase")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
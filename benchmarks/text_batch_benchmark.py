@@ -0,0 +1,68 @@
+"""
+Compare single-image text detection against the batched API.
+
+Run from the repository root:
+    python -m benchmarks.text_batch_benchmark --model owlv2 --images 16 --batch-sizes 1,4,8
+"""
+import argparse
+import glob
+import os
+import time
+
+from models.model_loader import MODEL_LOADERS
+from models.modelpredictor import ModelPredictor
+from utils.image_utils import load_image_by_path
+
+
+def load_sample_images(sample_dir, count):
+    """Load `count` images by cycling over the jpgs in sample_dir"""
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.jpg")))
+    if not paths:
+        raise FileNotFoundError(f"No .jpg images found in {sample_dir}")
+    return [load_image_by_path(paths[i % len(paths)]) for i in range(count)]
+
+
+def time_run(fn, repeats):
+    """Return the best wall time of `repeats` calls to fn"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_LOADERS, default="owlv2")
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--batch-sizes", default="1,2,4,8")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    texts = [query.strip() for query in args.queries.split(",") if query.strip()]
+    images = load_sample_images(args.sample_dir, args.images)
+
+    model, processor = MODEL_LOADERS[args.model]().get_components()
+    predictor = ModelPredictor(model, processor)
+
+    # warm up allocator and kernels before timing
+    predictor.text_based_detection(images[0], texts)
+
+    loop_time = time_run(lambda: [predictor.text_based_detection(image, texts) for image in images], args.repeats)
+    print(f"---| single-image loop: {len(images) / loop_time:.2f} images/sec |---")
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        batch_time = time_run(
+            lambda: predictor.text_based_detection_batch(images, texts, batch_size=batch_size), args.repeats
+        )
+        print(
+            f"---| batch_size={batch_size}: {len(images) / batch_time:.2f} images/sec "
+            f"({loop_time / batch_time:.2f}x vs loop) |---"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Threshold / NMS sweep with and without the cached raw outputs.
+
+The sample/ images are detected once with keys, so their image embeddings
+and boxes are kept in the feature store. Every (threshold, NMS IoU) setting
+of the sweep, plus one extra query, is then re-run both as a full forward
+pass and from the cache, and the results are checked to be identical.
+
+Run from the repository root:
+    python -m benchmarks.threshold_sweep_benchmark --model owlv2 --thresholds 0.1,0.2,0.3 --nms 0.3,0.5
+"""
+import argparse
+import contextlib
+import io
+import time
+
+import torch
+
+from models.feature_store import ImageFeatureStore
+from models.model_loader import MODEL_LOADERS, get_model_loader
+from models.modelpredictor import ModelPredictor
+from utils.image_utils import list_image_paths, load_image_by_path
+
+
+def timed(fn):
+    """Run fn with its progress prints silenced; return (result, seconds)"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = fn()
+    return result, time.perf_counter() - start
+
+
+def same_detections(first, second):
+    return all(
+        len(a_boxes) == len(b_boxes) and torch.allclose(a_boxes, b_boxes, atol=1e-3) and a_labels == b_labels
+        for (a_boxes, _, a_labels), (b_boxes, _, b_labels) in zip(first, second)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_LOADERS, default="owlv2")
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--extra-query", default="bottle")
+    parser.add_argument("--thresholds", default="0.1,0.2,0.3,0.4")
+    parser.add_argument("--nms", default="0.3,0.5,1.0")
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    texts = args.queries.split(",")
+    paths = list_image_paths(args.sample_dir)
+    images = [load_image_by_path(path) for path in paths]
+    sizes = [image.size for image in images]
+
+    model, processor = get_model_loader(args.model).get_components()
+    # every image (feature map + boxes) must fit in memory
+    predictor = ModelPredictor(model, processor, feature_store=ImageFeatureStore(max_items=len(paths)))
+    _, first_pass = timed(lambda: predictor.text_based_detection_batch(images, texts, keys=paths))
+
+    settings = [(float(threshold), float(nms)) for threshold in args.thresholds.split(",")
+                for nms in args.nms.split(",")]
+    runs = [(threshold, nms, texts) for threshold, nms in settings]
+    runs.append((settings[0][0], settings[0][1], texts + [args.extra_query]))
+
+    full_total = cached_total = 0.0
+    identical = True
+    for threshold, nms, queries in runs:
+        full, full_time = timed(lambda: predictor.text_based_detection_batch(
+            images, queries, threshold=threshold, nms_threshold=nms))
+        cached, cached_time = timed(lambda: predictor.text_based_detection_from_cache(
+            paths, sizes, queries, threshold=threshold, nms_threshold=nms))
+        full_total += full_time
+        cached_total += cached_time
+        identical &= same_detections(full, cached)
+
+    print(f"---| {args.model}: {len(runs)} settings x {len(paths)} images |---")
+    print(f"  first pass (caching)  : {first_pass * 1000:9.1f} ms")
+    print(f"  sweep, full forward   : {full_total * 1000:9.1f} ms")
+    print(f"  sweep, cached outputs : {cached_total * 1000:9.1f} ms ({full_total / cached_total:.1f}x)")
+    print(f"  identical detections  : {identical}")
+
+
+if __name__ == "__main__":
+    main()
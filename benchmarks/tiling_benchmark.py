@@ -0,0 +1,80 @@
+"""
+Cost of tiled detection relative to single full-image passes.
+
+A large image is built by tiling the sample/ images side by side, then
+tiled_text_based_detection is timed against `tile count` separate
+single-image passes.
+
+Run from the repository root:
+    python -m benchmarks.tiling_benchmark --model owlv2 --width 3840 --height 2160
+"""
+import argparse
+import time
+
+from PIL import Image
+
+from models.model_loader import MODEL_LOADERS, get_model_loader
+from models.modelpredictor import ModelPredictor, tile_offsets
+from utils.image_utils import list_image_paths, load_image_by_path
+
+
+def build_mosaic(sample_dir, width, height, cell):
+    """Paste sample images into a width x height mosaic of cell x cell squares"""
+    samples = [load_image_by_path(path).resize((cell, cell)) for path in list_image_paths(sample_dir)]
+    mosaic = Image.new("RGB", (width, height))
+    index = 0
+    for top in range(0, height, cell):
+        for left in range(0, width, cell):
+            mosaic.paste(samples[index % len(samples)], (left, top))
+            index += 1
+    return mosaic
+
+
+def best_time(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", choices=MODEL_LOADERS, default="owlv2")
+    parser.add_argument("--queries", default="coin,box")
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--tile-size", type=int, default=960)
+    parser.add_argument("--overlap", type=int, default=160)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sample-dir", default="sample")
+    args = parser.parse_args()
+
+    texts = args.queries.split(",")
+    image = build_mosaic(args.sample_dir, args.width, args.height, cell=args.tile_size // 4)
+    tile_count = (len(tile_offsets(args.width, args.tile_size, args.overlap))
+                  * len(tile_offsets(args.height, args.tile_size, args.overlap)) + 1)
+
+    model, processor = get_model_loader(args.model).get_components()
+    predictor = ModelPredictor(model, processor)
+    tile = image.crop((0, 0, args.tile_size, args.tile_size))
+    predictor.text_based_detection(tile, texts)  # warm-up
+
+    single = best_time(lambda: predictor.text_based_detection(tile, texts), args.repeats)
+    tiled = best_time(
+        lambda: predictor.tiled_text_based_detection(image, texts, tile_size=args.tile_size, overlap=args.overlap),
+        args.repeats
+    )
+    boxes, _, _ = predictor.tiled_text_based_detection(image, texts, tile_size=args.tile_size, overlap=args.overlap)
+    full_boxes, _, _ = predictor.text_based_detection(image, texts)
+
+    print(f"---| {args.model}: {args.width}x{args.height}, {tile_count} tiles incl. full image |---")
+    print(f"  single pass       : {single * 1000:.1f} ms")
+    print(f"  tiled             : {tiled * 1000:.1f} ms = {tiled / single:.2f} single passes "
+          f"({tiled / (single * tile_count):.2f}x of tile count)")
+    print(f"  detections        : {len(boxes)} tiled vs {len(full_boxes)} full image")
+
+
+if __name__ == "__main__":
+    main()
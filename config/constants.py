@@ -1,14 +1,86 @@
-import torch
-
 # MODEL NAME
 OWL_V2 = "google/owlv2-base-patch16-ensemble"
 OWL_VIT = "google/owlvit-base-patch32"
 
+MODEL_NAMES = ("owlv2", "owlvit")  # Names accepted by the model loaders / --model
+PRECISIONS = ("fp32", "bf16", "int8")  # Supported inference precision modes
+
+# Model loading
+FAST_LOAD_DIR = None  # e.g. "model_cache" to keep safetensors copies for fast worker start
+
 # Model configuration
 TEXT_BASED_SCORE_THRESHOLD = 0.3  # Minimum confidence score
 IMAGE_BASED_SCORE_THRESHOLD = 0.6  # Minimum confidence score
 NMS_THRESHOLD = 0.5  # Non-Maximum Suppression threshold
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+TOP_K = 300  # Maximum detections kept per image
+# DEVICE ("cuda" when available, else "cpu") is resolved on first use, see __getattr__ below
+PRECISION = "fp32"  # "fp32", "bf16" (autocast) or "int8" (dynamic quantization, CPU only)
+
+# Batched inference
+BATCH_SIZE = 4  # Images stacked into a single forward pass
+
+# Preprocessing
+FAST_PREPROCESS = True  # Resize / normalize with torch instead of the HF image processor (same pixel_values)
+
+# Memory budget (--memory-budget)
+MEMORY_BUDGET_MB = None  # e.g. 7000 on an 8 GB worker; caps batch size and images in flight, None = unbounded
+MEMORY_ACTIVATION_SHARE = 0.5  # Share of the headroom above the loaded model given to forward-pass activations
+
+# Tiled detection for high-resolution images
+TILE_SIZE = 960  # Tile edge in pixels (OWLv2 input size)
+TILE_OVERLAP = 160  # Pixels shared by neighbouring tiles
+
+# Video detection
+VIDEO_STRIDE = 1  # Run the model at most every N frames
+VIDEO_SCENE_THRESHOLD = 2.0  # Mean abs grayscale change (0-255) needed to re-run the model
+VIDEO_QUEUE_DEPTH = 32  # Decoded frames buffered ahead of the detector
+
+# Text query embedding cache
+QUERY_CACHE_SIZE = 1024  # Maximum cached query embeddings
+QUERY_CACHE_PATH = None  # e.g. "cache/query_embeddings.pt" to persist across runs
+
+# Target image feature store for image-guided detection
+FEATURE_STORE_SIZE = 32  # Images whose feature map and boxes are kept in memory (~11 MB each for OWLv2)
+FEATURE_STORE_DIR = None  # e.g. "cache/features" to keep memory-mapped .npy shards
+
+# Gallery search: image-guided queries over many indexed images
+GALLERY_BOXES_PER_IMAGE = 64  # Box embeddings kept per indexed image, the most object-like ones
+GALLERY_IVF_LISTS = 256  # Inverted lists (k-means centroids) built by `gallery add --train`
+GALLERY_NPROBE = 16  # Lists scanned per query once trained; more is slower and closer to exhaustive
+GALLERY_TOP_K = 10  # Images returned per query
+
+# ONNX export / ONNX Runtime backend
+ONNX_OPSET = 17  # Opset of the exported graphs
+BACKENDS = ("torch", "onnx")  # Eager PyTorch or ONNX Runtime (CPU) for the towers and heads
+
+# Multi-process runner
+SHARD_WORKERS = 1  # Worker processes, each with its own resident model (1 = single process pipeline)
+
+# Metrics / profiling
+METRICS_WINDOW = 10000  # Latest calls per stage kept for the latency percentiles
+PROFILE_REQUESTS = 5  # Detection requests captured by a torch.profiler trace (--profile-dir)
+
+# Rendering
+JPEG_QUALITY = 90  # Quality of saved annotated JPEGs (1-95)
+
+# Streaming pipeline
+PIPELINE_DECODE_WORKERS = 4  # Threads decoding / preprocessing images
+PIPELINE_RENDER_WORKERS = 2  # Threads annotating / saving results
+PIPELINE_QUEUE_DEPTH = 16  # Images allowed to wait between two stages
+
+# Inference server
+SERVER_MAX_BATCH_SIZE = 8  # Requests merged into one model call
+SERVER_BATCH_WINDOW_MS = 20  # How long the first request waits for others to join its batch
+
+
 
 
 
+def __getattr__(name):
+    """Resolve DEVICE on first use, so reading the other settings never imports torch"""
+    if name == "DEVICE":
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        globals()["DEVICE"] = device
+        return device
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
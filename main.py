@@ -1,4 +1,3 @@
-from models.model_task import detection_by_image, detection_by_text
 from utils.visualization import plot_detection, display_result
 
 def chose_task():
@@ -9,9 +8,12 @@ def chose_task():
             match user_input:
                 case 1:
                     print("-->DETECTION USING TEXT<--")
+                    # torch / transformers load only once a task is picked
+                    from models.model_task import detection_by_text
                     return detection_by_text
                 case 2:
                     print("-->DETECTION USING IMAGE<--")
+                    from models.model_task import detection_by_image
                     return detection_by_image
                 case _:
                     print("Invalid choice. Please select 1 or 2.")
@@ -26,7 +28,8 @@ def main():
     
     image, boxes, scores, labels = task()
     
-    final_result_img = plot_detection(image, boxes, scores, labels)
+    # the detected image is not used again, annotate it without a full-resolution copy
+    final_result_img = plot_detection(image, boxes, scores, labels, in_place=True)
     
     display_result(final_result_img)
     
@@ -0,0 +1,172 @@
+import copy
+import json
+import os
+
+import torch
+from config.constants import ONNX_OPSET
+from models.model_loader import inference_context
+
+# graph file -> (input names, output names, dynamic axes)
+ONNX_GRAPHS = {
+    "image_encoder.onnx": (["pixel_values"], ["feature_map"],
+                           {"pixel_values": {0: "batch"}, "feature_map": {0: "batch"}}),
+    "text_encoder.onnx": (["input_ids", "attention_mask"], ["text_embeds"],
+                          {"input_ids": {0: "queries", 1: "tokens"}, "attention_mask": {0: "queries", 1: "tokens"},
+                           "text_embeds": {0: "queries"}}),
+    "box_head.onnx": (["feature_map"], ["pred_boxes"],
+                      {"feature_map": {0: "batch"}, "pred_boxes": {0: "batch"}}),
+    "class_head.onnx": (["feature_map", "query_embeds"], ["logits"],
+                        {"feature_map": {0: "batch"}, "query_embeds": {0: "batch", 1: "queries"},
+                         "logits": {0: "batch", 2: "queries"}}),
+}
+
+
+def flatten_feature_map(feature_map):
+    """Reshape a (batch, patches_h, patches_w, hidden_dim) feature map into (batch, patches, hidden_dim)"""
+    num_images, num_patches_height, num_patches_width, hidden_dim = feature_map.shape
+    return feature_map.reshape(num_images, num_patches_height * num_patches_width, hidden_dim)
+
+
+class TorchBackend:
+    """
+    Run the OWL towers and heads as eager PyTorch modules
+
+    Every call runs under no_grad and the model's precision context.
+    """
+    name = "torch"
+
+    def __init__(self, model):
+        self.model = model
+        self.precision = getattr(model, "inference_precision", "fp32")
+
+    def image_features(self, pixel_values):
+        """(batch, 3, H, W) pixel values -> (batch, patches_h, patches_w, hidden_dim) feature map"""
+        with torch.no_grad(), inference_context(self.precision):
+            return self.model.image_embedder(pixel_values=pixel_values)[0]
+
+    def text_features(self, input_ids, attention_mask):
+        """Tokenized queries -> (queries, embed_dim) query embeddings"""
+        with torch.no_grad(), inference_context(self.precision):
+            return self.model.base_model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+    def box_predictions(self, feature_map):
+        """Feature map -> (batch, num_boxes, 4) normalized (center_x, center_y, width, height) boxes"""
+        with torch.no_grad(), inference_context(self.precision):
+            return self.model.box_predictor(flatten_feature_map(feature_map), feature_map)
+
+    def class_logits(self, feature_map, query_embeds):
+        """Feature map and (batch, queries, embed_dim) query embeddings -> (batch, num_boxes, queries) logits"""
+        with torch.no_grad(), inference_context(self.precision):
+            return self.model.class_predictor(flatten_feature_map(feature_map), query_embeds)[0]
+
+
+class OnnxRuntimeBackend:
+    """
+    Run the graphs written by export_onnx with ONNX Runtime on CPU
+
+    Inputs and outputs are torch tensors, so the predictor does not care
+    which backend it talks to. Image-guided query embedding (embed_image_query)
+    has data-dependent box selection and stays on the eager model.
+    """
+    name = "onnx"
+
+    def __init__(self, onnx_dir, num_threads=None):
+        """
+        Args:
+            onnx_dir: Directory written by export_onnx
+            num_threads: ONNX Runtime intra-op threads, torch.get_num_threads() if None
+        """
+        try:
+            import onnxruntime
+        except ImportError as error:
+            raise ImportError("the onnx backend needs onnxruntime: pip install onnxruntime") from error
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+
+        self.onnx_dir = onnx_dir
+        self.sessions = {
+            name: onnxruntime.InferenceSession(os.path.join(onnx_dir, name), options,
+                                               providers=["CPUExecutionProvider"])
+            for name in ONNX_GRAPHS
+        }
+
+    def _run(self, name, **inputs):
+        feeds = {key: value.detach().cpu().numpy() for key, value in inputs.items()}
+        return torch.from_numpy(self.sessions[name].run(None, feeds)[0])
+
+    def image_features(self, pixel_values):
+        return self._run("image_encoder.onnx", pixel_values=pixel_values.float())
+
+    def text_features(self, input_ids, attention_mask):
+        return self._run("text_encoder.onnx", input_ids=input_ids.long(), attention_mask=attention_mask.long())
+
+    def box_predictions(self, feature_map):
+        return self._run("box_head.onnx", feature_map=feature_map.float())
+
+    def class_logits(self, feature_map, query_embeds):
+        return self._run("class_head.onnx", feature_map=feature_map.float(), query_embeds=query_embeds.float())
+
+
+class _GraphModule(torch.nn.Module):
+    """Expose one TorchBackend method as a module forward for the exporter"""
+    def __init__(self, model, method):
+        super().__init__()
+        self.model = model
+        self.method = method
+
+    def forward(self, *inputs):
+        return getattr(TorchBackend(self.model), self.method)(*inputs)
+
+
+def export_onnx(model, processor, onnx_dir, opset=ONNX_OPSET):
+    """
+    Export the image encoder, text encoder, box head and class head as separate ONNX graphs
+
+    A CPU copy of the model is traced, the caller's (possibly resident, GPU) model is left untouched.
+
+    Args:
+        model: fp32 OWL model (Owlv2ForObjectDetection or OwlViTForObjectDetection)
+        processor: Matching processor, used to build example inputs
+        onnx_dir: Output directory
+        opset: ONNX opset version
+
+    Returns:
+        List of written graph paths
+    """
+    if getattr(model, "inference_precision", "fp32") != "fp32":
+        raise ValueError("export an fp32 model, ONNX Runtime applies its own graph optimizations")
+    model = copy.deepcopy(model).float().cpu().eval()
+    os.makedirs(onnx_dir, exist_ok=True)
+
+    size = processor.image_processor.size
+    height, width = (size["height"], size["width"]) if "height" in size else (size["shortest_edge"],) * 2
+    pixel_values = torch.zeros(2, 3, height, width)
+    text_inputs = processor(text=["a photo of a cat", "a dog"], return_tensors="pt")
+    with torch.no_grad():
+        feature_map = TorchBackend(model).image_features(pixel_values)
+        query_embeds = TorchBackend(model).text_features(text_inputs["input_ids"], text_inputs["attention_mask"])
+    query_embeds = query_embeds.unsqueeze(0).expand(len(feature_map), -1, -1).contiguous()
+
+    examples = {
+        "image_encoder.onnx": ("image_features", (pixel_values,)),
+        "text_encoder.onnx": ("text_features", (text_inputs["input_ids"], text_inputs["attention_mask"])),
+        "box_head.onnx": ("box_predictions", (feature_map,)),
+        "class_head.onnx": ("class_logits", (feature_map, query_embeds)),
+    }
+
+    paths = []
+    for name, (input_names, output_names, dynamic_axes) in ONNX_GRAPHS.items():
+        method, inputs = examples[name]
+        path = os.path.join(onnx_dir, name)
+        torch.onnx.export(
+            _GraphModule(model, method), inputs, path,
+            input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes,
+            opset_version=opset, dynamo=False,
+        )
+        paths.append(path)
+
+    with open(os.path.join(onnx_dir, "export.json"), "w", encoding="utf-8") as f:
+        json.dump({"model": model.config.name_or_path, "opset": opset, "graphs": list(ONNX_GRAPHS)}, f, indent=2)
+    return paths
@@ -0,0 +1,113 @@
+import hashlib
+import os
+import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import torch
+from config.constants import FEATURE_STORE_SIZE
+from utils.metrics import METRICS
+
+
+class ImageFeatureStore:
+    """
+    Store of image feature maps produced by the vision tower
+
+    Feature maps are kept in an in-memory LRU and, when store_dir is set,
+    written as one .npy shard per image. Shards are memory-mapped on load,
+    so re-opening a large gallery costs page-ins instead of recomputation.
+    The LRU counts images: the tensors stored for one key under several
+    namespaces (a feature map and its predicted boxes) share one slot and
+    are evicted together. Lookups are also counted in METRICS as
+    feature_store_hits / feature_store_misses.
+    """
+    def __init__(self, max_items=FEATURE_STORE_SIZE, store_dir=None):
+        """
+        Args:
+            max_items: Maximum number of images whose tensors are kept in memory
+            store_dir: Optional directory for memory-mapped .npy shards
+        """
+        self.max_items = max_items
+        self.store_dir = store_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+    @staticmethod
+    def image_key(image):
+        """Return a content hash identifying a PIL image"""
+        digest = hashlib.sha1()
+        digest.update(f"{image.mode}{image.size}".encode())
+        digest.update(image.tobytes())
+        return digest.hexdigest()
+
+    def _shard_path(self, model_name, key):
+        name = hashlib.sha1(f"{model_name}\0{key}".encode()).hexdigest()
+        return os.path.join(self.store_dir, f"{name}.npy")
+
+    def get(self, model_name, key):
+        """Return the cached feature map for key, or None on a miss"""
+        with self._lock:
+            feature_map = self._entries.get(key, {}).get(model_name)
+            if feature_map is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if feature_map is not None:
+            METRICS.count("feature_store_hits")
+            return feature_map
+
+        if self.store_dir:
+            path = self._shard_path(model_name, key)
+            if os.path.exists(path):
+                # read-only memmap, the tensor is never written to
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore", UserWarning)
+                    feature_map = torch.from_numpy(np.load(path, mmap_mode="r"))
+                self._remember(model_name, key, feature_map)
+                with self._lock:
+                    self.hits += 1
+                METRICS.count("feature_store_hits")
+                return feature_map
+
+        with self._lock:
+            self.misses += 1
+        METRICS.count("feature_store_misses")
+        return None
+
+    def put(self, model_name, key, feature_map):
+        """Store a (num_patches_height, num_patches_width, hidden_dim) feature map"""
+        # a copy with its own storage: a view into a batch tensor would keep the whole batch alive
+        feature_map = feature_map.detach().to("cpu", copy=True)
+
+        if self.store_dir:
+            path = self._shard_path(model_name, key)
+            # unique per writer, threads may store the same key at once
+            with tempfile.NamedTemporaryFile(dir=self.store_dir, suffix=".tmp", delete=False) as f:
+                np.save(f, feature_map.float().numpy())
+            os.replace(f.name, path)
+
+        self._remember(model_name, key, feature_map)
+
+    def _remember(self, model_name, key, feature_map):
+        with self._lock:
+            self._entries.setdefault(key, {})[model_name] = feature_map
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,284 @@
+import json
+import os
+
+import numpy as np
+import torch
+from config.constants import GALLERY_IVF_LISTS, GALLERY_NPROBE
+
+# array files of a saved gallery, written before INDEX_FILE
+ARRAYS = ("vectors", "boxes", "row_image", "alive", "assignments")
+INDEX_FILE = "gallery.json"
+SCORE_CHUNK = 65536  # rows converted to float32 and scored per matmul
+
+
+class GalleryIndex:
+    """
+    Searchable store of the per-box OWL class embeddings of many images
+
+    Every indexed image contributes its most object-like boxes, one row each:
+    a float16 vector folding the class head's normalized box embedding, logit
+    shift and logit scale together, so the logit of a box for a reference
+    query q is exactly the inner product with [q / |q|, 1] (see
+    ModelPredictor.gallery_vectors). The backbone never runs on the gallery
+    at query time.
+
+    Search scores every row until train() clusters the rows into IVF lists
+    (spherical k-means on the box embeddings); after that only the nprobe
+    lists closest to the query are scored. Images are added and removed
+    incrementally: removal marks rows dead, and they are dropped once they
+    make up half the index.
+    """
+    def __init__(self, model_name, nprobe=GALLERY_NPROBE):
+        """
+        Args:
+            model_name: ModelPredictor.model_name of the predictor filling the gallery
+            nprobe: IVF lists scanned per query once trained
+        """
+        self.model_name = model_name
+        self.nprobe = nprobe
+        self.rows = 0
+        self.centroids = None
+        # slot -> {"key", "size", "start", "count"}, None once removed
+        self.images = []
+        self._slots = {}
+        self._arrays = None
+        self._lists = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def keys(self):
+        """Return the keys of every indexed image"""
+        return list(self._slots)
+
+    def _array(self, name):
+        return self._arrays[name][:self.rows]
+
+    def _reserve(self, rows, dim):
+        """Grow the row arrays (doubling) so that rows more rows fit"""
+        if self._arrays is None:
+            self._arrays = {
+                "vectors": np.zeros((0, dim), np.float16),
+                "boxes": np.zeros((0, 4), np.float32),
+                "row_image": np.zeros(0, np.int32),
+                "alive": np.zeros(0, bool),
+                "assignments": np.zeros(0, np.int32),
+            }
+        elif dim != self._arrays["vectors"].shape[1]:
+            raise ValueError(f"gallery vectors have {self._arrays['vectors'].shape[1]} dimensions, got {dim}")
+
+        capacity = len(self._arrays["alive"])
+        if self.rows + rows <= capacity:
+            return
+        capacity = max(self.rows + rows, 2 * capacity, 1024)
+        for name, array in self._arrays.items():
+            grown = np.zeros((capacity, *array.shape[1:]), array.dtype)
+            grown[:self.rows] = array[:self.rows]
+            self._arrays[name] = grown
+
+    def add(self, key, vectors, boxes, image_size):
+        """
+        Index the boxes of one image, replacing an earlier entry with the same key
+
+        Args:
+            key: Image key returned by search, usually its path
+            vectors: (num_boxes, embed_dim + 1) gallery vectors
+            boxes: (num_boxes, 4) normalized (center_x, center_y, width, height) boxes
+            image_size: Original (width, height) of the image
+        """
+        if key in self._slots:
+            self.remove(key)
+        vectors = torch.as_tensor(vectors).detach().cpu().numpy()
+        boxes = torch.as_tensor(boxes).detach().cpu().numpy()
+        self._reserve(len(vectors), vectors.shape[1])
+
+        rows = slice(self.rows, self.rows + len(vectors))
+        self._arrays["vectors"][rows] = vectors
+        self._arrays["boxes"][rows] = boxes
+        self._arrays["row_image"][rows] = len(self.images)
+        self._arrays["alive"][rows] = True
+        self._arrays["assignments"][rows] = self._assign(vectors) if self.centroids is not None else 0
+
+        self._slots[key] = len(self.images)
+        self.images.append({"key": key, "size": list(image_size), "start": self.rows, "count": len(vectors)})
+        self.rows += len(vectors)
+        self._lists = None
+
+    def remove(self, key):
+        """Drop an image from the index; raises KeyError if it is not indexed"""
+        slot = self._slots.pop(key)
+        image, self.images[slot] = self.images[slot], None
+        self._arrays["alive"][image["start"]:image["start"] + image["count"]] = False
+        self._lists = None
+
+        if 2 * int(self._array("alive").sum()) < self.rows:
+            self.compact()
+
+    def compact(self):
+        """Drop the rows of removed images"""
+        live = [image for image in self.images if image is not None]
+        order = np.concatenate([np.arange(image["start"], image["start"] + image["count"]) for image in live]
+                               or [np.zeros(0, np.int64)])
+        for name, array in self._arrays.items():
+            self._arrays[name] = array[order]
+
+        start = 0
+        for slot, image in enumerate(live):
+            image["start"] = start
+            start += image["count"]
+            self._arrays["row_image"][image["start"]:start] = slot
+        self.images = live
+        self._slots = {image["key"]: slot for slot, image in enumerate(live)}
+        self.rows = start
+        self._lists = None
+
+    def _directions(self, vectors):
+        """Unit-length box embeddings of gallery vectors, the logit scale and shift removed"""
+        directions = torch.from_numpy(np.ascontiguousarray(vectors[:, :-1])).float()
+        return directions / (torch.linalg.norm(directions, dim=-1, keepdim=True) + 1e-6)
+
+    def _assign(self, vectors):
+        """Return the IVF list of every vector"""
+        centroids = torch.from_numpy(self.centroids)
+        assignments = [
+            (self._directions(vectors[start:start + SCORE_CHUNK]) @ centroids.T).argmax(dim=1)
+            for start in range(0, len(vectors), SCORE_CHUNK)
+        ]
+        return torch.cat(assignments).numpy() if assignments else np.zeros(0, np.int32)
+
+    def train(self, lists=GALLERY_IVF_LISTS, iterations=10, sample_per_list=256, seed=0):
+        """
+        Cluster the indexed rows into IVF lists with spherical k-means
+
+        Rows added later are assigned to the existing lists; train again
+        after the gallery has grown or changed a lot.
+
+        Args:
+            lists: Number of lists (centroids), capped at the number of sampled rows
+            iterations: k-means iterations
+            sample_per_list: Rows sampled per list to fit the centroids
+            seed: Seed of the sampling and initialization
+        """
+        live = np.flatnonzero(self._array("alive"))
+        if not len(live):
+            raise ValueError("cannot train an empty gallery")
+        generator = np.random.default_rng(seed)
+        sample = np.sort(generator.choice(live, min(len(live), lists * sample_per_list), replace=False))
+        directions = self._directions(self._arrays["vectors"][sample])
+        lists = min(lists, len(sample))
+
+        centroids = directions[generator.choice(len(sample), lists, replace=False)]
+        for _ in range(iterations):
+            assignments = (directions @ centroids.T).argmax(dim=1)
+            sums = torch.zeros_like(centroids).index_add_(0, assignments, directions)
+            counts = torch.bincount(assignments, minlength=lists)
+            # an empty list restarts from a random sampled row
+            empty = counts == 0
+            sums[empty] = directions[generator.choice(len(sample), int(empty.sum()))]
+            centroids = sums / (torch.linalg.norm(sums, dim=-1, keepdim=True) + 1e-6)
+
+        self.centroids = centroids.numpy()
+        self._arrays["assignments"][:self.rows] = self._assign(self._array("vectors"))
+        self._lists = None
+
+    def _candidate_rows(self, query, nprobe):
+        """Return the live rows to score: all of them, or those of the nprobe lists closest to query"""
+        if self.centroids is None or nprobe >= len(self.centroids):
+            return np.flatnonzero(self._array("alive"))
+
+        if self._lists is None:
+            # live rows grouped by list, rebuilt after the index changed
+            live = np.flatnonzero(self._array("alive"))
+            assignments = self._array("assignments")[live]
+            order = np.argsort(assignments, kind="stable")
+            counts = np.bincount(assignments, minlength=len(self.centroids))
+            self._lists = np.split(live[order], np.cumsum(counts)[:-1])
+
+        direction = query[:-1] / (torch.linalg.norm(query[:-1]) + 1e-6)
+        probes = (torch.from_numpy(self.centroids) @ direction).topk(nprobe).indices.tolist()
+        return np.sort(np.concatenate([self._lists[probe] for probe in probes]))
+
+    def search(self, query, top_k, nprobe=None):
+        """
+        Return the top_k images with the highest scoring box for a query
+
+        Args:
+            query: (embed_dim + 1,) query vector [q / |q|, 1]
+            top_k: Maximum number of images returned
+            nprobe: IVF lists scanned, self.nprobe if None; ignored until train() ran
+
+        Returns:
+            List of (key, (width, height), logits, boxes) per image, best image first;
+            logits (N,) and normalized boxes (N, 4) of the image's scored rows
+        """
+        if not len(self):
+            return []
+        query = torch.as_tensor(query, dtype=torch.float32)
+        rows = self._candidate_rows(query, self.nprobe if nprobe is None else nprobe)
+
+        logits = torch.empty(len(rows))
+        for start in range(0, len(rows), SCORE_CHUNK):
+            chunk = rows[start:start + SCORE_CHUNK]
+            logits[start:start + len(chunk)] = torch.from_numpy(self._arrays["vectors"][chunk]).float() @ query
+
+        # best logit of every image among the scored rows
+        row_image = torch.from_numpy(self._arrays["row_image"][rows]).long()
+        best = torch.full((len(self.images),), -torch.inf).scatter_reduce_(0, row_image, logits, "amax")
+        top = best.topk(min(top_k, len(self))).indices
+        top = top[best[top] > -torch.inf].tolist()
+
+        boxes = self._arrays["boxes"][rows]
+        matches = []
+        for slot in top:
+            selected = (row_image == slot).numpy()
+            image = self.images[slot]
+            matches.append((image["key"], tuple(image["size"]), logits[selected], torch.from_numpy(boxes[selected])))
+        return matches
+
+    def stats(self):
+        """Return the size of the index for monitoring"""
+        live_rows = int(self._array("alive").sum()) if self._arrays is not None else 0
+        return {
+            "images": len(self),
+            "rows": live_rows,
+            "dead_rows": self.rows - live_rows,
+            "lists": 0 if self.centroids is None else len(self.centroids),
+            "vector_bytes": live_rows * (self._arrays["vectors"].shape[1] * 2 if self._arrays is not None else 0),
+        }
+
+    def save(self, directory):
+        """Write the index to directory; the description file is replaced last"""
+        os.makedirs(directory, exist_ok=True)
+        if self._arrays is not None:
+            if not self._array("alive").all():
+                self.compact()
+            for name in ARRAYS:
+                np.save(os.path.join(directory, f"{name}.npy"), self._array(name))
+        if self.centroids is not None:
+            np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+
+        description = {"model_name": self.model_name, "nprobe": self.nprobe, "rows": self.rows,
+                       "trained": self.centroids is not None, "images": self.images}
+        tmp_path = os.path.join(directory, f"{INDEX_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(description, f)
+        os.replace(tmp_path, os.path.join(directory, INDEX_FILE))
+
+    @classmethod
+    def load(cls, directory):
+        """Read an index written by save"""
+        with open(os.path.join(directory, INDEX_FILE), encoding="utf-8") as f:
+            description = json.load(f)
+
+        gallery = cls(description["model_name"], nprobe=description["nprobe"])
+        gallery.images = description["images"]
+        gallery._slots = {image["key"]: slot for slot, image in enumerate(gallery.images)}
+        gallery.rows = description["rows"]
+        if gallery.rows:
+            gallery._arrays = {name: np.load(os.path.join(directory, f"{name}.npy")) for name in ARRAYS}
+        if description["trained"]:
+            gallery.centroids = np.load(os.path.join(directory, "centroids.npy"))
+        return gallery
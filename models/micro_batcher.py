@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import torch
+from config.constants import SERVER_MAX_BATCH_SIZE, SERVER_BATCH_WINDOW_MS
+from utils.metrics import StageStats
+
+
+class _Request:
+    """One pending detection request"""
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload
+        self.future = Future()
+        self.submitted_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collect concurrent detection requests into micro-batches for one ModelPredictor
+
+    Callers block in detect_text / detect_image while a single worker thread
+    drains the request queue: the first request waits at most max_wait_ms for
+    others to arrive, then text requests sharing the same queries run as one
+    forward pass and image-guided requests have their missing target
+    features and reference crops encoded as one batch each.
+    """
+    def __init__(self, predictor, max_batch_size=SERVER_MAX_BATCH_SIZE, max_wait_ms=SERVER_BATCH_WINDOW_MS):
+        """
+        Args:
+            predictor: ModelPredictor shared by every request
+            max_batch_size: Maximum requests merged into one batch
+            max_wait_ms: Batching window opened by the first request of a batch
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self.stats = {name: StageStats(name) for name in ("queue_wait", "inference", "latency")}
+        self.batch_sizes = Counter()
+        self._requests = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def detect_text(self, image, texts):
+        """Run text-based detection on one image; returns (boxes, scores, labels)"""
+        # preprocessing runs on the caller's thread, in parallel with other requests
+        pixel_values = self.predictor.preprocess_images([image])
+        return self._submit("text", (pixel_values, image.size, tuple(texts)))
+
+    def detect_image(self, target_image, source_image):
+        """Run image-guided detection of source_image in target_image; returns (boxes, scores, labels)"""
+        key = self.predictor.feature_store.image_key(target_image)
+        return self._submit("image", (target_image, source_image, key))
+
+    def _submit(self, kind, payload):
+        request = _Request(kind, payload)
+        self._requests.put(request)
+        result = request.future.result()
+        self.stats["latency"].record(time.perf_counter() - request.submitted_at)
+        return result
+
+    def _next_batch(self):
+        """Block for one request, then collect others until the window closes or the batch is full"""
+        batch = [self._requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            for request in batch:
+                self.stats["queue_wait"].record(started - request.submitted_at)
+            with self._stats_lock:
+                self.batch_sizes[len(batch)] += 1
+
+            groups = {}
+            for request in batch:
+                if request.kind == "text":
+                    groups.setdefault(request.payload[2], []).append(request)
+            image_requests = [request for request in batch if request.kind == "image"]
+
+            for texts, requests in groups.items():
+                self._run(requests, self._detect_text_group, list(texts))
+            if image_requests:
+                self._run(image_requests, self._detect_image_group)
+
+            self.stats["inference"].record(time.perf_counter() - started)
+
+    @staticmethod
+    def _run(requests, fn, *args):
+        """Run fn for a group of requests and resolve their futures"""
+        try:
+            results = fn(requests, *args)
+        except Exception as error:
+            for request in requests:
+                request.future.set_exception(error)
+            return
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def _detect_text_group(self, requests, texts):
+        return self.predictor.text_based_detection_from_pixels(
+            torch.cat([request.payload[0] for request in requests]),
+            [request.payload[1] for request in requests],
+            texts
+        )
+
+    def _detect_image_group(self, requests):
+        store = self.predictor.feature_store
+        model_name = self.predictor.model_name
+
+        # encode all targets missing from the feature store in one batch
+        missing = {}
+        for request in requests:
+            target_image, _, key = request.payload
+            if key not in missing and store.get(model_name, key) is None:
+                missing[key] = target_image
+        if missing:
+            self.predictor.precompute_target_features(list(missing.values()), list(missing.keys()))
+
+        # all reference crops missing from the query cache go through the vision tower as one batch
+        query_embeds = self.predictor.reference_embeddings([request.payload[1] for request in requests])
+
+        return [
+            self.predictor.image_based_detection(target_image, source_image, target_key=key,
+                                                 query_embedding=query_embedding)
+            for (target_image, source_image, key), query_embedding in zip(
+                (request.payload for request in requests), query_embeds)
+        ]
+
+    def report(self):
+        """Return queue wait, batch size distribution and latency percentiles"""
+        with self._stats_lock:
+            batch_sizes = dict(sorted(self.batch_sizes.items()))
+        batches = sum(batch_sizes.values())
+        report = {name: stats.summary() for name, stats in self.stats.items()}
+        report["batch_size"] = {
+            "histogram": {str(size): count for size, count in batch_sizes.items()},
+            "mean": round(sum(size * count for size, count in batch_sizes.items()) / batches, 2) if batches else 0.0,
+        }
+        return report
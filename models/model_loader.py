@@ -1,14 +1,59 @@
+import contextlib
+import os
+import shutil
+import threading
+import torch
 from transformers import Owlv2ForObjectDetection, Owlv2Processor
 from transformers import OwlViTProcessor, OwlViTForObjectDetection
-from config.constants import OWL_V2, OWL_VIT, DEVICE
+from config.constants import OWL_V2, OWL_VIT, DEVICE, FAST_LOAD_DIR, PRECISION, PRECISIONS
+
+
+def apply_precision(model, precision):
+    """
+    Prepare a loaded model for inference at the given precision
+    
+    fp32 and bf16 keep fp32 weights, bf16 runs under autocast (see inference_context).
+    int8 dynamically quantizes the Linear layers of the vision and text towers.
+    The chosen precision is recorded on the model as `inference_precision`.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision!r}, choose from {PRECISIONS}")
+    
+    if precision == "int8":
+        if DEVICE != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        for tower in (model.base_model.vision_model, model.base_model.text_model):
+            torch.ao.quantization.quantize_dynamic(tower, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    
+    model.inference_precision = precision
+    return model
+
+
+def inference_context(precision):
+    """Return the context manager model calls run under for the given precision"""
+    if precision == "bf16":
+        return torch.autocast(device_type=DEVICE, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
+
 
 class Owlv2ModelLoader:
     """Class to load OWLv2 model and processor"""
-    def __init__(self):
-        """Initialize model and processor with pretrained weights"""
-        self.model = Owlv2ForObjectDetection.from_pretrained(OWL_V2).to(DEVICE)
-        self.processor = Owlv2Processor.from_pretrained(OWL_V2)
-        print("-----| MODEL:", OWL_V2, "loaded successfully! |-----")
+    def __init__(self, model_path=None, precision=PRECISION):
+        """
+        Initialize model and processor with pretrained weights
+        
+        Args:
+            model_path: Local directory to load from (e.g. a fast-load copy), the hub model is used if None
+            precision: Inference precision, one of PRECISIONS
+        """
+        self.model = Owlv2ForObjectDetection.from_pretrained(model_path or OWL_V2).to(DEVICE)
+        self.model.eval()
+        apply_precision(self.model, precision)
+        self.precision = precision
+        # keep the hub name so caches keyed by model name survive a fast-load copy
+        self.model.config.name_or_path = OWL_V2
+        self.processor = Owlv2Processor.from_pretrained(model_path or OWL_V2)
+        print("-----| MODEL:", model_path or OWL_V2, "loaded successfully! |-----")
 
     def get_components(self):
         """Return the model and processor components"""
@@ -16,13 +61,112 @@ class Owlv2ModelLoader:
     
 class OwlvitModelLoader:
     """Class to load OWLvit model and processor"""
-    def __init__(self):
-        """Initialize model and processor with pretrained weights"""
-        self.model = OwlViTForObjectDetection.from_pretrained(OWL_VIT).to(DEVICE)
-        self.processor = OwlViTProcessor.from_pretrained(OWL_VIT)
-        print("-----| MODEL:", OWL_VIT, "loaded successfully! |-----")
+    def __init__(self, model_path=None, precision=PRECISION):
+        """
+        Initialize model and processor with pretrained weights
+        
+        Args:
+            model_path: Local directory to load from (e.g. a fast-load copy), the hub model is used if None
+            precision: Inference precision, one of PRECISIONS
+        """
+        self.model = OwlViTForObjectDetection.from_pretrained(model_path or OWL_VIT).to(DEVICE)
+        self.model.eval()
+        apply_precision(self.model, precision)
+        self.precision = precision
+        # keep the hub name so caches keyed by model name survive a fast-load copy
+        self.model.config.name_or_path = OWL_VIT
+        self.processor = OwlViTProcessor.from_pretrained(model_path or OWL_VIT)
+        print("-----| MODEL:", model_path or OWL_VIT, "loaded successfully! |-----")
 
     def get_components(self):
         """Return the model and processor components"""
         return self.model, self.processor
-    
\ No newline at end of file
+
+
+# command-line model names
+MODEL_LOADERS = {
+    "owlv2": Owlv2ModelLoader,
+    "owlvit": OwlvitModelLoader,
+}
+
+
+def save_fast_load(loader, directory):
+    """
+    Write a safetensors copy of a loaded (moved and eval'd) model and its processor
+    
+    from_pretrained memory-maps safetensors files, so loading this copy is
+    dominated by page-ins instead of full deserialization.
+    """
+    model, processor = loader.get_components()
+    tmp_directory = f"{directory}.tmp-{os.getpid()}"
+    model.save_pretrained(tmp_directory, safe_serialization=True)
+    processor.save_pretrained(tmp_directory)
+    
+    try:
+        os.replace(tmp_directory, directory)
+    except OSError:
+        # another worker finished its copy first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+
+class ModelRegistry:
+    """
+    Process-wide registry keeping one resident loader per model
+    
+    Models are loaded lazily on first use. When fast_load_dir is set, the
+    first load writes a safetensors copy there and later cold starts load
+    from that copy.
+    """
+    def __init__(self, fast_load_dir=FAST_LOAD_DIR):
+        self.fast_load_dir = fast_load_dir
+        self._loaders = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, precision=PRECISION):
+        """Return the loader for name ("owlv2" or "owlvit") at precision, loading it on first use"""
+        with self._lock:
+            loader = self._loaders.get((name, precision))
+            if loader is None:
+                loader = self._load(name, precision)
+                self._loaders[(name, precision)] = loader
+            return loader
+
+    def is_loaded(self, name, precision=PRECISION):
+        with self._lock:
+            return (name, precision) in self._loaders
+
+    def unload(self, name, precision=PRECISION):
+        """Drop the resident model so its memory can be reclaimed"""
+        with self._lock:
+            self._loaders.pop((name, precision), None)
+
+    def fast_load_path(self, name):
+        """Return the fast-load directory for name, or None if fast loading is disabled"""
+        if self.fast_load_dir is None:
+            return None
+        return os.path.join(self.fast_load_dir, name)
+
+    def _load(self, name, precision):
+        loader_class = MODEL_LOADERS[name]
+        fast_path = self.fast_load_path(name)
+        
+        if fast_path is None:
+            return loader_class(precision=precision)
+        
+        # the fast-load copy always holds the fp32 weights
+        if not os.path.exists(os.path.join(fast_path, "config.json")):
+            loader = loader_class(precision="fp32")
+            os.makedirs(self.fast_load_dir, exist_ok=True)
+            save_fast_load(loader, fast_path)
+            if precision == "fp32":
+                return loader
+        
+        return loader_class(model_path=fast_path, precision=precision)
+
+
+MODEL_REGISTRY = ModelRegistry()
+
+
+def get_model_loader(name, precision=PRECISION):
+    """Return the resident loader for name from the process-wide registry"""
+    return MODEL_REGISTRY.get(name, precision)
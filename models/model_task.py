@@ -1,6 +1,5 @@
 from models.modelpredictor import ModelPredictor
 from utils.image_utils import load_image_by_path
-from utils.object_cropper import target_object_cropper
 import easygui
 from utils.user_input import choose_model, get_queries
 
@@ -37,6 +36,9 @@ def detection_by_image():
     
     print("---| STARTING DETECTION BY IMAGE |---")
     
+    # matplotlib is only needed for the interactive cropper
+    from utils.object_cropper import target_object_cropper
+    
     loader = choose_model()
     model, processor = loader.get_components()
     predictor = ModelPredictor(model, processor)
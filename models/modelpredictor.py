@@ -1,29 +1,73 @@
+import threading
+
 import torch
-from config.constants import TEXT_BASED_SCORE_THRESHOLD, IMAGE_BASED_SCORE_THRESHOLD,NMS_THRESHOLD, DEVICE
+from torchvision.ops import batched_nms
+from config.constants import TEXT_BASED_SCORE_THRESHOLD, IMAGE_BASED_SCORE_THRESHOLD,NMS_THRESHOLD, DEVICE, BATCH_SIZE
+from config.constants import QUERY_CACHE_PATH, FEATURE_STORE_DIR, TILE_SIZE, TILE_OVERLAP, FAST_PREPROCESS
+from config.constants import GALLERY_BOXES_PER_IMAGE, GALLERY_TOP_K
+from models.backends import TorchBackend, flatten_feature_map
+from models.feature_store import ImageFeatureStore
+from models.model_loader import inference_context
+from models.postprocess import post_process_detections
+from models.preprocess import FastImagePreprocessor
+from models.query_cache import QueryEmbeddingCache
+from utils.memory import trim_heap
+from utils.metrics import METRICS
 
 class ModelPredictor:
-    def __init__(self, model, processor):
+    def __init__(self, model, processor, query_cache=None, feature_store=None, backend=None,
+                 fast_preprocess=FAST_PREPROCESS, memory_budget=None):
         """
         Initialize predictor with loaded model components
         
         Args:
             model: Preloaded Owlv2 model
             processor: Owlv2 processor for input handling
+            query_cache: QueryEmbeddingCache shared between predictors (a private one is created if None)
+            feature_store: ImageFeatureStore for target images (a private one is created if None)
+            backend: TorchBackend (default) or OnnxRuntimeBackend running the towers and heads
+            fast_preprocess: Convert images with FastImagePreprocessor when it supports the image processor
+            memory_budget: Optional MemoryBudget, created after the model was loaded; caps the batch size,
+                reuses pixel_values buffers and returns freed activations to the OS after every batch
         """
         self.model = model
         self.processor = processor
         self.model.eval()
+        self.backend = backend if backend is not None else TorchBackend(model)
+        self.precision = getattr(model, "inference_precision", "fp32")
+        # cache key: embeddings differ between precisions and backends
+        self.model_name = model.config.name_or_path
+        if self.precision != "fp32":
+            self.model_name = f"{self.model_name}@{self.precision}"
+        if self.backend.name != "torch":
+            self.model_name = f"{self.model_name}@{self.backend.name}"
+        # OWLv2 pads images to a square before resizing, box coordinates are relative to that square
+        self.pad_to_square = model.config.model_type == "owlv2"
+        # None falls back to the HF image processor
+        self.fast_preprocessor = FastImagePreprocessor.from_processor(processor.image_processor) if fast_preprocess else None
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache(cache_path=QUERY_CACHE_PATH)
+        self.feature_store = feature_store if feature_store is not None else ImageFeatureStore(store_dir=FEATURE_STORE_DIR)
+        self.memory_budget = memory_budget
+        # largest forward pass the budget leaves room for, None when unbounded
+        self.max_batch_size = memory_budget.plan(self.inference_bytes_per_image()) if memory_budget is not None else None
+        # per-thread pixel_values buffers reused by the synchronous paths in budget mode
+        self._buffers = threading.local()
         
         print("model and processor initialized successfully.")
         
     
-    def text_based_detection(self, image, texts):
+    def text_based_detection(self, image, texts, key=None, threshold=TEXT_BASED_SCORE_THRESHOLD,
+                             nms_threshold=NMS_THRESHOLD):
         """
         Run text-based detection pipeline
         
         Args:
             image: PIL Image or image path
             texts: List of text queries (e.g., ["a car", "traffic light"])
+            key: Optional key (e.g. the image path) under which the raw outputs are cached,
+                see text_based_detection_from_cache
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
         
         Returns:
             boxes: Detected bounding boxes
@@ -31,70 +75,686 @@ class ModelPredictor:
             labels: Text labels
         """
         
-        inputs = self.processor(
-            images=image, 
-            text=texts, 
+        keys = None if key is None else [key]
+        return self.text_based_detection_batch([image], texts, batch_size=1, keys=keys, threshold=threshold,
+                                               nms_threshold=nms_threshold)[0]
+    
+    @METRICS.request()
+    def text_based_detection_batch(self, images, texts, batch_size=BATCH_SIZE, keys=None,
+                                   threshold=TEXT_BASED_SCORE_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+        """
+        Run text-based detection on many images, one forward pass per batch
+        
+        Args:
+            images: List of PIL Images
+            texts: List of text queries shared by every image
+            batch_size: Number of images stacked into a single forward pass
+            keys: Optional list of keys, one per image, under which the raw outputs are cached
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
+        
+        Returns:
+            List with one (boxes, scores, labels) tuple per input image
+        """
+        detections = []
+        batch_size = self.capped_batch_size(batch_size)
+        
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            
+            pixel_values = self.preprocess_images(batch, reuse_buffer=True)
+            
+            detections.extend(self.text_based_detection_from_pixels(
+                pixel_values, 
+                [image.size for image in batch], 
+                texts,
+                keys=None if keys is None else keys[start:start + batch_size],
+                threshold=threshold,
+                nms_threshold=nms_threshold
+            ))
+        
+        return detections
+    
+    @METRICS.request()
+    def tiled_text_based_detection(self, image, texts, tile_size=TILE_SIZE, overlap=TILE_OVERLAP,
+                                   include_full_image=True, batch_size=BATCH_SIZE,
+                                   threshold=TEXT_BASED_SCORE_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+        """
+        Run text-based detection on overlapping tiles of a large image
+        
+        Small objects vanish when a large image is resized to the model input,
+        so the image is split into tiles that are detected as one batch. Tile
+        boxes are shifted back to image coordinates and merged with per-label NMS.
+        
+        Args:
+            image: PIL Image
+            texts: List of text queries
+            tile_size: Tile edge in pixels
+            overlap: Pixels shared by neighbouring tiles
+            include_full_image: Also detect on the whole image to keep large objects
+            batch_size: Tiles per forward pass
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold within tiles and for merging them, 1.0 disables NMS
+        
+        Returns:
+            boxes: Detected bounding boxes in image coordinates
+            scores: Confidence scores
+            labels: Text labels
+        """
+        if overlap >= tile_size:
+            raise ValueError("overlap must be smaller than tile_size")
+        
+        width, height = image.size
+        if width <= tile_size and height <= tile_size:
+            return self.text_based_detection(image, texts, threshold=threshold, nms_threshold=nms_threshold)
+        
+        tiles = [
+            (left, top, min(left + tile_size, width), min(top + tile_size, height))
+            for top in tile_offsets(height, tile_size, overlap)
+            for left in tile_offsets(width, tile_size, overlap)
+        ]
+        if include_full_image:
+            tiles.append((0, 0, width, height))
+        
+        crops = [image.crop(tile) for tile in tiles]
+        detections = self.text_based_detection_batch(crops, texts, batch_size=batch_size, threshold=threshold,
+                                                     nms_threshold=nms_threshold)
+        
+        all_boxes, all_scores, all_labels = [], [], []
+        for (left, top, _, _), (boxes, scores, labels) in zip(tiles, detections):
+            all_boxes.append(boxes + torch.tensor([left, top, left, top], dtype=boxes.dtype))
+            all_scores.append(scores)
+            all_labels.extend(labels)
+        
+        boxes = torch.cat(all_boxes)
+        scores = torch.cat(all_scores)
+        boxes[:, 0::2] = boxes[:, 0::2].clamp(0, width)
+        boxes[:, 1::2] = boxes[:, 1::2].clamp(0, height)
+        
+        # merge duplicates of the same object found in overlapping tiles
+        if nms_threshold < 1.0:
+            label_ids = torch.tensor([texts.index(label) for label in all_labels], dtype=torch.int64)
+            keep = batched_nms(boxes, scores, label_ids, nms_threshold)
+        else:
+            keep = torch.argsort(scores, descending=True)
+        
+        return boxes[keep], scores[keep], [all_labels[i] for i in keep.tolist()]
+    
+    def capped_batch_size(self, batch_size):
+        """Return batch_size, lowered to the memory budget's batch size in budget mode"""
+        if self.max_batch_size is None:
+            return batch_size
+        return min(batch_size, self.max_batch_size)
+    
+    def inference_bytes_per_image(self):
+        """
+        Estimate the peak activation memory one image adds to a vision tower forward pass
+        
+        The encoder attention is eager, so every layer holds two (heads, tokens, tokens)
+        float32 score tensors (matmul output and softmax) next to the residual stream,
+        q / k / v and the MLP activations: about 1.3 GB for OWLv2 at 960 px,
+        50 MB for OWL-ViT at 768 px.
+        """
+        vision = self.model.config.vision_config
+        tokens = (vision.image_size // vision.patch_size) ** 2 + 1
+        layer = max(2 * vision.num_attention_heads * tokens ** 2, 2 * tokens * vision.intermediate_size)
+        return 4 * (layer + 6 * tokens * vision.hidden_size + 3 * vision.image_size ** 2)
+    
+    def _input_buffer(self, count):
+        """Return a (count, 3, H, W) view of this thread's reusable pixel_values buffer, None outside budget mode"""
+        if self.memory_budget is None or self.fast_preprocessor is None:
+            return None
+        buffer = getattr(self._buffers, "pixel_values", None)
+        if buffer is None or len(buffer) < count:
+            buffer = torch.empty(count, 3, self.fast_preprocessor.height, self.fast_preprocessor.width)
+            self._buffers.pixel_values = buffer
+        return buffer[:count]
+    
+    def _release_memory(self):
+        """Return the activations freed after a forward pass to the OS, so RSS stays within the budget"""
+        if self.memory_budget is not None:
+            trim_heap()
+    
+    @METRICS.timer("preprocess")
+    def preprocess_images(self, images, reuse_buffer=False):
+        """
+        Convert a list of PIL Images into a pixel_values batch tensor
+        
+        With reuse_buffer (budget mode, fast preprocessor) the result is a view of a
+        per-thread buffer overwritten by the next such call in the same thread; only
+        callers done with the tensor before preprocessing again may ask for it.
+        """
+        if self.fast_preprocessor is not None:
+            return self.fast_preprocessor(images, out=self._input_buffer(len(images)) if reuse_buffer else None)
+        return self.processor(
+            images=images, 
             return_tensors="pt"
-        ).to(DEVICE)
-        print("preprocess completed!")
+        )["pixel_values"]
+    
+    @METRICS.request()
+    def text_based_detection_from_pixels(self, pixel_values, image_sizes, texts, keys=None,
+                                         threshold=TEXT_BASED_SCORE_THRESHOLD, nms_threshold=NMS_THRESHOLD):
+        """
+        Run text-based detection on images already converted by preprocess_images
+        
+        Args:
+            pixel_values: Batch tensor returned by preprocess_images
+            image_sizes: List of original (width, height) sizes, one per image
+            texts: List of text queries shared by every image
+            keys: Optional list of keys, one per image, under which the raw outputs are cached
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
+        
+        Returns:
+            List with one (boxes, scores, labels) tuple per image
+        """
+        if self.max_batch_size is not None and len(pixel_values) > self.max_batch_size:
+            # batches assembled by the caller (pipeline, server) run in budget-sized chunks
+            detections = []
+            for start in range(0, len(pixel_values), self.max_batch_size):
+                end = start + self.max_batch_size
+                detections.extend(self.text_based_detection_from_pixels(
+                    pixel_values[start:end], image_sizes[start:end], texts,
+                    keys=None if keys is None else keys[start:end], threshold=threshold, nms_threshold=nms_threshold
+                ))
+            return detections
+        
+        pixel_values = pixel_values.to(DEVICE)
 
-        orig_size =  image.size[::-1]  # (height, width)
+        # only the vision tower and box head run per image, query embeddings come from the cache
+        with METRICS.timer("vision_encode"):
+            feature_map = self.backend.image_features(pixel_values)
+        with METRICS.timer("heads"):
+            pred_boxes = self.backend.box_predictions(feature_map)
+        METRICS.count("batches")
 
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            
-        print("predict completed!")
+        if keys is not None:
+            for key, image_feature_map, image_boxes in zip(keys, feature_map, pred_boxes):
+                self.feature_store.put(self.model_name, key, image_feature_map)
+                self.feature_store.put(self.boxes_namespace, key, image_boxes)
+        
+        detections = self._detect_from_features(feature_map, pred_boxes, image_sizes, texts, threshold, nms_threshold)
+        # only the kept boxes survive post-processing, the batch feature map and boxes go now
+        del feature_map, pred_boxes
+        self._release_memory()
+        return detections
+    
+    @METRICS.request()
+    def text_based_detection_from_cache(self, keys, image_sizes, texts, threshold=TEXT_BASED_SCORE_THRESHOLD,
+                                        nms_threshold=NMS_THRESHOLD, batch_size=BATCH_SIZE):
+        """
+        Re-run text-based detection on images whose raw outputs were cached under keys
+        
+        The vision tower is skipped: only new queries go through the text tower,
+        then the class head and post-processing run on the cached image
+        embeddings and boxes. Threshold / NMS sweeps and extra queries on
+        already-seen images cost milliseconds per image.
+        
+        Args:
+            keys: Keys passed when the images were first detected (or to precompute_target_features)
+            image_sizes: List of original (width, height) sizes, one per key
+            texts: List of text queries shared by every image
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
+            batch_size: Number of images sent through the class head at once
+        
+        Returns:
+            List with one (boxes, scores, labels) tuple per key
+        """
+        detections = []
+        
+        for start in range(0, len(keys), batch_size):
+            feature_maps, pred_boxes = zip(*(self.cached_outputs(key) for key in keys[start:start + batch_size]))
+            detections.extend(self._detect_from_features(
+                torch.cat(feature_maps),
+                torch.cat(pred_boxes),
+                image_sizes[start:start + batch_size],
+                texts,
+                threshold,
+                nms_threshold
+            ))
+        
+        return detections
+    
+    @property
+    def boxes_namespace(self):
+        """Feature store namespace of the cached predicted boxes"""
+        return f"{self.model_name}#boxes"
+    
+    def cached_outputs(self, key):
+        """
+        Return the cached (1, patches_h, patches_w, hidden_dim) feature map and
+        (1, num_boxes, 4) predicted boxes of an image; boxes are recomputed from
+        the feature map when only the latter was kept
+        """
+        feature_map = self.feature_store.get(self.model_name, key)
+        if feature_map is None:
+            raise KeyError(f"no cached outputs for {key!r}, run detection with keys first")
+        feature_map = feature_map.unsqueeze(0).to(DEVICE)
+        return feature_map, self.cached_boxes(key, feature_map)
+    
+    def cached_boxes(self, key, feature_map):
+        """Return the (1, num_boxes, 4) predicted boxes of a cached feature map, running the box head on a miss"""
+        pred_boxes = self.feature_store.get(self.boxes_namespace, key)
+        if pred_boxes is None:
+            with METRICS.timer("heads"):
+                pred_boxes = self.backend.box_predictions(feature_map)[0]
+            self.feature_store.put(self.boxes_namespace, key, pred_boxes)
+        return pred_boxes.unsqueeze(0).to(DEVICE)
+    
+    def _detect_from_features(self, feature_map, pred_boxes, image_sizes, texts, threshold, nms_threshold):
+        """Run the class head for texts on a batch of image feature maps and post-process"""
+        text_embeds = self.encode_text_queries(texts)
+        
+        query_embeds = text_embeds.unsqueeze(0).expand(len(feature_map), -1, -1)
+        with METRICS.timer("heads"):
+            logits = self.backend.class_logits(feature_map, query_embeds)
 
-        target_sizes = torch.tensor([orig_size])
+        # (height, width) of every original image
+        target_sizes = [(height, width) for width, height in image_sizes]
         
-        results = self.processor.post_process_grounded_object_detection(
-            outputs=outputs, 
-            threshold=TEXT_BASED_SCORE_THRESHOLD,
-            target_sizes=target_sizes
-        )[0]
+        with METRICS.timer("postprocess"):
+            results = post_process_detections(
+                logits, 
+                pred_boxes, 
+                target_sizes, 
+                threshold=threshold,
+                nms_threshold=nms_threshold,
+                pad_to_square=self.pad_to_square
+            )
+            
+            # Extract predictions per image
+            detections = []
+            for result in results:
+                boxes = result["boxes"]
+                scores = result["scores"]
+                labels = [texts[i] for i in result["labels"].tolist()]
+                detections.append((boxes, scores, labels))
         
-        # Extract predictions
-        boxes = results["boxes"]
-        scores = results["scores"]
-        labels = [texts[i] for i in results["labels"]]
+        METRICS.count("images", len(detections))
+        METRICS.count("detections", sum(len(boxes) for boxes, _, _ in detections))
+        return detections
+    
+    def encode_text_queries(self, texts):
+        """
+        Return text query embeddings, running the text tower only for cache misses
         
-        print("postprocess completed!")
-        return boxes, scores, labels
+        Args:
+            texts: List of text queries
+        
+        Returns:
+            Tensor of shape (len(texts), embed_dim) on DEVICE
+        """
+        normalize = self.query_cache.normalize
+        embeddings = {}
+        missing = []
+        for text in texts:
+            key = normalize(text)
+            if key in embeddings or key in missing:
+                continue
+            embedding = self.query_cache.get(self.model_name, key)
+            if embedding is None:
+                missing.append(key)
+            else:
+                embeddings[key] = embedding
+        
+        if missing:
+            with METRICS.timer("text_encode"):
+                text_inputs = self.processor(text=missing, return_tensors="pt").to(DEVICE)
+                features = self.backend.text_features(text_inputs["input_ids"], text_inputs["attention_mask"])
+            METRICS.count("queries_encoded", len(missing))
+            for key, feature in zip(missing, features):
+                self.query_cache.put(self.model_name, key, feature)
+                embeddings[key] = feature.cpu()
+        
+        return torch.stack([embeddings[normalize(text)] for text in texts]).to(DEVICE)
     
-    def image_based_detection(self, target_image, source_image):
+    @METRICS.request()
+    def precompute_target_features(self, images, keys=None, batch_size=BATCH_SIZE):
+        """
+        Run the vision tower on target images and keep their feature maps in the feature store
+        
+        Args:
+            images: List of PIL Images
+            keys: Optional list of keys (e.g. file paths), content hashes are used if None
+            batch_size: Number of images stacked into a single forward pass
+        
+        Returns:
+            List of keys under which the feature maps were stored
+        """
+        if keys is None:
+            keys = [self.feature_store.image_key(image) for image in images]
+        batch_size = self.capped_batch_size(batch_size)
+        
+        for start in range(0, len(images), batch_size):
+            feature_maps = self._embed_images(images[start:start + batch_size])
+            for key, feature_map in zip(keys[start:start + batch_size], feature_maps):
+                self.feature_store.put(self.model_name, key, feature_map)
+        
+        return keys
+    
+    def target_features(self, image, key=None):
+        """
+        Return the (1, patches_h, patches_w, hidden_dim) feature map of a target image,
+        computing it only on a feature store miss
+        """
+        if key is None:
+            key = self.feature_store.image_key(image)
+        
+        feature_map = self.feature_store.get(self.model_name, key)
+        if feature_map is None:
+            feature_map = self._embed_images([image])[0]
+            self.feature_store.put(self.model_name, key, feature_map)
+        
+        return feature_map.unsqueeze(0).to(DEVICE)
+    
+    def _embed_images(self, images):
+        """Run the vision tower on a list of images and return their feature maps"""
+        pixel_values = self.preprocess_images(images, reuse_buffer=True).to(DEVICE)
+        METRICS.count("batches")
+        with METRICS.timer("vision_encode"):
+            feature_maps = self.backend.image_features(pixel_values)
+        self._release_memory()
+        return feature_maps
+    
+    @METRICS.request()
+    def image_based_detection(self, target_image, source_image, target_key=None,
+                              threshold=IMAGE_BASED_SCORE_THRESHOLD, nms_threshold=NMS_THRESHOLD,
+                              query_embedding=None):
         """
         detects objets in target_image based on source_image
         
         Args:
             target_image: PIL Image or image path for target
             source_image: PIL Image or image path for source
+            target_key: Optional feature store key for target_image (e.g. its file path)
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
+            query_embedding: Optional row of reference_embeddings([source_image]), computed if None
         
         Returns:
             boxes: Detected bounding boxes
             scores: Confidence scores
             labels: Text labels
         """
-        inputs = self.processor(
-            images=target_image,
-            query_images=source_image,
-            return_tensors="pt"
-        ).to(DEVICE)
+        if target_key is None:
+            target_key = self.feature_store.image_key(target_image)
+        feature_map = self.target_features(target_image, target_key)
+        target_pred_boxes = self.cached_boxes(target_key, feature_map)
 
-        with torch.no_grad():
-            outputs = self.model.image_guided_detection(**inputs)
-
-        target_sizes = torch.tensor([target_image.size[::-1]]).to(DEVICE)
-        results = self.processor.post_process_image_guided_detection(
-            outputs=outputs,
-            target_sizes=target_sizes,
-            threshold=IMAGE_BASED_SCORE_THRESHOLD,
-            nms_threshold=NMS_THRESHOLD
-        )[0]
-        
-        # Extract predictions
+        # the target backbone pass and boxes come from the store, only the query crop and class head run here
+        if query_embedding is None:
+            query_embedding = self.reference_embeddings([source_image])[0]
+        query_embeds = query_embedding.reshape(1, 1, -1).to(DEVICE)
+        with METRICS.timer("heads"):
+            logits = self.backend.class_logits(feature_map, query_embeds)
+        
+        # one reference crop: boxes overlapping a better match are dropped whatever their label
+        with METRICS.timer("postprocess"):
+            results = post_process_detections(
+                logits,
+                target_pred_boxes,
+                [target_image.size[::-1]],
+                threshold=threshold,
+                nms_threshold=nms_threshold,
+                class_agnostic=True,
+                pad_to_square=self.pad_to_square
+            )[0]
+        
+        # Extract predictions, image-guided detections carry no text label
         boxes = results["boxes"]
         scores = results["scores"]
-        labels = results["labels"]
+        labels = None
         
+        METRICS.count("images")
+        METRICS.count("detections", len(boxes))
         return boxes, scores, labels
-        
\ No newline at end of file
+    
+    def reference_embeddings(self, source_images):
+        """
+        Return the class embeddings of the boxes that best cover reference crops,
+        running the vision tower once for all crops missing from the query cache
+        
+        Args:
+            source_images: List of PIL Images of reference objects
+        
+        Returns:
+            Tensor of shape (len(source_images), embed_dim) on DEVICE
+        """
+        # crops share the query cache with text queries, under a content hash
+        keys = [f"image:{self.feature_store.image_key(image)}" for image in source_images]
+        embeddings = {}
+        missing = {}
+        for key, image in zip(keys, source_images):
+            embedding = self.query_cache.get(self.model_name, key)
+            if embedding is None:
+                missing.setdefault(key, image)
+            else:
+                embeddings[key] = embedding
+        
+        missing_keys = list(missing)
+        batch_size = self.capped_batch_size(max(len(missing_keys), 1))
+        for start in range(0, len(missing_keys), batch_size):
+            batch_keys = missing_keys[start:start + batch_size]
+            query_pixel_values = self.preprocess_images([missing[key] for key in batch_keys],
+                                                        reuse_buffer=True).to(DEVICE)
+            with METRICS.timer("vision_encode"):
+                query_feature_map = self.backend.image_features(query_pixel_values).to(DEVICE)
+            with METRICS.timer("heads"):
+                # query box selection is data dependent, it always runs on the eager model
+                with torch.no_grad(), inference_context(self.precision):
+                    query_embeds = self.model.embed_image_query(flatten_feature_map(query_feature_map),
+                                                                query_feature_map)[0]
+            METRICS.count("queries_encoded", len(batch_keys))
+            for key, embedding in zip(batch_keys, query_embeds.reshape(len(batch_keys), -1)):
+                self.query_cache.put(self.model_name, key, embedding)
+                embeddings[key] = embedding.cpu()
+            del query_feature_map
+            self._release_memory()
+        
+        return torch.stack([embeddings[key] for key in keys]).to(DEVICE)
+    
+    @METRICS.request()
+    def multi_query_detection(self, target_image, texts=None, references=None, target_key=None, threshold=None,
+                              nms_threshold=NMS_THRESHOLD):
+        """
+        Detect several text queries and reference objects in one target image at once
+        
+        The target image goes through the vision tower once (or comes from the
+        feature store), every query embedding is computed once (cached across
+        calls) and all classes are scored by a single class head call, so each
+        extra query costs a class head column rather than a backbone pass.
+        
+        Args:
+            target_image: PIL Image to search
+            texts: List of text queries, labelled with their text
+            references: Dict of label -> reference crop or list of crops; the
+                unit-length embeddings of the crops of one label are averaged
+            target_key: Optional feature store key for target_image (e.g. its file path)
+            threshold: Minimum confidence score, if None TEXT_BASED_SCORE_THRESHOLD
+                for text queries and IMAGE_BASED_SCORE_THRESHOLD for references
+            nms_threshold: NMS IoU threshold, applied per label; 1.0 disables NMS
+        
+        Returns:
+            boxes: Detected bounding boxes
+            scores: Confidence scores
+            labels: Text query or reference label of every box
+        """
+        texts = list(texts or [])
+        references = {label: list(crops) if isinstance(crops, (list, tuple)) else [crops]
+                      for label, crops in (references or {}).items()}
+        labels = texts + list(references)
+        if not labels:
+            raise ValueError("multi_query_detection needs at least one text query or reference")
+        if len(set(labels)) != len(labels):
+            raise ValueError(f"labels must be unique, got {labels}")
+        
+        if target_key is None:
+            target_key = self.feature_store.image_key(target_image)
+        feature_map = self.target_features(target_image, target_key)
+        pred_boxes = self.cached_boxes(target_key, feature_map)
+        
+        query_embeds = []
+        if texts:
+            query_embeds.append(self.encode_text_queries(texts))
+        if references:
+            crop_embeds = self.reference_embeddings([crop for crops in references.values() for crop in crops])
+            crop_embeds = crop_embeds / (torch.linalg.norm(crop_embeds, dim=-1, keepdim=True) + 1e-6)
+            query_embeds.append(torch.stack([
+                class_embeds.mean(dim=0)
+                for class_embeds in crop_embeds.split([len(crops) for crops in references.values()])
+            ]))
+        query_embeds = torch.cat(query_embeds).unsqueeze(0)
+        
+        with METRICS.timer("heads"):
+            logits = self.backend.class_logits(feature_map, query_embeds)
+        
+        if threshold is None:
+            thresholds = torch.tensor([TEXT_BASED_SCORE_THRESHOLD] * len(texts)
+                                      + [IMAGE_BASED_SCORE_THRESHOLD] * len(references))
+        else:
+            thresholds = torch.full((len(labels),), float(threshold))
+        
+        # every box takes the best scoring label among those above their own threshold
+        with METRICS.timer("postprocess"):
+            result = post_process_detections(
+                logits,
+                pred_boxes,
+                [target_image.size[::-1]],
+                threshold=thresholds,
+                nms_threshold=nms_threshold,
+                pad_to_square=self.pad_to_square
+            )[0]
+        
+        boxes = result["boxes"]
+        scores = result["scores"]
+        box_labels = [labels[i] for i in result["labels"].tolist()]
+        
+        METRICS.count("images")
+        METRICS.count("detections", len(boxes))
+        return boxes, scores, box_labels
+    
+    def gallery_vectors(self, feature_map, boxes_per_image=GALLERY_BOXES_PER_IMAGE):
+        """
+        Return the GalleryIndex rows of a batch of feature maps
+        
+        The class head computes (cos(box, query) + shift) * scale per box, which
+        is the inner product of [box / |box| * scale, shift * scale] with
+        [query / |query|, 1]; those vectors are returned for the boxes_per_image
+        most object-like boxes of every image (objectness head of OWLv2, or the
+        boxes least similar to the image's mean embedding, the rule HF uses to
+        pick query boxes).
+        
+        Returns:
+            vectors: (batch, boxes_per_image, embed_dim + 1) float32 tensor
+            pred_boxes: (batch, boxes_per_image, 4) normalized (center_x, center_y, width, height) boxes
+        """
+        image_embeds = flatten_feature_map(feature_map)
+        with METRICS.timer("heads"):
+            pred_boxes = self.backend.box_predictions(feature_map)
+            head = self.model.class_head
+            with torch.no_grad(), inference_context(self.precision):
+                class_embeds = head.dense0(image_embeds)
+                class_embeds = class_embeds / (torch.linalg.norm(class_embeds, dim=-1, keepdim=True) + 1e-6)
+                logit_scale = head.elu(head.logit_scale(image_embeds)) + 1
+                vectors = torch.cat([class_embeds, head.logit_shift(image_embeds)], dim=-1) * logit_scale
+                if hasattr(self.model, "objectness_predictor"):
+                    objectness = self.model.objectness_predictor(image_embeds)
+                else:
+                    objectness = -(class_embeds @ class_embeds.mean(dim=1).unsqueeze(-1))[..., 0]
+        
+        keep = objectness.float().topk(min(boxes_per_image, objectness.shape[1]), dim=1).indices
+        vectors = vectors.float().gather(1, keep.unsqueeze(-1).expand(-1, -1, vectors.shape[-1]))
+        pred_boxes = pred_boxes.float().gather(1, keep.unsqueeze(-1).expand(-1, -1, 4))
+        return vectors, pred_boxes
+    
+    def _check_gallery(self, gallery):
+        if gallery.model_name != self.model_name:
+            raise ValueError(f"gallery was built with {gallery.model_name!r}, not {self.model_name!r}")
+    
+    @METRICS.request()
+    def add_to_gallery(self, gallery, images, keys, batch_size=BATCH_SIZE, boxes_per_image=GALLERY_BOXES_PER_IMAGE):
+        """
+        Index target images in a GalleryIndex for search_gallery
+        
+        Args:
+            gallery: GalleryIndex created with this predictor's model_name
+            images: List of PIL Images
+            keys: List of keys (e.g. file paths) returned by search_gallery
+            batch_size: Number of images stacked into a single forward pass
+            boxes_per_image: Boxes kept per image
+        """
+        self._check_gallery(gallery)
+        batch_size = self.capped_batch_size(batch_size)
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            vectors, pred_boxes = self.gallery_vectors(self._embed_images(batch), boxes_per_image)
+            for key, image, image_vectors, image_boxes in zip(keys[start:start + batch_size], batch, vectors,
+                                                              pred_boxes):
+                gallery.add(key, image_vectors, image_boxes, image.size)
+        METRICS.count("images", len(images))
+    
+    @METRICS.request()
+    def search_gallery(self, gallery, source_image, top_k=GALLERY_TOP_K, threshold=IMAGE_BASED_SCORE_THRESHOLD,
+                       nms_threshold=NMS_THRESHOLD, nprobe=None):
+        """
+        Find the gallery images containing the object shown in a reference crop
+        
+        Only the reference crop goes through the vision tower, gallery images
+        are scored from their stored box vectors.
+        
+        Args:
+            gallery: GalleryIndex filled by add_to_gallery
+            source_image: PIL Image of the reference object
+            top_k: Maximum number of images returned
+            threshold: Minimum confidence score
+            nms_threshold: NMS IoU threshold, 1.0 disables NMS
+            nprobe: IVF lists scanned, the gallery's default if None
+        
+        Returns:
+            List of (key, boxes, scores) of the matching images, best match first;
+            boxes in original image coordinates
+        """
+        self._check_gallery(gallery)
+        query = self.reference_embeddings([source_image])[0].float().cpu()
+        query = torch.cat([query / (torch.linalg.norm(query) + 1e-6), torch.ones(1)])
+        with METRICS.timer("gallery_search"):
+            matches = gallery.search(query, top_k, nprobe=nprobe)
+        if not matches:
+            return []
+        
+        # one padded batch: rows beyond an image's own get a -inf logit, which no threshold keeps
+        length = max(len(logits) for _, _, logits, _ in matches)
+        logits = torch.full((len(matches), length, 1), -torch.inf)
+        pred_boxes = torch.zeros(len(matches), length, 4)
+        for i, (_, _, image_logits, image_boxes) in enumerate(matches):
+            logits[i, :len(image_logits), 0] = image_logits
+            pred_boxes[i, :len(image_boxes)] = image_boxes
+        
+        with METRICS.timer("postprocess"):
+            results = post_process_detections(
+                logits,
+                pred_boxes,
+                [size[::-1] for _, size, _, _ in matches],
+                threshold=threshold,
+                nms_threshold=nms_threshold,
+                class_agnostic=True,
+                pad_to_square=self.pad_to_square
+            )
+        
+        detections = [(key, result["boxes"], result["scores"])
+                      for (key, *_), result in zip(matches, results) if len(result["scores"])]
+        METRICS.count("detections", sum(len(scores) for _, _, scores in detections))
+        return detections
+
+
+def tile_offsets(length, tile_size, overlap):
+    """Return tile start offsets along one axis so tiles of tile_size cover [0, length)"""
+    if length <= tile_size:
+        return [0]
+    
+    step = tile_size - overlap
+    offsets = list(range(0, length - tile_size, step))
+    # last tile is aligned with the far edge
+    offsets.append(length - tile_size)
+    return offsets
@@ -0,0 +1,255 @@
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from PIL import Image
+from config.constants import BATCH_SIZE, PIPELINE_DECODE_WORKERS, PIPELINE_RENDER_WORKERS, PIPELINE_QUEUE_DEPTH
+from utils.image_utils import load_image_by_path
+from utils.metrics import StageStats
+from utils.visualization import render_detections, save_image
+
+
+class PipelineRunner:
+    """
+    Run text-based detection as a three stage producer/consumer pipeline
+
+    1. a thread pool decodes and preprocesses images
+    2. a single inference stage pulls micro-batches of preprocessed images
+    3. a second thread pool annotates and saves results
+
+    Stages are connected by bounded queues, so a slow stage applies
+    backpressure to the ones before it instead of buffering every image.
+    When the predictor has a memory budget, images are also admitted by
+    their decoded size: a new decode waits until the bytes of the images
+    between decode and the end of rendering fit the budget's allowance.
+    Images finish out of order; on_result is still called in input order,
+    results that finish early wait (without their image) for earlier ones.
+    """
+    def __init__(self, predictor, texts, batch_size=BATCH_SIZE, decode_workers=PIPELINE_DECODE_WORKERS,
+                 render_workers=PIPELINE_RENDER_WORKERS, queue_depth=PIPELINE_QUEUE_DEPTH,
+                 save_dir=None, on_result=None, fast_decode=False):
+        """
+        Args:
+            predictor: ModelPredictor used for inference
+            texts: List of text queries shared by every image
+            batch_size: Maximum images per inference micro-batch
+            decode_workers: Threads decoding and preprocessing images
+            render_workers: Threads annotating / saving results and calling on_result
+            queue_depth: Maximum images waiting between two stages
+            save_dir: Directory for annotated images, nothing is rendered if None
+            on_result: Callback on_result(path, boxes, scores, labels), called in input order from one
+                thread at a time
+            fast_decode: Decode JPEGs at reduced size (draft mode) with the predictor's fast preprocessor;
+                boxes stay in original image coordinates, so it cannot be combined with save_dir
+        """
+        if fast_decode and predictor.fast_preprocessor is None:
+            raise ValueError("fast_decode needs a predictor with a fast preprocessor")
+        if fast_decode and save_dir is not None:
+            raise ValueError("fast_decode cannot be combined with save_dir, images are decoded at reduced size")
+        self.predictor = predictor
+        self.texts = texts
+        # the budget's batch size wins over a larger requested one
+        self.batch_size = predictor.capped_batch_size(batch_size)
+        self.memory_budget = predictor.memory_budget
+        self.decode_workers = decode_workers
+        self.render_workers = render_workers
+        self.queue_depth = queue_depth
+        self.save_dir = save_dir
+        self.on_result = on_result
+        self.fast_decode = fast_decode
+
+        self.stats = {name: StageStats(name) for name in ("decode", "queue_wait", "inference", "render")}
+        self._result_lock = threading.Lock()
+        # results waiting for an earlier image, by input index, and the index reported next
+        self._pending = {}
+        self._next_index = 0
+        # reused by the inference stage for the stacked batch in budget mode
+        self._batch_buffer = None
+
+    def _image_bytes(self, path):
+        """Estimate the memory one image holds while in flight: decoded RGB pixels plus its pixel_values"""
+        try:
+            with Image.open(path) as image:
+                size = image.size
+        except Exception:
+            # unreadable files fail in _decode and are released right away
+            return 0
+        fast = self.predictor.fast_preprocessor
+        if self.fast_decode:
+            # draft decoding scales by powers of two, the result is at most twice the minimum size
+            size = [min(full, 2 * draft) for full, draft in zip(size, fast.draft_size(size))]
+        pixel_values = 3 * fast.width * fast.height * 4 if fast is not None else 0
+        return 3 * size[0] * size[1] + pixel_values
+
+    def _decode(self, index, path, nbytes):
+        """Stage 1: load and preprocess one image"""
+        start = time.perf_counter()
+        try:
+            if self.fast_decode:
+                image, image_size = self.predictor.fast_preprocessor.load(path)
+            else:
+                image = load_image_by_path(path)
+                image_size = image.size
+            pixel_values = self.predictor.preprocess_images([image])
+        except Exception as error:
+            # a corrupt file must not stall the pipeline waiting for its result
+            print(f"Skipping {path}: {error}", file=sys.stderr)
+            return index, path, None, None, None, nbytes, start
+        finally:
+            self.stats["decode"].record(time.perf_counter() - start)
+        return index, path, image, image_size, pixel_values, nbytes, time.perf_counter()
+
+    def _render(self, index, path, image, boxes, scores, labels):
+        """Stage 3: annotate and save one result, then report it"""
+        start = time.perf_counter()
+        if self.save_dir is not None:
+            # the decoded image is not used after this stage, draw on it directly
+            annotated = render_detections(image, boxes, scores, labels, in_place=True)
+            save_image(annotated, os.path.join(self.save_dir, os.path.basename(path)))
+
+        self._report(index, (path, boxes, scores, labels))
+        self.stats["render"].record(time.perf_counter() - start)
+
+    def _report(self, index, result):
+        """Pass result (None for a skipped image) to on_result once every earlier image is reported"""
+        if self.on_result is None:
+            return
+        with self._result_lock:
+            self._pending[index] = result
+            while self._next_index in self._pending:
+                result = self._pending.pop(self._next_index)
+                self._next_index += 1
+                if result is not None:
+                    self.on_result(*result)
+
+    def _release(self, nbytes):
+        """Give the in-flight bytes of a finished or skipped image back to the memory budget"""
+        if self.memory_budget is not None:
+            self.memory_budget.release(nbytes)
+
+    def _feed(self, paths, decode_pool, decoded, slots, stop):
+        """Submit decode jobs, blocking while queue_depth images (or the memory budget's bytes) are in flight"""
+        for index, path in enumerate(paths):
+            while not slots.acquire(timeout=0.1):
+                if stop.is_set():
+                    return
+            nbytes = 0
+            if self.memory_budget is not None:
+                nbytes = self._image_bytes(path)
+                while not self.memory_budget.acquire(nbytes, timeout=0.1):
+                    if stop.is_set():
+                        return
+            future = decode_pool.submit(self._decode, index, path, nbytes)
+            future.add_done_callback(lambda done: decoded.put(done.result()))
+
+    def _stack(self, batch):
+        """Concatenate the pixel_values of a batch, into a reused buffer in budget mode"""
+        pixel_values = [pixel_values for _, _, _, _, pixel_values, _, _ in batch]
+        if self.memory_budget is None:
+            return torch.cat(pixel_values)
+        buffer = self._batch_buffer
+        if buffer is None or len(buffer) < len(pixel_values) or buffer.shape[1:] != pixel_values[0].shape[1:]:
+            # grown to the largest batch seen, which the budget's batch size bounds
+            buffer = self._batch_buffer = torch.empty(len(pixel_values), *pixel_values[0].shape[1:],
+                                                      dtype=pixel_values[0].dtype)
+        return torch.cat(pixel_values, out=buffer[:len(pixel_values)])
+
+    def _next_batch(self, decoded, slots, remaining):
+        """Block for one decoded image, then take whatever else is ready up to batch_size"""
+        batch = [decoded.get()]
+        while len(batch) < min(self.batch_size, remaining):
+            try:
+                batch.append(decoded.get_nowait())
+            except queue.Empty:
+                break
+        for _ in batch:
+            slots.release()
+        return batch
+
+    def _infer(self, batch, render_pool, render_slots, render_errors):
+        """Stage 2: detect one micro-batch and hand every result to the render pool"""
+        now = time.perf_counter()
+        for index, path, image, _, _, nbytes, ready_at in batch:
+            if image is None:
+                self._release(nbytes)
+                self._report(index, None)
+            else:
+                self.stats["queue_wait"].record(now - ready_at)
+        batch = [item for item in batch if item[2] is not None]
+        if not batch:
+            return
+
+        inference_start = time.perf_counter()
+        detections = self.predictor.text_based_detection_from_pixels(
+            self._stack(batch),
+            [image_size for _, _, _, image_size, _, _, _ in batch],
+            self.texts
+        )
+        self.stats["inference"].record(time.perf_counter() - inference_start)
+
+        for (index, path, image, _, _, nbytes, _), (boxes, scores, labels) in zip(batch, detections):
+            render_slots.acquire()
+            future = render_pool.submit(self._render, index, path, image, boxes, scores, labels)
+            future.add_done_callback(
+                lambda done, nbytes=nbytes: self._render_done(done, render_slots, render_errors, nbytes))
+
+    def _render_done(self, future, render_slots, render_errors, nbytes):
+        """Free the render slot and budget bytes of a finished render job, keeping its error for run()"""
+        if future.exception() is not None:
+            render_errors.append(future.exception())
+        render_slots.release()
+        self._release(nbytes)
+
+    def run(self, paths):
+        """
+        Process every image in paths
+
+        Returns:
+            Dict of per-stage latency summaries
+        """
+        if self.save_dir is not None:
+            os.makedirs(self.save_dir, exist_ok=True)
+
+        self._pending = {}
+        self._next_index = 0
+        decoded = queue.Queue()
+        slots = threading.Semaphore(self.queue_depth)
+        render_slots = threading.Semaphore(self.queue_depth)
+        stop = threading.Event()
+        start = time.perf_counter()
+
+        decode_pool = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="decode")
+        render_pool = ThreadPoolExecutor(self.render_workers, thread_name_prefix="render")
+        feeder = threading.Thread(target=self._feed, args=(paths, decode_pool, decoded, slots, stop), daemon=True)
+        feeder.start()
+
+        render_errors = []
+        try:
+            remaining = len(paths)
+            while remaining:
+                batch = self._next_batch(decoded, slots, remaining)
+                remaining -= len(batch)
+                self._infer(batch, render_pool, render_slots, render_errors)
+                # the decoded images now live only in the render jobs, freed as each one finishes
+                del batch
+
+            # every render slot back means every render job finished
+            for _ in range(self.queue_depth):
+                render_slots.acquire()
+            if render_errors:
+                raise render_errors[0]
+        finally:
+            stop.set()
+            feeder.join()
+            decode_pool.shutdown(wait=True)
+            render_pool.shutdown(wait=True)
+
+        report = {name: stats.summary() for name, stats in self.stats.items()}
+        elapsed = time.perf_counter() - start
+        report["throughput"] = {"images": len(paths), "seconds": round(elapsed, 3),
+                                "images_per_sec": round(len(paths) / elapsed, 2) if elapsed else 0.0}
+        return report
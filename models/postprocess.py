@@ -0,0 +1,85 @@
+import torch
+from torchvision.ops import batched_nms
+from config.constants import NMS_THRESHOLD, TOP_K
+
+
+def center_to_corners(boxes):
+    """Convert (center_x, center_y, width, height) boxes to (xmin, ymin, xmax, ymax)"""
+    center_x, center_y, width, height = boxes.unbind(-1)
+    return torch.stack(
+        [center_x - width / 2, center_y - height / 2, center_x + width / 2, center_y + height / 2], dim=-1
+    )
+
+
+def post_process_detections(logits, pred_boxes, target_sizes, threshold, nms_threshold=NMS_THRESHOLD,
+                            top_k=TOP_K, class_agnostic=False, pad_to_square=False):
+    """
+    Threshold, NMS, top-k and rescale raw OWL predictions for a whole batch at once
+
+    All images of the batch are handled by the same tensor operations: one
+    threshold mask, one batched_nms call (boxes of different images never
+    suppress each other) and one top-k selection.
+
+    Args:
+        logits: (batch, num_boxes, num_queries) class logits
+        pred_boxes: (batch, num_boxes, 4) normalized (center_x, center_y, width, height) boxes
+        target_sizes: (batch, 2) tensor or list of original (height, width)
+        threshold: Minimum sigmoid score kept, a float or a (num_queries,) tensor with one per query;
+            per-query thresholds mask each query's logits before a box takes its best query, so a
+            query that misses its own threshold never claims the box from one that passes
+        nms_threshold: IoU above which the lower scoring box is dropped, 1.0 disables NMS
+        top_k: Maximum detections kept per image, None keeps all
+        class_agnostic: Suppress overlapping boxes regardless of their label
+        pad_to_square: Boxes are relative to the image padded to a square (OWLv2), not the image itself
+
+    Returns:
+        List with one {"boxes", "scores", "labels"} dict per image, sorted by score
+    """
+    batch_size, _, num_queries = logits.shape
+    device = logits.device
+
+    if torch.is_tensor(threshold):
+        threshold = threshold.to(device)
+        logits = logits.masked_fill(logits.sigmoid() <= threshold, -torch.inf)
+        # masked logits score 0, below any floor
+        threshold = float(threshold.min())
+
+    scores, labels = logits.max(dim=-1)
+    scores = scores.sigmoid()
+
+    image_index, box_index = (scores > threshold).nonzero(as_tuple=True)
+    scores = scores[image_index, box_index]
+    labels = labels[image_index, box_index]
+
+    # only boxes above the threshold are converted: normalized -> absolute (xmin, ymin, xmax, ymax)
+    target_sizes = torch.as_tensor(target_sizes, dtype=torch.float32, device=device)
+    height, width = target_sizes.unbind(1)
+    if pad_to_square:
+        height = width = torch.maximum(height, width)
+    scale = torch.stack([width, height, width, height], dim=1)
+    boxes = center_to_corners(pred_boxes[image_index, box_index].float()) * scale[image_index]
+
+    if nms_threshold < 1.0:
+        groups = image_index if class_agnostic else image_index * num_queries + labels
+        keep = batched_nms(boxes, scores, groups, nms_threshold)
+    else:
+        keep = torch.argsort(scores, descending=True)
+
+    # keep is sorted by score: a stable sort by image keeps that order within each image
+    keep = keep[torch.argsort(image_index[keep], stable=True)]
+    image_index = image_index[keep]
+    counts = torch.bincount(image_index, minlength=batch_size)
+
+    if top_k is not None:
+        starts = torch.cumsum(counts, dim=0) - counts
+        rank = torch.arange(len(keep), device=device) - starts[image_index]
+        keep = keep[rank < top_k]
+        counts = counts.clamp(max=top_k)
+
+    counts = counts.tolist()
+    return [
+        {"boxes": image_boxes, "scores": image_scores, "labels": image_labels}
+        for image_boxes, image_scores, image_labels in zip(
+            boxes[keep].split(counts), scores[keep].split(counts), labels[keep].split(counts)
+        )
+    ]
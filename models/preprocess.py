@@ -0,0 +1,205 @@
+import math
+import warnings
+from functools import lru_cache
+
+import numpy as np
+import torch
+from PIL import Image
+from utils.metrics import METRICS
+
+# value of the gray OWLv2 pads images with, in 0-255 pixel units
+OWLV2_PAD_VALUE = 0.5 * 255
+
+
+def gaussian_kernel(sigma, truncate=4.0):
+    """Normalized 1D gaussian truncated at truncate * sigma, as scipy.ndimage.gaussian_filter builds it"""
+    radius = int(truncate * sigma + 0.5)
+    x = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 / sigma ** 2 * x ** 2)
+    return kernel / kernel.sum()
+
+
+def mirror(index, length):
+    """Reflect indices into [0, length) about the edge samples (scipy "mirror" / torch "reflect")"""
+    if length == 1:
+        return np.zeros_like(index)
+    period = 2 * (length - 1)
+    index = np.abs(index) % period
+    return np.where(index >= length, period - index, index)
+
+
+@lru_cache(maxsize=64)
+def owlv2_axis_weights(length, padded_length, out_length):
+    """
+    Sparse weights of OWLv2's resize along one axis of an image padded to padded_length
+
+    The HF processor pads the image to a square, gaussian-blurs it
+    (sigma = (padded_length / out_length - 1) / 2, mirror boundary) and zooms it
+    with linear interpolation (grid mode). Both are linear, so every output
+    sample is a weighted sum of a few input samples plus a share of the
+    constant pad value.
+
+    Returns:
+        matrix: (out_length, length) sparse CSR float32 tensor of input sample weights
+        pad_weights: (out_length, 1) float32 tensor, total weight of padded samples
+    """
+    scale = padded_length / out_length
+    coords = (np.arange(out_length) + 0.5) * scale - 0.5
+    lower = np.floor(coords).astype(np.int64)
+    fraction = coords - lower
+    taps = [(mirror(lower, padded_length), 1 - fraction), (mirror(lower + 1, padded_length), fraction)]
+
+    sigma = max(0.0, (scale - 1) / 2)
+    if sigma > 0:
+        kernel = gaussian_kernel(sigma)
+        radius = len(kernel) // 2
+        taps = [
+            (mirror(index + offset, padded_length), weight * kernel[offset + radius])
+            for index, weight in taps
+            for offset in range(-radius, radius + 1)
+        ]
+
+    # merge taps reading the same sample, the blur and interpolation windows overlap
+    row_offsets, columns, values = [0], [], []
+    pad_weights = np.zeros((out_length, 1))
+    for row in range(out_length):
+        merged = {}
+        for index, weight in taps:
+            sample = int(index[row])
+            if sample >= length:
+                pad_weights[row] += weight[row]
+            else:
+                merged[sample] = merged.get(sample, 0.0) + weight[row]
+        for sample in sorted(merged):
+            columns.append(sample)
+            values.append(merged[sample])
+        row_offsets.append(len(columns))
+
+    with warnings.catch_warnings():
+        # "sparse CSR tensor support is in beta state"
+        warnings.simplefilter("ignore", UserWarning)
+        matrix = torch.sparse_csr_tensor(
+            torch.tensor(row_offsets, dtype=torch.int64),
+            torch.tensor(columns, dtype=torch.int64),
+            torch.tensor(values, dtype=torch.float32),
+            size=(out_length, length),
+        )
+    return matrix, torch.from_numpy(pad_weights).float()
+
+
+def resample_rows(pixels, matrix, pad_weights, pad_value):
+    """Apply owlv2_axis_weights along the first axis of an (N, ...) float tensor"""
+    out = matrix @ pixels.reshape(len(pixels), -1)
+    out += pad_weights * pad_value
+    return out.reshape(matrix.shape[0], *pixels.shape[1:])
+
+
+class FastImagePreprocessor:
+    """
+    Convert PIL images into the pixel_values of an OWL image processor with torch
+
+    OWLv2: pad to square, anti-aliasing blur and linear zoom are folded into
+    sparse per-axis weights (see owlv2_axis_weights), so the padded square is
+    never built and no scipy pass runs. OWL-ViT: PIL bicubic resize, the same
+    call the HF processor makes. Both normalize straight into one
+    preallocated batch tensor.
+
+    load() decodes JPEGs in draft mode at the smallest DCT reduction
+    (1/2, 1/4, 1/8) still at least as large as the model input.
+    """
+    def __init__(self, kind, size, mean, std):
+        """
+        Args:
+            kind: "owlv2" or "owlvit"
+            size: Model input (height, width)
+            mean: Per-channel normalization mean, in 0-1 units
+            std: Per-channel normalization std, in 0-1 units
+        """
+        self.kind = kind
+        self.height, self.width = size
+        std = torch.tensor(std, dtype=torch.float32)
+        # (pixel / 255 - mean) / std == pixel * scale - shift
+        self.scale = (1 / (255 * std)).reshape(3, 1, 1)
+        self.shift = (torch.tensor(mean, dtype=torch.float32) / std).reshape(3, 1, 1)
+
+    @classmethod
+    def from_processor(cls, image_processor):
+        """Return a preprocessor matching image_processor, or None for configurations it does not reproduce"""
+        name = type(image_processor).__name__
+        if not all(getattr(image_processor, flag, False) for flag in ("do_resize", "do_rescale", "do_normalize")):
+            return None
+        if not math.isclose(image_processor.rescale_factor, 1 / 255):
+            return None
+        size = image_processor.size
+        if "height" not in size or "width" not in size:
+            return None
+
+        if name == "Owlv2ImageProcessor" and image_processor.do_pad:
+            kind = "owlv2"
+        elif name.startswith("OwlViTImageProcessor") and image_processor.resample == Image.BICUBIC:
+            if getattr(image_processor, "do_center_crop", False) and image_processor.crop_size != size:
+                return None
+            kind = "owlvit"
+        else:
+            return None
+        return cls(kind, (size["height"], size["width"]), image_processor.image_mean, image_processor.image_std)
+
+    def draft_size(self, image_size):
+        """Smallest (width, height) a draft-decoded image must keep for this model input"""
+        width, height = image_size
+        if self.kind == "owlv2":
+            # only the padded square is resized, its side must stay at least the model input
+            scale = max(self.height, self.width) / max(width, height)
+            return math.ceil(width * scale), math.ceil(height * scale)
+        return self.width, self.height
+
+    @METRICS.timer("decode")
+    def load(self, path):
+        """
+        Decode an image file for inference only, JPEGs at reduced size
+
+        Returns:
+            (RGB PIL Image, original (width, height)); boxes must be scaled to the original size
+        """
+        image = Image.open(path)
+        original_size = image.size
+        if image.format == "JPEG":
+            image.draft("RGB", self.draft_size(original_size))
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return image, original_size
+
+    def __call__(self, images, out=None):
+        """
+        Args:
+            images: List of PIL Images
+            out: Optional (len(images), 3, height, width) float32 tensor to write into
+
+        Returns:
+            pixel_values batch tensor
+        """
+        if out is None:
+            out = torch.empty(len(images), 3, self.height, self.width)
+        for image, target in zip(images, out):
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            pixels = self._resize(image)
+            torch.mul(pixels.permute(2, 0, 1), self.scale, out=target).sub_(self.shift)
+        return out
+
+    def _resize(self, image):
+        """Return the resized (height, width, 3) image, in 0-255 pixel units"""
+        if self.kind == "owlvit":
+            if image.size != (self.width, self.height):
+                image = image.resize((self.width, self.height), Image.BICUBIC)
+            return torch.from_numpy(np.array(image))
+
+        pixels = torch.from_numpy(np.array(image)).float()
+        height, width = pixels.shape[:2]
+        side = max(height, width)
+        # the blur and zoom are separable: rows first, then columns of the (out_height, width, 3) result
+        rows = resample_rows(pixels, *owlv2_axis_weights(height, side, self.height), OWLV2_PAD_VALUE)
+        columns = resample_rows(rows.transpose(0, 1).contiguous(), *owlv2_axis_weights(width, side, self.width),
+                                OWLV2_PAD_VALUE)
+        return columns.transpose(0, 1)
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import torch
+from config.constants import QUERY_CACHE_SIZE
+from utils.metrics import METRICS
+
+
+class QueryEmbeddingCache:
+    """
+    LRU cache of text query embeddings, shared across detection calls
+
+    Entries are keyed by (model name, normalized query) so one cache can
+    serve several models. Embeddings are kept on the CPU and can be
+    persisted to disk with save() / load(). With a cache_path, the file is
+    loaded on creation and flush() writes new entries back, so the next
+    process starts warm. Lookups are also counted in METRICS as
+    query_cache_hits / query_cache_misses.
+    """
+    def __init__(self, max_size=QUERY_CACHE_SIZE, cache_path=None):
+        """
+        Args:
+            max_size: Maximum number of embeddings kept in memory
+            cache_path: Optional file the cache is loaded from and saved to
+        """
+        self.max_size = max_size
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+        if cache_path and os.path.exists(cache_path):
+            self.load(cache_path)
+
+    @staticmethod
+    def normalize(query):
+        """Lower-case a query and collapse whitespace so equal queries share a key"""
+        return " ".join(query.lower().split())
+
+    def get(self, model_name, query):
+        """Return the cached embedding for query, or None on a miss"""
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        METRICS.count("query_cache_hits" if embedding is not None else "query_cache_misses")
+        return embedding
+
+    def put(self, model_name, query, embedding):
+        """Store an embedding, evicting the least recently used entry when full"""
+        key = (model_name, self.normalize(query))
+        with self._lock:
+            self._entries[key] = embedding.detach().cpu()
+            self._entries.move_to_end(key)
+            self._dirty = True
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return hit/miss counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def save(self, path=None):
+        """Persist all cached embeddings to path (defaults to cache_path)"""
+        path = path or self.cache_path
+        if path is None:
+            raise ValueError("No cache_path configured for QueryEmbeddingCache")
+
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            entries = list(self._entries.items())
+            self._dirty = False
+        # written aside and renamed, processes sharing the file may save at once
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as f:
+            torch.save(entries, f)
+        os.replace(f.name, path)
+
+    def flush(self):
+        """Save to cache_path if one is configured and entries were added since the last save"""
+        if self.cache_path and self._dirty:
+            self.save()
+
+    def load(self, path=None):
+        """Load embeddings previously written by save()"""
+        path = path or self.cache_path
+        entries = torch.load(path, map_location="cpu")
+        with self._lock:
+            for key, embedding in entries:
+                self._entries[tuple(key)] = embedding
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+
+import numpy as np
+import torch
+
+# column files of a result directory: name -> (dtype, values per detection)
+COLUMNS = {
+    "boxes": (np.float32, 4),
+    "scores": (np.float32, 1),
+    "labels": (np.int32, 1),
+}
+INDEX_FILE = "index.jsonl"
+
+
+def _column_path(directory, name):
+    return os.path.join(directory, f"{name}.bin")
+
+
+def _read_index(directory):
+    """Return the complete records of a result directory's index, in write order"""
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            # a run killed mid-write leaves at most one partial last line
+            if not line.endswith("\n"):
+                break
+            records.append(json.loads(line))
+    return records
+
+
+class ResultWriter:
+    """
+    Append-only, columnar store of the detections of a run
+
+    Detections of every image are appended to three flat binary columns
+    (float32 boxes, float32 scores, int32 query index) and described by one
+    line of index.jsonl holding the image path, its queries and the row
+    range. Columns are written before the index line, so an interrupted run
+    leaves a readable directory; re-opening it appends after the last
+    complete record.
+    """
+    def __init__(self, directory):
+        """
+        Args:
+            directory: Result directory, created if missing
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        records = _read_index(directory)
+        self.rows = records[-1]["start"] + records[-1]["count"] if records else 0
+        self.images = len(records)
+
+        # drop rows of a record whose index line never made it to disk
+        self._columns = {}
+        for name, (dtype, width) in COLUMNS.items():
+            column = open(_column_path(directory, name), "ab")
+            column.truncate(self.rows * width * np.dtype(dtype).itemsize)
+            self._columns[name] = column
+        self._index = open(os.path.join(directory, INDEX_FILE), "ab")
+        self._index.truncate(self._complete_index_size())
+        self._lock = threading.Lock()
+
+    def _complete_index_size(self):
+        """Byte size of the index up to its last complete line"""
+        with open(os.path.join(self.directory, INDEX_FILE), "rb") as f:
+            return f.read().rfind(b"\n") + 1
+
+    def write(self, image_path, boxes, scores, labels, queries=None, mode="text"):
+        """
+        Append the detections of one image
+
+        Args:
+            image_path: Key of the record, usually the image path
+            boxes: (N, 4) boxes as tensor, array or list
+            scores: (N,) scores
+            labels: Text labels (one of queries) or None for image-guided detection
+            queries: Queries of the run, labels are stored as indices into it
+            mode: "text", "image" or "multi" (text queries and labelled references)
+        """
+        boxes = np.asarray(boxes.cpu() if torch.is_tensor(boxes) else boxes, dtype=np.float32).reshape(-1, 4)
+        scores = np.asarray(scores.cpu() if torch.is_tensor(scores) else scores, dtype=np.float32).reshape(-1)
+        queries = list(queries or [])
+        if labels is None:
+            label_ids = np.full(len(scores), -1, dtype=np.int32)
+        else:
+            label_ids = np.asarray([queries.index(label) for label in labels], dtype=np.int32)
+
+        with self._lock:
+            for name, values in (("boxes", boxes), ("scores", scores), ("labels", label_ids)):
+                self._columns[name].write(values.tobytes())
+                self._columns[name].flush()
+
+            record = {"image": image_path, "mode": mode, "queries": queries, "start": self.rows, "count": len(scores)}
+            self._index.write((json.dumps(record) + "\n").encode("utf-8"))
+            self._index.flush()
+            self.rows += len(scores)
+            self.images += 1
+
+    def close(self):
+        with self._lock:
+            for column in self._columns.values():
+                column.close()
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ResultReader:
+    """
+    Read detections written by ResultWriter
+
+    Columns are memory-mapped and the index is loaded into a dict, so
+    looking up one image costs a dict access and a slice. When an image was
+    written more than once, the latest record wins.
+    """
+    def __init__(self, directory):
+        """
+        Args:
+            directory: Result directory written by ResultWriter
+        """
+        self.directory = directory
+        self.records = {record["image"]: record for record in _read_index(directory)}
+
+        rows = max((record["start"] + record["count"] for record in self.records.values()), default=0)
+        self._columns = {}
+        for name, (dtype, width) in COLUMNS.items():
+            if rows == 0:
+                self._columns[name] = np.zeros((0, width), dtype=dtype)
+                continue
+            column = np.memmap(_column_path(directory, name), dtype=dtype, mode="r", shape=(rows * width,))
+            self._columns[name] = column.reshape(rows, width)
+
+    def images(self):
+        """Return the keys of every stored image"""
+        return list(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, image_path):
+        return image_path in self.records
+
+    def get(self, image_path, query=None, threshold=None):
+        """
+        Return the stored detections of one image
+
+        Args:
+            image_path: Key used when writing
+            query: Only keep detections of this text query
+            threshold: Only keep detections scoring above this value
+
+        Returns:
+            Tuple of (boxes, scores, labels) like ModelPredictor: boxes as (N, 4) tensor,
+            scores as (N,) tensor, labels as list of str or None for image-guided records
+        """
+        record = self.records[image_path]
+        rows = slice(record["start"], record["start"] + record["count"])
+        boxes = self._columns["boxes"][rows]
+        scores = self._columns["scores"][rows, 0]
+        label_ids = self._columns["labels"][rows, 0]
+
+        keep = np.ones(len(scores), dtype=bool)
+        if query is not None:
+            if query not in record["queries"]:
+                keep[:] = False
+            else:
+                keep &= label_ids == record["queries"].index(query)
+        if threshold is not None:
+            keep &= scores > threshold
+
+        labels = None
+        if record["mode"] != "image":
+            labels = [record["queries"][i] for i in label_ids[keep].tolist()]
+        return torch.from_numpy(np.array(boxes[keep])), torch.from_numpy(np.array(scores[keep])), labels
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import sys
+import time
+
+import torch
+from config.constants import BATCH_SIZE, DEVICE, PRECISION, SHARD_WORKERS
+from models.model_loader import MODEL_REGISTRY, get_model_loader
+from models.modelpredictor import ModelPredictor
+from utils.image_utils import load_image_by_path
+from utils.visualization import render_detections, save_image
+
+# per-process state of a worker, set by _init_worker
+_worker = {}
+
+
+def default_threads_per_worker(workers):
+    """Split the CPU cores evenly between workers"""
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def _init_worker(model_name, precision, texts, threads, fast_load_dir, save_dir, onnx_dir):
+    torch.set_num_threads(threads)
+    if fast_load_dir is not None:
+        MODEL_REGISTRY.fast_load_dir = fast_load_dir
+
+    # forked workers find the parent's resident model here and share its weights copy-on-write,
+    # spawned workers load it, memory-mapped from the fast-load copy when fast_load_dir is set
+    model, processor = get_model_loader(model_name, precision).get_components()
+    backend = None
+    if onnx_dir is not None:
+        from models.backends import OnnxRuntimeBackend
+        backend = OnnxRuntimeBackend(onnx_dir, num_threads=threads)
+    _worker["predictor"] = ModelPredictor(model, processor, backend=backend)
+    _worker["texts"] = texts
+    _worker["save_dir"] = save_dir
+
+
+def _detect_chunk(paths):
+    """Detect one chunk of images inside a worker; returns (path, boxes, scores, labels) per readable image"""
+    loaded_paths, images = [], []
+    for path in paths:
+        try:
+            images.append(load_image_by_path(path))
+            loaded_paths.append(path)
+        except OSError as error:
+            print(f"Skipping {path}: {error}", file=sys.stderr)
+    if not images:
+        return []
+
+    detections = _worker["predictor"].text_based_detection_batch(images, _worker["texts"], batch_size=len(images))
+    # pool workers are terminated without an exit hook; only the first chunk of a worker has new entries to save
+    _worker["predictor"].query_cache.flush()
+
+    save_dir = _worker["save_dir"]
+    if save_dir is not None:
+        for path, image, (boxes, scores, labels) in zip(loaded_paths, images, detections):
+            annotated = render_detections(image, boxes, scores, labels, in_place=True)
+            save_image(annotated, os.path.join(save_dir, os.path.basename(path)))
+
+    return [(path, boxes, scores, labels) for path, (boxes, scores, labels) in zip(loaded_paths, detections)]
+
+
+class ShardedRunner:
+    """
+    Run text-based detection over many images in a pool of worker processes
+
+    One interpreter scales poorly on many-core machines because intra-op
+    threads stop paying off for this model. The input is cut into chunks of
+    batch_size images that are handed to `workers` processes, each with a
+    resident model and threads_per_worker intra-op threads.
+
+    Where fork is available and the model runs on the CPU, it is loaded once
+    in the parent and the workers share its read-only weights copy-on-write;
+    otherwise (a CUDA context cannot be inherited by a fork) every worker
+    loads it, from the memory-mapped fast-load copy when
+    fast_load_dir is set. Results come back in input order.
+    """
+    def __init__(self, model_name, texts, workers=SHARD_WORKERS, threads_per_worker=None, precision=PRECISION,
+                 batch_size=BATCH_SIZE, fast_load_dir=None, save_dir=None, onnx_dir=None, start_method=None):
+        """
+        Args:
+            model_name: "owlv2" or "owlvit"
+            texts: List of text queries shared by every image
+            workers: Number of worker processes
+            threads_per_worker: torch intra-op threads per worker, CPU cores / workers if None
+            precision: Inference precision of the workers' model
+            batch_size: Images per chunk, detected as one forward pass
+            fast_load_dir: Directory of safetensors copies for workers that load the model themselves
+            save_dir: Directory for annotated images, nothing is rendered if None
+            onnx_dir: Run the workers on the ONNX Runtime backend with the graphs in this directory
+            start_method: multiprocessing start method, "fork" on CPU where available if None
+        """
+        self.model_name = model_name
+        self.texts = texts
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or default_threads_per_worker(workers)
+        self.precision = precision
+        self.batch_size = batch_size
+        self.fast_load_dir = fast_load_dir
+        self.save_dir = save_dir
+        self.onnx_dir = onnx_dir
+        if start_method is None:
+            fork = DEVICE == "cpu" and "fork" in multiprocessing.get_all_start_methods()
+            start_method = "fork" if fork else "spawn"
+        elif start_method == "fork" and DEVICE != "cpu":
+            raise ValueError(f"fork workers cannot use the {DEVICE} model of the parent, use spawn")
+        self.start_method = start_method
+
+    def run(self, paths, on_result=None):
+        """
+        Detect objects in every image of paths
+
+        Args:
+            paths: Image paths
+            on_result: Callback on_result(path, boxes, scores, labels), called in input order
+
+        Returns:
+            Dict with image count and throughput
+        """
+        if self.save_dir is not None:
+            os.makedirs(self.save_dir, exist_ok=True)
+        if self.start_method == "fork":
+            # load before forking so every worker inherits the same weights
+            if self.fast_load_dir is not None:
+                MODEL_REGISTRY.fast_load_dir = self.fast_load_dir
+            get_model_loader(self.model_name, self.precision)
+
+        chunks = [paths[start:start + self.batch_size] for start in range(0, len(paths), self.batch_size)]
+        init_args = (self.model_name, self.precision, self.texts, self.threads_per_worker,
+                     self.fast_load_dir, self.save_dir, self.onnx_dir)
+
+        start = time.perf_counter()
+        images = 0
+        context = multiprocessing.get_context(self.start_method)
+        with context.Pool(self.workers, initializer=_init_worker, initargs=init_args) as pool:
+            # imap keeps input order while workers run ahead on later chunks
+            for results in pool.imap(_detect_chunk, chunks):
+                for path, boxes, scores, labels in results:
+                    images += 1
+                    if on_result is not None:
+                        on_result(path, boxes, scores, labels)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "images": images,
+            "workers": self.workers,
+            "threads_per_worker": self.threads_per_worker,
+            "seconds": round(elapsed, 3),
+            "images_per_sec": round(images / elapsed, 2) if elapsed else 0.0,
+        }
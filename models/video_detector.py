@@ -0,0 +1,204 @@
+import json
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+from config.constants import BATCH_SIZE, VIDEO_STRIDE, VIDEO_SCENE_THRESHOLD, VIDEO_QUEUE_DEPTH
+from utils.metrics import METRICS
+from utils.visualization import label_color
+
+
+class FrameReader(threading.Thread):
+    """Decode frames from a video file or webcam index on a background thread"""
+    def __init__(self, source, queue_depth=VIDEO_QUEUE_DEPTH):
+        """
+        Args:
+            source: Video file path, stream URL or webcam index (e.g. "0")
+            queue_depth: Decoded frames buffered ahead of the detector
+        """
+        super().__init__(name="frame-reader", daemon=True)
+        self.capture = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+        if not self.capture.isOpened():
+            raise OSError(f"Cannot open video source {source!r}")
+
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frames = queue.Queue(maxsize=queue_depth)
+        self._stop_event = threading.Event()
+
+    def run(self):
+        index = 0
+        try:
+            while not self._stop_event.is_set():
+                with METRICS.timer("decode"):
+                    ok, frame = self.capture.read()
+                if not ok:
+                    break
+                self.frames.put((index, frame))
+                index += 1
+        finally:
+            self.capture.release()
+            self.frames.put(None)
+
+    def stop(self):
+        self._stop_event.set()
+        # unblock the reader if it is waiting on a full queue
+        try:
+            while True:
+                self.frames.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            yield item
+
+
+def frame_signature(frame, size=(64, 36)):
+    """Small grayscale thumbnail used to detect scene changes between frames"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+@METRICS.timer("render")
+def draw_detections(frame, boxes, scores, labels):
+    """Draw boxes and labels onto a BGR frame in place"""
+    for box, score, label in zip(boxes, scores, labels):
+        xmin, ymin, xmax, ymax = map(int, box)
+        color = label_color(label)[::-1]  # RGB -> BGR
+        cv2.rectangle(frame, (xmin, ymin), (xmax, ymax), color, 2)
+        text = f"{label}: {score:.2f}" if label else f"{score:.2f}"
+        cv2.putText(frame, text, (xmin, max(ymin - 4, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
+
+
+class VideoDetector:
+    """
+    Text-based detection over the frames of a video
+
+    Frames are decoded on a background thread. The model runs at most every
+    `stride` frames and only when the frame differs from the last detected
+    one by more than scene_threshold (mean absolute grayscale difference of
+    a thumbnail); other frames reuse the latest detections. Frames chosen
+    for detection are batched, and query embeddings come from the
+    predictor's query cache, so the text tower runs once per video.
+    """
+    def __init__(self, predictor, texts, stride=VIDEO_STRIDE, scene_threshold=VIDEO_SCENE_THRESHOLD,
+                 batch_size=BATCH_SIZE):
+        """
+        Args:
+            predictor: ModelPredictor used for detection
+            texts: List of text queries
+            stride: Run the model at most every `stride` frames
+            scene_threshold: Minimum thumbnail difference (0-255) to re-run the model, 0 disables the check
+            batch_size: Frames detected in one forward pass
+        """
+        self.predictor = predictor
+        self.texts = texts
+        self.stride = max(1, stride)
+        self.scene_threshold = scene_threshold
+        self.batch_size = batch_size
+
+    def run(self, source, output_video=None, output_json=None):
+        """
+        Detect objects in every frame of source
+
+        Args:
+            source: Video file path, stream URL or webcam index
+            output_video: Optional path of the annotated output video (.mp4)
+            output_json: Optional JSONL path receiving one record per frame
+
+        Returns:
+            Dict with frame counts and throughput
+        """
+        reader = FrameReader(source)
+        writer = None
+        json_file = open(output_json, "w", encoding="utf-8") if output_json else None
+
+        pending = []        # (frame index, frame, index of the frame whose detections it shows)
+        to_detect = []      # (frame index, PIL image)
+        detections = {}
+        last_signature = None
+        frames = inferred = 0
+        start = time.perf_counter()
+
+        def flush():
+            nonlocal writer
+            if to_detect:
+                results = self.predictor.text_based_detection_batch(
+                    [image for _, image in to_detect], self.texts, batch_size=self.batch_size
+                )
+                for (index, _), result in zip(to_detect, results):
+                    detections[index] = result
+                to_detect.clear()
+
+            for index, frame, source_index in pending:
+                boxes, scores, labels = detections[source_index]
+                if output_video:
+                    if writer is None:
+                        height, width = frame.shape[:2]
+                        writer = cv2.VideoWriter(output_video, cv2.VideoWriter_fourcc(*"mp4v"),
+                                                 reader.fps, (width, height))
+                    annotated = draw_detections(frame, boxes.tolist(), scores.tolist(), labels)
+                    with METRICS.timer("save"):
+                        writer.write(annotated)
+                if json_file:
+                    json_file.write(json.dumps({
+                        "frame": index,
+                        "time_s": round(index / reader.fps, 3),
+                        "detected": index == source_index,
+                        "boxes": [[round(value, 2) for value in box] for box in boxes.tolist()],
+                        "scores": [round(score, 4) for score in scores.tolist()],
+                        "labels": labels,
+                    }) + "\n")
+            pending.clear()
+
+            # only the most recent detections can still be reused
+            latest = max(detections)
+            for index in [index for index in detections if index != latest]:
+                del detections[index]
+
+        reader.start()
+        try:
+            source_index = None
+            for index, frame in reader:
+                frames += 1
+                signature = frame_signature(frame)
+                detect = last_signature is None or (
+                    index % self.stride == 0
+                    and float(np.abs(signature - last_signature).mean()) > self.scene_threshold
+                )
+                if detect:
+                    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    to_detect.append((index, image))
+                    last_signature = signature
+                    source_index = index
+                    inferred += 1
+
+                pending.append((index, frame, source_index))
+                # emit right away when nothing waits for the model, bound buffered frames otherwise
+                if not to_detect or len(to_detect) >= self.batch_size or len(pending) >= VIDEO_QUEUE_DEPTH:
+                    flush()
+
+            if pending:
+                flush()
+        finally:
+            reader.stop()
+            if writer is not None:
+                writer.release()
+            if json_file:
+                json_file.close()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "frames": frames,
+            "detected_frames": inferred,
+            "reused_frames": frames - inferred,
+            "seconds": round(elapsed, 3),
+            "fps": round(frames / elapsed, 2) if elapsed else 0.0,
+        }
@@ -0,0 +1,515 @@
+"""
+Non-interactive command line interface
+
+Examples:
+    python -m queryvision detect --model owlv2 --queries "coin,box" --input sample/ --out results.jsonl
+    python -m queryvision detect --model owlvit --reference sample/one_coin.jpg --reference-bbox 10,10,120,120 \
+        --input "sample/*.jpg" --out results.jsonl
+    python -m queryvision detect --queries "box" --reference coin=sample/one_coin.jpg --reference coin=crops/coin2.jpg \
+        --input sample/ --out results.jsonl
+    python -m queryvision video --queries "person,car" --input clip.mp4 --out-video annotated.mp4 --out-json frames.jsonl
+    python -m queryvision export --model owlv2 --out onnx/owlv2
+    python -m queryvision detect --backend onnx --onnx-dir onnx/owlv2 --queries "coin,box" --input sample/ --out results.jsonl
+    python -m queryvision render --results-dir run1/ --save-dir annotated/ --threshold 0.4
+    python -m queryvision gallery add --index gallery/ --input "catalog/*.jpg" --train
+    python -m queryvision gallery search --index gallery/ --reference crop.jpg --top-k 10 --out matches.jsonl
+    python -m queryvision serve --model owlv2 --model-dir model_cache/owlv2 --port 7860
+"""
+import argparse
+import json
+import os
+import sys
+
+from config.constants import BATCH_SIZE, IMAGE_BASED_SCORE_THRESHOLD, PRECISION, TILE_OVERLAP, VIDEO_STRIDE, VIDEO_SCENE_THRESHOLD
+from config.constants import PIPELINE_DECODE_WORKERS, PIPELINE_RENDER_WORKERS, PIPELINE_QUEUE_DEPTH, SHARD_WORKERS
+from config.constants import ONNX_OPSET, GALLERY_BOXES_PER_IMAGE, GALLERY_IVF_LISTS, GALLERY_TOP_K
+from config.constants import BACKENDS, MODEL_NAMES, PRECISIONS, MEMORY_BUDGET_MB
+from queryvision.server import add_serve_parser
+from utils.image_utils import list_image_paths, load_image_by_path
+from utils.metrics import add_metrics_arguments, finish_metrics, start_metrics
+from utils.user_input import parse_queries
+
+# torch, transformers, cv2 and the model modules are imported inside the commands that need
+# them, so `--help` and argument errors return without loading the deep learning stack
+
+
+def parse_bbox(raw):
+    """Parse "xmin,ymin,xmax,ymax" into a tuple of ints"""
+    try:
+        bbox = tuple(int(round(float(value))) for value in raw.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid bbox {raw!r}, expected xmin,ymin,xmax,ymax")
+    if len(bbox) != 4 or bbox[0] >= bbox[2] or bbox[1] >= bbox[3]:
+        raise argparse.ArgumentTypeError(f"invalid bbox {raw!r}, expected xmin,ymin,xmax,ymax")
+    return bbox
+
+
+def parse_reference(raw):
+    """Parse "label=path" or "path" (labelled with the file name) into a (label, path) tuple"""
+    label, separator, path = raw.partition("=")
+    if not separator or os.path.exists(raw):
+        return os.path.splitext(os.path.basename(raw))[0], raw
+    return label, path
+
+
+def detection_record(image_path, boxes, scores, labels, mode):
+    """Build the JSON-serializable record written for one image"""
+    return {
+        "image": image_path,
+        "mode": mode,
+        "boxes": [[round(value, 2) for value in box] for box in boxes.tolist()],
+        "scores": [round(score, 4) for score in scores.tolist()],
+        "labels": labels,
+    }
+
+
+def load_images(paths):
+    """Load images, skipping unreadable files; returns (paths, images) of the readable ones"""
+    loaded_paths, images = [], []
+    for path in paths:
+        try:
+            images.append(load_image_by_path(path))
+            loaded_paths.append(path)
+        except OSError as error:
+            print(f"Skipping {path}: {error}", file=sys.stderr)
+    return loaded_paths, images
+
+
+def run_tiled_detection(predictor, paths, queries, args, emit):
+    """Stream tiled text-based detections for every image in paths to emit(path, boxes, scores, labels)"""
+    for path in paths:
+        _, images = load_images([path])
+        if not images:
+            continue
+
+        boxes, scores, labels = predictor.tiled_text_based_detection(
+            images[0], queries, tile_size=args.tile_size, overlap=args.tile_overlap, batch_size=args.batch_size
+        )
+        emit(path, boxes, scores, labels)
+
+
+def run_text_detection(predictor, paths, queries, args, emit):
+    """Stream text-based detections for every image in paths to emit through the pipelined runner"""
+    from models.pipeline import PipelineRunner
+
+    runner = PipelineRunner(
+        predictor,
+        queries,
+        batch_size=args.batch_size,
+        decode_workers=args.decode_workers,
+        render_workers=args.render_workers,
+        queue_depth=args.queue_depth,
+        save_dir=args.save_dir,
+        on_result=emit,
+        fast_decode=args.fast_decode,
+    )
+    report = runner.run(paths)
+
+    print("---| PIPELINE STAGE LATENCY |---")
+    for stage, summary in report.items():
+        print(f"{stage:>12}: {summary}")
+
+
+def run_sharded_detection(paths, queries, args, emit):
+    """Stream text-based detections for every image in paths to emit from a pool of worker processes"""
+    from models.sharded_runner import ShardedRunner
+
+    runner = ShardedRunner(
+        args.model,
+        queries,
+        workers=args.workers,
+        threads_per_worker=args.threads_per_worker,
+        precision=args.precision,
+        batch_size=args.batch_size,
+        fast_load_dir=args.fast_load_dir,
+        save_dir=args.save_dir,
+        onnx_dir=args.onnx_dir if args.backend == "onnx" else None,
+    )
+    report = runner.run(paths, on_result=emit)
+    print(f"---| {report['workers']} workers x {report['threads_per_worker']} threads: "
+          f"{report['images_per_sec']} images/sec |---")
+
+
+def run_image_detection(predictor, paths, reference, emit):
+    """Stream image-guided detections of the reference crop for every image in paths to emit"""
+    for path in paths:
+        _, images = load_images([path])
+        if not images:
+            continue
+
+        boxes, scores, labels = predictor.image_based_detection(images[0], reference, target_key=path)
+        emit(path, boxes, scores, labels)
+
+
+def run_multi_query_detection(predictor, paths, queries, references, emit):
+    """Stream detections of text queries and labelled reference crops, fused per image, to emit"""
+    for path in paths:
+        _, images = load_images([path])
+        if not images:
+            continue
+
+        boxes, scores, labels = predictor.multi_query_detection(images[0], queries, references, target_key=path)
+        emit(path, boxes, scores, labels)
+
+
+def detect(args):
+    """Run the `detect` command"""
+    if args.queries is None and args.reference is None:
+        raise SystemExit("detect: give --queries, --reference or both")
+    if args.reference_bbox is not None and len(args.reference or []) != 1:
+        raise SystemExit("detect: --reference-bbox needs exactly one --reference")
+    if args.tile_size is not None and args.tile_overlap >= args.tile_size:
+        raise SystemExit("detect: --tile-overlap must be smaller than --tile-size")
+    if args.backend == "onnx" and args.onnx_dir is None:
+        raise SystemExit("detect: --backend onnx needs --onnx-dir (see the export command)")
+    if args.fast_decode and (args.reference is not None or args.tile_size is not None or args.workers > 1):
+        raise SystemExit("detect: --fast-decode only applies to the text mode pipeline (no --tile-size, --workers 1)")
+    if args.fast_decode and args.save_dir is not None:
+        raise SystemExit("detect: --fast-decode cannot be combined with --save-dir, images are decoded at reduced size")
+    if args.memory_budget is not None and args.workers > 1:
+        raise SystemExit("detect: --memory-budget applies to a single process, give each worker its own limit instead")
+
+    paths = list_image_paths(args.input)
+    if not paths:
+        raise SystemExit(f"detect: no images found for {args.input!r}")
+
+    from models.result_store import ResultWriter
+
+    queries = parse_queries(args.queries) if args.queries is not None else []
+    if args.queries is not None and not queries:
+        raise SystemExit("detect: --queries must contain at least one query")
+    # one reference alone is plain image-guided detection, anything more is fused into one pass per image
+    if args.reference is None:
+        mode = "text"
+    elif len(args.reference) == 1 and not queries:
+        mode = "image"
+    else:
+        mode = "multi"
+    sharded = mode == "text" and args.tile_size is None and args.workers > 1
+
+    references = {}
+    for label, path in args.reference or []:
+        reference = load_image_by_path(path)
+        if args.reference_bbox is not None:
+            reference = reference.crop(args.reference_bbox)
+        references.setdefault(label, []).append(reference)
+
+    predictor = memory_budget = None
+    if not sharded:
+        # the model is loaded once for the whole run; sharded workers load (or inherit) their own,
+        # and the parent must not start ONNX Runtime thread pools before forking them
+        from models.model_loader import MODEL_REGISTRY, get_model_loader
+        from models.modelpredictor import ModelPredictor
+
+        if args.fast_load_dir is not None:
+            MODEL_REGISTRY.fast_load_dir = args.fast_load_dir
+        model, processor = get_model_loader(args.model, args.precision).get_components()
+        backend = None
+        if args.backend == "onnx":
+            from models.backends import OnnxRuntimeBackend
+            backend = OnnxRuntimeBackend(args.onnx_dir)
+        if args.memory_budget is not None:
+            from utils.memory import MemoryBudget
+            # measured now, the loaded model is the baseline the budget's headroom starts from
+            memory_budget = MemoryBudget(args.memory_budget)
+        predictor = ModelPredictor(model, processor, backend=backend, memory_budget=memory_budget)
+
+    start_metrics(args)
+    writer = ResultWriter(args.results_dir) if args.results_dir is not None else None
+    with open(args.out, "w", encoding="utf-8") as out:
+        def emit(path, boxes, scores, labels):
+            out.write(json.dumps(detection_record(path, boxes, scores, labels, mode)) + "\n")
+            out.flush()
+            if writer is not None:
+                writer.write(path, boxes, scores, labels, queries=queries + list(references), mode=mode)
+
+        try:
+            if mode == "image":
+                run_image_detection(predictor, paths, next(iter(references.values()))[0], emit)
+            elif mode == "multi":
+                run_multi_query_detection(predictor, paths, queries, references, emit)
+            elif args.tile_size is not None:
+                run_tiled_detection(predictor, paths, queries, args, emit)
+            elif sharded:
+                run_sharded_detection(paths, queries, args, emit)
+            else:
+                run_text_detection(predictor, paths, queries, args, emit)
+        finally:
+            if writer is not None:
+                writer.close()
+            if predictor is not None:
+                # sharded workers save their own query embeddings
+                predictor.query_cache.flush()
+
+    finish_metrics(args)
+    if memory_budget is not None:
+        print(f"---| MEMORY BUDGET: {memory_budget.summary()} |---")
+    print(f"---| {len(paths)} images processed, results written to {args.out} |---")
+
+
+def export(args):
+    """Run the `export` command: write ONNX graphs of the towers and heads"""
+    from models.backends import export_onnx
+    from models.model_loader import MODEL_LOADERS
+
+    model, processor = MODEL_LOADERS[args.model](model_path=args.model_dir, precision="fp32").get_components()
+    paths = export_onnx(model, processor, args.out, opset=args.opset)
+    print(f"---| {len(paths)} ONNX graphs written to {args.out} |---")
+
+
+def render(args):
+    """Run the `render` command: re-render stored detections without running the model"""
+    from models.result_store import ResultReader
+    from utils.visualization import render_detections, save_image
+
+    reader = ResultReader(args.results_dir)
+    if not len(reader):
+        raise SystemExit(f"render: no results found in {args.results_dir!r}")
+
+    os.makedirs(args.save_dir, exist_ok=True)
+    for path in reader.images():
+        boxes, scores, labels = reader.get(path, query=args.query, threshold=args.threshold)
+        try:
+            image = load_image_by_path(path)
+        except OSError as error:
+            print(f"Skipping {path}: {error}", file=sys.stderr)
+            continue
+        annotated = render_detections(image, boxes, scores, labels, in_place=True)
+        save_image(annotated, os.path.join(args.save_dir, os.path.basename(path)))
+
+    print(f"---| {len(reader)} images rendered to {args.save_dir} |---")
+
+
+def load_gallery(args, required=True):
+    """Open the gallery index in args.index; None if there is none yet and it is not required"""
+    from models.gallery import INDEX_FILE, GalleryIndex
+
+    if os.path.exists(os.path.join(args.index, INDEX_FILE)):
+        return GalleryIndex.load(args.index)
+    if not required:
+        return None
+    raise SystemExit(f"gallery: no index found in {args.index!r}, build one with `gallery add`")
+
+
+def gallery_predictor(args, gallery):
+    """Load the model of a gallery command and check it matches the index"""
+    from models.model_loader import get_model_loader
+    from models.modelpredictor import ModelPredictor
+
+    model, processor = get_model_loader(args.model, args.precision).get_components()
+    predictor = ModelPredictor(model, processor)
+    if gallery is not None and gallery.model_name != predictor.model_name:
+        raise SystemExit(f"gallery: {args.index!r} was built with {gallery.model_name}, "
+                         f"not {predictor.model_name} (--model / --precision)")
+    return predictor
+
+
+def gallery(args):
+    """Run the `gallery` command: index images, remove them or search them with a reference crop"""
+    from models.gallery import GalleryIndex
+
+    if args.action == "remove":
+        index = load_gallery(args)
+        missing = [key for key in args.images if key not in index]
+        for key in args.images:
+            if key in index:
+                index.remove(key)
+        index.save(args.index)
+        for key in missing:
+            print(f"Not in the gallery: {key}", file=sys.stderr)
+        print(f"---| {len(args.images) - len(missing)} images removed, {len(index)} left in {args.index} |---")
+        return
+
+    if args.action == "add":
+        paths = list_image_paths(args.input)
+        if not paths:
+            raise SystemExit(f"gallery: no images found for {args.input!r}")
+        index = load_gallery(args, required=False)
+        predictor = gallery_predictor(args, index)
+        if index is None:
+            index = GalleryIndex(predictor.model_name)
+
+        start_metrics(args)
+        # the backbone runs once per image, only the selected box vectors are kept
+        for start in range(0, len(paths), args.batch_size):
+            batch_paths, images = load_images(paths[start:start + args.batch_size])
+            predictor.add_to_gallery(index, images, batch_paths, batch_size=args.batch_size,
+                                     boxes_per_image=args.boxes_per_image)
+        if args.train:
+            index.train(lists=args.lists)
+        index.save(args.index)
+        finish_metrics(args)
+        print(f"---| {len(paths)} images indexed, {index.stats()} |---")
+        return
+
+    index = load_gallery(args)
+    if args.reference is not None:
+        reference = load_image_by_path(args.reference)
+        if args.reference_bbox is not None:
+            reference = reference.crop(args.reference_bbox)
+    else:
+        # matplotlib is only needed for the interactive cropper
+        from utils.object_cropper import target_object_cropper
+        reference = target_object_cropper(args.crop)
+    predictor = gallery_predictor(args, index)
+
+    start_metrics(args)
+    matches = predictor.search_gallery(index, reference, top_k=args.top_k, threshold=args.threshold,
+                                       nprobe=args.nprobe)
+    predictor.query_cache.flush()
+    finish_metrics(args)
+    with open(args.out, "w", encoding="utf-8") as out:
+        for key, boxes, scores in matches:
+            out.write(json.dumps(detection_record(key, boxes, scores, None, "image")) + "\n")
+    for key, _, scores in matches:
+        print(f"{float(scores[0]):.3f}  {len(scores):>3} boxes  {key}")
+    print(f"---| {len(matches)} matching images of {len(index)}, results written to {args.out} |---")
+
+
+def video(args):
+    """Run the `video` command"""
+    queries = parse_queries(args.queries)
+    if not queries:
+        raise SystemExit("video: --queries must contain at least one query")
+
+    from models.model_loader import get_model_loader
+    from models.modelpredictor import ModelPredictor
+    from models.video_detector import VideoDetector
+
+    model, processor = get_model_loader(args.model, args.precision).get_components()
+    predictor = ModelPredictor(model, processor)
+    detector = VideoDetector(
+        predictor,
+        queries,
+        stride=args.stride,
+        scene_threshold=args.scene_threshold,
+        batch_size=args.batch_size,
+    )
+    start_metrics(args)
+    try:
+        summary = detector.run(args.input, output_video=args.out_video, output_json=args.out_json)
+    finally:
+        predictor.query_cache.flush()
+    finish_metrics(args)
+
+    print(f"---| {summary['frames']} frames, {summary['detected_frames']} detected, "
+          f"{summary['reused_frames']} reused, {summary['fps']} frames/sec |---")
+
+
+def build_parser():
+    """Build the argument parser for all sub-commands"""
+    parser = argparse.ArgumentParser(
+        prog="python -m queryvision",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    detect_parser = commands.add_parser("detect", help="detect objects in a directory or glob of images")
+    detect_parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    detect_parser.add_argument("--input", required=True, help="image directory, glob pattern or single image")
+    detect_parser.add_argument("--out", required=True, help="JSONL file receiving one record per image")
+    detect_parser.add_argument("--queries", help='comma-separated text queries, e.g. "coin,box"')
+    detect_parser.add_argument("--reference", type=parse_reference, action="append",
+                               help="reference image for image-guided detection, as path or label=path; repeat it "
+                                    "for several objects (crops sharing a label are averaged) or combine it with "
+                                    "--queries, all are scored in one pass per image")
+    detect_parser.add_argument("--reference-bbox", type=parse_bbox,
+                               help="crop of the reference image as xmin,ymin,xmax,ymax")
+    detect_parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    detect_parser.add_argument("--fast-load-dir", help="directory for safetensors model copies used for fast start")
+    detect_parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                               help="run the towers and heads eagerly or with ONNX Runtime (CPU)")
+    detect_parser.add_argument("--onnx-dir", help="directory written by the export command (--backend onnx)")
+    detect_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    detect_parser.add_argument("--decode-workers", type=int, default=PIPELINE_DECODE_WORKERS,
+                               help="threads decoding and preprocessing images (text mode)")
+    detect_parser.add_argument("--render-workers", type=int, default=PIPELINE_RENDER_WORKERS,
+                               help="threads annotating and saving results (text mode)")
+    detect_parser.add_argument("--queue-depth", type=int, default=PIPELINE_QUEUE_DEPTH,
+                               help="images allowed to wait between two pipeline stages")
+    detect_parser.add_argument("--workers", type=int, default=SHARD_WORKERS,
+                               help="worker processes, each with its own model (text mode)")
+    detect_parser.add_argument("--threads-per-worker", type=int,
+                               help="torch threads per worker process, CPU cores / workers by default")
+    detect_parser.add_argument("--save-dir", help="directory for annotated images (text mode)")
+    detect_parser.add_argument("--results-dir",
+                               help="also store detections in this columnar result directory (see `render`)")
+    detect_parser.add_argument("--tile-size", type=int,
+                               help="detect on overlapping tiles of this size, for high-resolution images (text mode)")
+    detect_parser.add_argument("--tile-overlap", type=int, default=TILE_OVERLAP)
+    detect_parser.add_argument("--fast-decode", action="store_true",
+                               help="decode JPEGs at reduced size, only as large as the model input (text mode)")
+    detect_parser.add_argument("--memory-budget", type=float, default=MEMORY_BUDGET_MB, metavar="MB",
+                               help="keep resident memory under this many MB: caps the batch size and the images "
+                                    "in flight, reuses input buffers (single process)")
+    # with --workers > 1 the model runs in the worker processes, only the parent's stages are recorded
+    add_metrics_arguments(detect_parser)
+    detect_parser.set_defaults(func=detect)
+
+    video_parser = commands.add_parser("video", help="detect objects in a video file or webcam stream")
+    video_parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    video_parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    video_parser.add_argument("--input", required=True, help="video file, stream URL or webcam index")
+    video_parser.add_argument("--queries", required=True, help='comma-separated text queries, e.g. "person,car"')
+    video_parser.add_argument("--out-video", help="annotated output video (.mp4)")
+    video_parser.add_argument("--out-json", help="JSONL file receiving one record per frame")
+    video_parser.add_argument("--stride", type=int, default=VIDEO_STRIDE, help="run the model at most every N frames")
+    video_parser.add_argument("--scene-threshold", type=float, default=VIDEO_SCENE_THRESHOLD,
+                              help="frame change (0-255) needed to re-run the model, 0 disables reuse")
+    video_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    add_metrics_arguments(video_parser)
+    video_parser.set_defaults(func=video)
+
+    export_parser = commands.add_parser("export", help="export the model as ONNX graphs for the onnx backend")
+    export_parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    export_parser.add_argument("--model-dir", help="local model directory, e.g. a fast-load copy")
+    export_parser.add_argument("--out", required=True, help="output directory for the graphs")
+    export_parser.add_argument("--opset", type=int, default=ONNX_OPSET)
+    export_parser.set_defaults(func=export)
+
+    render_parser = commands.add_parser("render", help="re-render stored detections without running the model")
+    render_parser.add_argument("--results-dir", required=True, help="result directory written by detect --results-dir")
+    render_parser.add_argument("--save-dir", required=True, help="directory for annotated images")
+    render_parser.add_argument("--threshold", type=float, help="only draw detections scoring above this value")
+    render_parser.add_argument("--query", help="only draw detections of this text query")
+    render_parser.set_defaults(func=render)
+
+    gallery_parser = commands.add_parser("gallery", help="index many images and search them with a reference crop")
+    gallery_parser.set_defaults(func=gallery)
+    actions = gallery_parser.add_subparsers(dest="action", required=True)
+    add_parser = actions.add_parser("add", help="add images to the index (created if missing)")
+    remove_parser = actions.add_parser("remove", help="remove images from the index")
+    search_parser = actions.add_parser("search", help="find the indexed images containing a reference object")
+    for action_parser in (add_parser, remove_parser, search_parser):
+        action_parser.add_argument("--index", required=True, help="gallery index directory")
+    for action_parser in (add_parser, search_parser):
+        action_parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+        action_parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+        add_metrics_arguments(action_parser)
+    remove_parser.add_argument("--images", nargs="+", required=True, help="keys (paths) of the images to remove")
+    add_parser.add_argument("--input", required=True, help="image directory, glob pattern or single image")
+    add_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    add_parser.add_argument("--boxes-per-image", type=int, default=GALLERY_BOXES_PER_IMAGE,
+                            help="box embeddings kept per image, the most object-like ones")
+    add_parser.add_argument("--train", action="store_true",
+                            help="(re)build the IVF lists after adding, for approximate search of large galleries")
+    add_parser.add_argument("--lists", type=int, default=GALLERY_IVF_LISTS, help="IVF lists built by --train")
+    reference = search_parser.add_mutually_exclusive_group(required=True)
+    reference.add_argument("--reference", help="reference image of the object")
+    reference.add_argument("--crop", help="image to crop the reference object from interactively")
+    search_parser.add_argument("--reference-bbox", type=parse_bbox,
+                               help="crop of --reference holding the object, xmin,ymin,xmax,ymax")
+    search_parser.add_argument("--out", required=True, help="JSONL file receiving one record per matching image")
+    search_parser.add_argument("--top-k", type=int, default=GALLERY_TOP_K, help="maximum images returned")
+    search_parser.add_argument("--threshold", type=float, default=IMAGE_BASED_SCORE_THRESHOLD)
+    search_parser.add_argument("--nprobe", type=int, help="IVF lists scanned, more is slower and closer to exact")
+
+    add_serve_parser(commands)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
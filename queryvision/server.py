@@ -0,0 +1,110 @@
+"""
+Local inference server for text-guided and image-guided detection
+
+Concurrent requests are merged into micro-batches by models.micro_batcher.
+The gradio app exposes a browser UI and the HTTP API endpoints
+/detect_text, /detect_image and /stats; --metrics-port additionally serves
+Prometheus metrics of every pipeline stage.
+"""
+import os
+
+from config.constants import MODEL_NAMES, PRECISION, PRECISIONS, SERVER_MAX_BATCH_SIZE, SERVER_BATCH_WINDOW_MS
+from utils.metrics import METRICS, add_metrics_arguments, finish_metrics, start_metrics
+from utils.user_input import parse_queries
+
+
+def detections_to_json(boxes, scores, labels):
+    """Convert predictor output into a JSON-serializable dict"""
+    return {
+        "boxes": [[round(value, 2) for value in box] for box in boxes.tolist()],
+        "scores": [round(score, 4) for score in scores.tolist()],
+        "labels": labels,
+    }
+
+
+def build_app(batcher, concurrency_limit):
+    """Build the gradio Blocks app around a MicroBatcher"""
+    import gradio as gr
+    from utils.visualization import render_detections
+
+    def detect_text(image, queries):
+        texts = parse_queries(queries or "")
+        if image is None or not texts:
+            raise gr.Error("An image and at least one query are required")
+        boxes, scores, labels = batcher.detect_text(image.convert("RGB"), texts)
+        return render_detections(image, boxes, scores, labels), detections_to_json(boxes, scores, labels)
+
+    def detect_image(target_image, source_image):
+        if target_image is None or source_image is None:
+            raise gr.Error("A target image and a reference crop are required")
+        boxes, scores, labels = batcher.detect_image(target_image.convert("RGB"), source_image.convert("RGB"))
+        return render_detections(target_image, boxes, scores, labels), detections_to_json(boxes, scores, labels)
+
+    with gr.Blocks(title="QueryVision") as app:
+        with gr.Tab("Text-based detection"):
+            with gr.Row():
+                text_image = gr.Image(type="pil", label="Image")
+                text_result = gr.Image(type="pil", label="Detections")
+            queries = gr.Textbox(label="Queries (comma-separated)", placeholder="coin, box")
+            text_json = gr.JSON(label="Boxes")
+            gr.Button("Detect").click(
+                detect_text, [text_image, queries], [text_result, text_json],
+                api_name="detect_text", concurrency_limit=concurrency_limit
+            )
+
+        with gr.Tab("Image-based detection"):
+            with gr.Row():
+                target_image = gr.Image(type="pil", label="Target image")
+                source_image = gr.Image(type="pil", label="Reference crop")
+                image_result = gr.Image(type="pil", label="Detections")
+            image_json = gr.JSON(label="Boxes")
+            gr.Button("Detect").click(
+                detect_image, [target_image, source_image], [image_result, image_json],
+                api_name="detect_image", concurrency_limit=concurrency_limit
+            )
+
+        with gr.Tab("Stats"):
+            stats = gr.JSON(label="Queue wait, batch size, latency and stage metrics")
+            gr.Button("Refresh").click(
+                lambda: {**batcher.report(), "metrics": METRICS.snapshot()}, None, stats, api_name="stats"
+            )
+
+    return app
+
+
+def serve(args):
+    """Run the `serve` command"""
+    # stay offline: no gradio analytics, and --model-dir loads without touching the hub
+    os.environ.setdefault("GRADIO_ANALYTICS_ENABLED", "False")
+
+    from models.micro_batcher import MicroBatcher
+    from models.model_loader import MODEL_LOADERS
+    from models.modelpredictor import ModelPredictor
+
+    model, processor = MODEL_LOADERS[args.model](model_path=args.model_dir, precision=args.precision).get_components()
+    predictor = ModelPredictor(model, processor)
+    batcher = MicroBatcher(predictor, max_batch_size=args.max_batch_size, max_wait_ms=args.batch_window_ms)
+
+    # let enough requests through concurrently to fill a batch
+    app = build_app(batcher, concurrency_limit=2 * args.max_batch_size)
+    app.queue(default_concurrency_limit=2 * args.max_batch_size)
+    start_metrics(args)
+    try:
+        app.launch(server_name=args.host, server_port=args.port)
+    finally:
+        predictor.query_cache.flush()
+        finish_metrics(args)
+
+
+def add_serve_parser(commands):
+    """Register the `serve` sub-command"""
+    serve_parser = commands.add_parser("serve", help="run the local inference server")
+    serve_parser.add_argument("--model", choices=MODEL_NAMES, default="owlv2")
+    serve_parser.add_argument("--model-dir", help="local model directory, e.g. a fast-load copy")
+    serve_parser.add_argument("--precision", choices=PRECISIONS, default=PRECISION)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=7860)
+    serve_parser.add_argument("--max-batch-size", type=int, default=SERVER_MAX_BATCH_SIZE)
+    serve_parser.add_argument("--batch-window-ms", type=float, default=SERVER_BATCH_WINDOW_MS)
+    add_metrics_arguments(serve_parser)
+    serve_parser.set_defaults(func=serve)
@@ -2,7 +2,7 @@ from models.model_loader import Owlv2ModelLoader, OwlvitModelLoader
 from models.modelpredictor import ModelPredictor
 from utils.image_utils import load_image_by_path
 from utils.object_cropper import target_object_cropper
-from utils.visualization import plot, annotate_image, display_result
+from utils.visualization import plot_detection, display_result
 import easygui
 
 def choose_model():
@@ -95,7 +95,7 @@ def detection_by_text(IMAGE_PATH = None, TEXT_QUERIES = None):
     
     # Visualize detections
     print("---|>Visualizing detections<|---")
-    image = annotate_image(image, boxes, scores, labels, show_labels=True)
+    image = plot_detection(image, boxes, scores, labels, show_labels=True)
     display_result(image, save=True)
     print("---|>Detection completed<|---") 
    
@@ -126,7 +126,7 @@ def detection_by_image(TARGET_IMAGE = None, SOURCE_IMAGE = None):
     
     # Visualize detections
     print("---|>Visualizing detections<|---")
-    plot(target_image, boxes, scores, labels, show_labels=True)
+    display_result(plot_detection(target_image, boxes, scores, labels, show_labels=True), save=True)
 
 def main():
     chose_task()
@@ -1,11 +1,43 @@
+import glob
+import os
 from PIL import Image
+from utils.metrics import METRICS
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif")
+
+@METRICS.timer("decode")
 def load_image_by_path(image_path):
     """Load image in RGB format from a file path"""
     image = Image.open(image_path)
+    # decode here rather than lazily on first use, so the time is charged to this stage
+    image.load()
     if image.mode != "RGB":
         image = image.convert("RGB")
         
     # print(type(image))
     return image
 
+def list_image_paths(source, extensions=IMAGE_EXTENSIONS):
+    """
+    Return sorted image paths from a directory (searched recursively), a glob pattern or a single file
+    
+    Args:
+        source: Directory, glob pattern (e.g. "frames/*.jpg") or image path
+        extensions: File extensions accepted when walking a directory
+    
+    Returns:
+        List of image file paths
+    """
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names
+            if name.lower().endswith(extensions)
+        ]
+    elif os.path.isfile(source):
+        paths = [source]
+    else:
+        paths = [path for path in glob.glob(source, recursive=True) if os.path.isfile(path)]
+    
+    return sorted(paths)
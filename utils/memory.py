@@ -0,0 +1,131 @@
+"""
+Process memory readings and the memory budget of a detection run
+
+A MemoryBudget is created once the model is loaded: the resident size at
+that point is the baseline, and the headroom up to the limit is split
+between forward-pass activations (which bound the batch size) and images
+in flight between pipeline stages.
+"""
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+
+from config.constants import MEMORY_ACTIVATION_SHARE
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):  # Windows
+    _PAGE_SIZE = None
+
+_libc = None
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        _libc.malloc_trim  # glibc only
+    except (OSError, TypeError, AttributeError):
+        _libc = None
+
+
+def current_rss():
+    """Return the current resident memory of the process in bytes, None where /proc is unavailable"""
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def trim_heap():
+    """Hand freed heap pages back to the OS (glibc), so RSS follows the memory actually in use"""
+    if _libc is not None:
+        _libc.malloc_trim(0)
+
+
+class MemoryBudget:
+    """
+    Cap the resident memory of a detection run
+
+    plan() turns the model's per-image activation estimate into the largest
+    batch size whose activations fit in MEMORY_ACTIVATION_SHARE of the
+    headroom; the rest bounds the bytes of decoded images and pixel values
+    in flight (acquire / release, blocking). A single image is always let
+    through, so one oversized image slows the run down instead of stalling it.
+    """
+    def __init__(self, limit_mb, activation_share=MEMORY_ACTIVATION_SHARE):
+        """
+        Args:
+            limit_mb: Resident memory the process should stay under, in MB
+            activation_share: Share of the headroom above the loaded model given to activations
+        """
+        self.limit = int(limit_mb * 2 ** 20)
+        self.activation_share = activation_share
+        self.baseline = current_rss() or 0
+        self.batch_size = None
+        self.in_flight_limit = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def headroom(self):
+        return max(0, self.limit - self.baseline)
+
+    def plan(self, image_bytes, batch_size=None):
+        """
+        Size batches and the in-flight allowance for a model
+
+        Args:
+            image_bytes: Estimated peak activation bytes of one image in a forward pass
+            batch_size: Requested batch size, an upper bound
+
+        Returns:
+            Images per forward pass, at least 1
+        """
+        fit = int(self.headroom * self.activation_share // max(image_bytes, 1))
+        if fit < 1:
+            print(f"Memory budget of {self.limit / 2 ** 20:.0f} MB leaves {self.headroom / 2 ** 20:.0f} MB above "
+                  f"the loaded model, one image needs about {image_bytes / 2 ** 20:.0f} MB", file=sys.stderr)
+        self.batch_size = max(1, min(fit, batch_size or fit))
+        self.in_flight_limit = max(0, self.headroom - self.batch_size * image_bytes)
+        print(f"---| Memory budget {self.limit / 2 ** 20:.0f} MB: model at {self.baseline / 2 ** 20:.0f} MB, "
+              f"batches of {self.batch_size}, {self.in_flight_limit / 2 ** 20:.0f} MB for images in flight |---")
+        return self.batch_size
+
+    def acquire(self, nbytes, timeout=None):
+        """
+        Block until nbytes more fit in the in-flight allowance (always granted when nothing is in flight)
+
+        Returns:
+            False if timeout seconds passed first, nothing is reserved then
+        """
+        with self._condition:
+            if self.in_flight_limit is not None:
+                if not self._condition.wait_for(lambda: self.in_flight == 0
+                                                or self.in_flight + nbytes <= self.in_flight_limit, timeout):
+                    return False
+            self.in_flight += nbytes
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return True
+
+    def release(self, nbytes):
+        with self._condition:
+            self.in_flight -= nbytes
+            self._condition.notify_all()
+
+    def summary(self):
+        """Return the budget, its plan and the observed peaks in MB"""
+        from utils.metrics import METRICS
+
+        megabytes = lambda value: None if value is None else round(value / 2 ** 20, 1)  # noqa: E731
+        return {
+            "limit_mb": megabytes(self.limit),
+            "baseline_mb": megabytes(self.baseline),
+            "batch_size": self.batch_size,
+            "in_flight_limit_mb": megabytes(self.in_flight_limit),
+            "peak_in_flight_mb": megabytes(self.peak_in_flight),
+            "peak_rss_mb": megabytes(METRICS.memory().get("peak_rss_bytes")),
+        }
@@ -0,0 +1,400 @@
+"""
+Process-wide stage timers, counters and memory high-water marks
+
+ModelPredictor, image loading and rendering record into the METRICS
+singleton. The values are read as a dict (METRICS.snapshot()), in the
+Prometheus text format (METRICS.prometheus(), also served over HTTP by
+METRICS.serve) or captured as torch.profiler traces for a number of
+requests (METRICS.start_profile).
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from config.constants import METRICS_WINDOW, PROFILE_REQUESTS
+from utils.memory import current_rss
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+QUANTILES = (0.5, 0.95, 0.99)
+# stages that run the model on the inference thread: only these synchronize CUDA and sample memory,
+# decode / render / save run on worker threads and must not wait for the GPU
+MODEL_STAGES = frozenset(("text_encode", "vision_encode", "heads", "postprocess", "gallery_search"))
+
+
+def peak_rss():
+    """Return the resident memory high-water mark of the process in bytes, None where unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageStats:
+    """Thread-safe latency and resident memory recorder for one pipeline stage"""
+    def __init__(self, name, window=METRICS_WINDOW):
+        """
+        Args:
+            name: Stage name
+            window: Latest durations kept for the percentiles, count / total / max cover every call
+        """
+        self.name = name
+        self._durations = deque(maxlen=window)
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._rss = None
+        self._peak_growth = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds, rss=None, peak_growth=None):
+        """
+        Args:
+            seconds: Duration of one call
+            rss: Resident bytes of the process when the call ended
+            peak_growth: Bytes the call raised the process high-water mark by
+        """
+        with self._lock:
+            self._durations.append(seconds)
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+            if rss is not None:
+                self._rss = max(self._rss or 0, rss)
+            if peak_growth is not None:
+                self._peak_growth = max(self._peak_growth or 0, peak_growth)
+
+    def memory(self):
+        """Return (largest resident bytes after a call, largest high-water growth of a call), None if unrecorded"""
+        with self._lock:
+            return self._rss, self._peak_growth
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return {quantile: seconds} over the recent window"""
+        with self._lock:
+            durations = sorted(self._durations)
+        if not durations:
+            return {}
+        return {q: durations[min(len(durations) - 1, int(q * len(durations)))] for q in quantiles}
+
+    def totals(self):
+        """Return (count, total seconds, max seconds) over every recorded call"""
+        with self._lock:
+            return self._count, self._total, self._max
+
+    def summary(self):
+        """Return count and latency percentiles in milliseconds, resident memory in MB when recorded"""
+        count, total, longest = self.totals()
+        if not count:
+            return {"count": 0}
+
+        quantiles = self.quantiles()
+        summary = {
+            "count": count,
+            "total_s": round(total, 3),
+            "mean_ms": round(1000 * total / count, 2),
+            "p50_ms": round(1000 * quantiles[0.5], 2),
+            "p95_ms": round(1000 * quantiles[0.95], 2),
+            "p99_ms": round(1000 * quantiles[0.99], 2),
+            "max_ms": round(1000 * longest, 2),
+        }
+        rss, peak_growth = self.memory()
+        if rss is not None:
+            summary["rss_mb"] = round(rss / 2 ** 20, 1)
+        if peak_growth is not None:
+            summary["peak_rss_growth_mb"] = round(peak_growth / 2 ** 20, 1)
+        return summary
+
+
+def _synchronize_cuda():
+    """Wait for queued CUDA kernels so a stage is not charged for the previous one's work"""
+    # never import torch from here, only sync when the caller already put work on the GPU
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_initialized():
+        torch.cuda.synchronize()
+
+
+class Metrics:
+    """
+    Stage timers, counters and memory high-water marks of one process
+
+    Stages are recorded with `with METRICS.timer("preprocess"): ...`,
+    counters with METRICS.count("images", n). Model stages (MODEL_STAGES)
+    also note the resident memory they ended at and how far they pushed the
+    process high-water mark (peak RSS per stage). Top-level detection calls are
+    wrapped in METRICS.request(), which counts requests and drives the
+    opt-in torch.profiler capture.
+    """
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self._stages = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profile = None
+        self._server = None
+
+    def stage(self, name):
+        """Return the StageStats of a stage, creating it on first use"""
+        stats = self._stages.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self._stages.setdefault(name, StageStats(name, self.window))
+        return stats
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body as one call of stage `name` (shown as a labelled range in profiler traces)
+
+        Only model stages wait for queued CUDA kernels and read the resident
+        memory; the readings are process-wide, so a model stage may still be
+        charged for memory a decode or render thread allocated meanwhile.
+        """
+        profiling = self._profile is not None and self._profile["profiler"] is not None
+        if profiling:
+            from torch.profiler import record_function
+            label = record_function(name)
+            label.__enter__()
+        model_stage = name in MODEL_STAGES
+        if model_stage:
+            _synchronize_cuda()
+            peak_before = peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if model_stage:
+                _synchronize_cuda()
+            elapsed = time.perf_counter() - start
+            if model_stage:
+                self.stage(name).record(elapsed, rss=current_rss(),
+                                        peak_growth=None if peak_before is None else peak_rss() - peak_before)
+            else:
+                self.stage(name).record(elapsed)
+            if profiling:
+                label.__exit__(None, None, None)
+
+    def count(self, name, value=1):
+        """Add value to counter `name`"""
+        with self._lock:
+            self._counters[name] += value
+
+    @contextmanager
+    def request(self):
+        """
+        Mark one top-level detection call
+
+        Nested calls (e.g. a batch call running a pixel-level call) count once.
+        While a profile is armed, the first request starts torch.profiler and
+        the trace is written when the requested number has finished.
+        """
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        outermost = depth == 0
+        if outermost:
+            self.count("requests")
+            self._profile_enter()
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+            if outermost:
+                self._profile_exit()
+
+    def memory(self):
+        """Return peak resident memory of the process and peak CUDA memory, in bytes"""
+        memory = {}
+        if resource is not None:
+            memory["peak_rss_bytes"] = peak_rss()
+        rss = current_rss()
+        if rss is not None:
+            memory["rss_bytes"] = rss
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_initialized():
+            memory["cuda_peak_allocated_bytes"] = torch.cuda.max_memory_allocated()
+            memory["cuda_peak_reserved_bytes"] = torch.cuda.max_memory_reserved()
+        return memory
+
+    def snapshot(self):
+        """Return stages, counters and memory as a JSON-serializable dict"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+        return {
+            "stages": {name: stats.summary() for name, stats in sorted(stages.items())},
+            "counters": dict(sorted(counters.items())),
+            "memory": self.memory(),
+        }
+
+    def prometheus(self, prefix="queryvision"):
+        """Return the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            stages = dict(self._stages)
+            counters = dict(self._counters)
+
+        lines = [f"# HELP {prefix}_stage_seconds Latency of one pipeline stage call",
+                 f"# TYPE {prefix}_stage_seconds summary"]
+        for name, stats in sorted(stages.items()):
+            for quantile, seconds in stats.quantiles().items():
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{quantile}"}} {seconds:.6f}')
+            count, total, _ = stats.totals()
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {count}')
+
+        lines += [f"# HELP {prefix}_stage_rss_bytes Largest resident memory at the end of a stage call",
+                  f"# TYPE {prefix}_stage_rss_bytes gauge"]
+        growth = []
+        for name, stats in sorted(stages.items()):
+            rss, peak_growth = stats.memory()
+            if rss is not None:
+                lines.append(f'{prefix}_stage_rss_bytes{{stage="{name}"}} {rss}')
+            if peak_growth is not None:
+                growth.append(f'{prefix}_stage_peak_rss_growth_bytes{{stage="{name}"}} {peak_growth}')
+        lines += [f"# HELP {prefix}_stage_peak_rss_growth_bytes Largest rise of the peak resident memory in one stage call",
+                  f"# TYPE {prefix}_stage_peak_rss_growth_bytes gauge", *growth]
+
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+
+        for name, value in self.memory().items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Forget every stage and counter"""
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve /metrics (Prometheus text) and /metrics.json from a background thread
+
+        Returns:
+            The running ThreadingHTTPServer
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                payload = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        print(f"---| Metrics served on http://{host}:{self._server.server_port}/metrics |---")
+        return self._server
+
+    def start_profile(self, trace_dir, requests=PROFILE_REQUESTS):
+        """
+        Capture a torch.profiler trace of the next `requests` detection requests
+
+        The Chrome trace (open in chrome://tracing or Perfetto) and a table of
+        the most expensive operators are written to trace_dir.
+        """
+        os.makedirs(trace_dir, exist_ok=True)
+        with self._lock:
+            self._profile = {"dir": trace_dir, "remaining": requests, "profiler": None}
+
+    def _profile_enter(self):
+        if self._profile is None:
+            return
+        with self._lock:
+            profile = self._profile
+            if profile is None or profile["profiler"] is not None:
+                return
+            from torch.profiler import ProfilerActivity, profile as torch_profile
+            import torch
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+            profile["profiler"] = torch_profile(activities=activities, record_shapes=True, profile_memory=True)
+            profile["profiler"].__enter__()
+
+    def _profile_exit(self):
+        if self._profile is None:
+            return
+        with self._lock:
+            profile = self._profile
+            if profile is None or profile["profiler"] is None:
+                return
+            profile["remaining"] -= 1
+            if profile["remaining"] > 0:
+                return
+            self._profile = None
+        self._write_profile(profile)
+
+    def stop_profile(self):
+        """Write the trace of an unfinished capture (fewer requests than asked for ran)"""
+        with self._lock:
+            profile, self._profile = self._profile, None
+        if profile is not None and profile["profiler"] is not None:
+            self._write_profile(profile)
+
+    @staticmethod
+    def _write_profile(profile):
+        profiler = profile["profiler"]
+        profiler.__exit__(None, None, None)
+        stem = os.path.join(profile["dir"], f"trace-{os.getpid()}-{int(time.time())}")
+        profiler.export_chrome_trace(stem + ".json")
+        with open(stem + ".txt", "w", encoding="utf-8") as f:
+            f.write(profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=40))
+        print(f"---| Profiler trace written to {stem}.json |---")
+
+
+# process-wide instance, like MODEL_REGISTRY
+METRICS = Metrics()
+
+
+def add_metrics_arguments(parser):
+    """Register --metrics-out, --metrics-port, --profile-dir and --profile-requests on a sub-command"""
+    parser.add_argument("--metrics-out", help="write stage timings, counters and peak memory to this JSON file")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while running")
+    parser.add_argument("--profile-dir", help="write a torch.profiler trace of the first requests to this directory")
+    parser.add_argument("--profile-requests", type=int, default=PROFILE_REQUESTS,
+                        help="detection requests captured by --profile-dir")
+
+
+def start_metrics(args):
+    """Start the metrics endpoint and the profiler capture requested on the command line"""
+    if args.metrics_port is not None:
+        METRICS.serve(args.metrics_port)
+    if args.profile_dir is not None:
+        METRICS.start_profile(args.profile_dir, args.profile_requests)
+
+
+def finish_metrics(args):
+    """Write the metrics snapshot requested with --metrics-out and any unfinished profiler trace"""
+    METRICS.stop_profile()
+    if args.metrics_out is not None:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            json.dump(METRICS.snapshot(), f, indent=2)
+        print(f"---| Metrics written to {args.metrics_out} |---")
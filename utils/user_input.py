@@ -1,6 +1,7 @@
-from models.model_loader import Owlv2ModelLoader, OwlvitModelLoader
-
 def choose_model():
+    # transformers is only imported once a model is actually needed
+    from models.model_loader import get_model_loader
+
     while True:
         try:
             user_input = int(input("""Choose a model:\n1. OWLv2\n2. OWLvit\nEnter 1 or 2: """))
@@ -8,10 +9,10 @@ def choose_model():
             match user_input:
                 case 1:
                     print("---| OWLv2 MODEL CHOOSED |---")
-                    return Owlv2ModelLoader()
+                    return get_model_loader("owlv2")
                 case 2:
                     print("---| OWLvit MODEL CHOOSED |---")
-                    return OwlvitModelLoader()
+                    return get_model_loader("owlvit")
                 case _:
                     print("Invalid choice. Please select 1 or 2.")
         except ValueError:
@@ -35,11 +36,16 @@ def get_queries(prompt: str) -> list[str]:
             print("⚠️  Input must be a string. Please try again.")
             continue
 
-        # Split, strip, and filter out empty strings
-        items = [item.strip() for item in raw.split(",")]
-        items = [item for item in items if item]
+        items = parse_queries(raw)
 
         if not items:
             print("⚠️  You must enter at least one item. Please try again.")
         else:
-            return items
\ No newline at end of file
+            return items
+
+
+def parse_queries(raw: str) -> list[str]:
+    """Split a comma-separated string into stripped, non-empty queries"""
+    # Split, strip, and filter out empty strings
+    items = [item.strip() for item in raw.split(",")]
+    return [item for item in items if item]
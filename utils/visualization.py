@@ -1,10 +1,20 @@
-import matplotlib.pyplot as plt
-from PIL import ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 from datetime import datetime
+from functools import lru_cache
 import os
-
-def plot_detection(image, boxes, scores, labels=None, show_labels=True):
+import zlib
+from config.constants import JPEG_QUALITY
+from utils.metrics import METRICS
+
+# distinct, readable-on-white box colors; labels map onto it by a stable hash
+PALETTE = (
+    (230, 25, 75), (60, 180, 75), (0, 130, 200), (245, 130, 48), (145, 30, 180),
+    (70, 240, 240), (240, 50, 230), (210, 245, 60), (0, 128, 128), (170, 110, 40),
+    (128, 0, 0), (0, 0, 128), (128, 128, 0), (255, 105, 180), (90, 90, 90),
+)
+
+def plot_detection(image, boxes, scores, labels=None, show_labels=True, in_place=False):
     """
     Annotate image with bounding boxes and optional labels using PIL.
 
@@ -14,6 +24,7 @@ def plot_detection(image, boxes, scores, labels=None, show_labels=True):
         scores: Confidence scores
         labels: Text labels or None
         show_labels: Whether to show text annotations
+        in_place: Draw on image itself instead of a copy (RGB images only)
 
     Returns:
         Annotated PIL Image
@@ -24,7 +35,8 @@ def plot_detection(image, boxes, scores, labels=None, show_labels=True):
     # Ensure image is in RGB mode
     if image.mode != 'RGB':
         image = image.convert('RGB')
-    image = image.copy()
+    elif not in_place:
+        image = image.copy()
     draw = ImageDraw.Draw(image)
     font = ImageFont.load_default()
 
@@ -71,6 +83,102 @@ def plot_detection(image, boxes, scores, labels=None, show_labels=True):
     return image
 
 
+@lru_cache(maxsize=None)
+def label_color(label):
+    """Stable RGB color of a label, identical across images, runs and processes"""
+    if label is None:
+        return PALETTE[0]
+    return PALETTE[zlib.crc32(str(label).encode("utf-8")) % len(PALETTE)]
+
+
+@lru_cache(maxsize=1)
+def _default_font():
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=4096)
+def _label_patch(text, color):
+    """
+    Pre-rendered text box (background + white text) as an RGBA patch
+
+    Glyph rasterization dominates annotation time and the same label/score
+    strings repeat across boxes and images, so each one is rendered once.
+    """
+    font = _default_font()
+    left, top, right, bottom = font.getbbox(text)
+    text_width, text_height = right - left, bottom - top
+    # the glyphs may reach past the background box, keep them as plot_detection does
+    patch = Image.new('RGBA', (max(text_width, right) + 1, max(text_height, bottom) + 1), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(patch)
+    draw.rectangle([0, 0, text_width, text_height], fill=color)
+    draw.text((0, 0), text, fill='white', font=font)
+    return patch, text_width, text_height
+
+
+@METRICS.timer("render")
+def render_detections(image, boxes, scores, labels=None, show_labels=True, in_place=False):
+    """
+    Fast annotation for batch output, same layout as plot_detection.
+
+    Boxes and scores are converted to Python lists once, colors are stable
+    per label and text boxes are rendered once per label/score string and
+    pasted, so the per-box cost is a rectangle and a paste.
+
+    Args:
+        image: PIL Image
+        boxes: Tensor, array or list of [xmin, ymin, xmax, ymax]
+        scores: Confidence scores
+        labels: Text labels or None
+        show_labels: Whether to show text annotations
+        in_place: Draw on image itself instead of a copy (RGB images only)
+
+    Returns:
+        Annotated PIL Image
+    """
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif not in_place:
+        image = image.copy()
+
+    boxes = boxes.tolist() if hasattr(boxes, "tolist") else boxes
+    scores = scores.tolist() if hasattr(scores, "tolist") else scores
+    labels = labels if labels is not None else [None] * len(boxes)
+
+    draw = ImageDraw.Draw(image)
+
+    for box, score, label in zip(boxes, scores, labels):
+        xmin, ymin, xmax, ymax = map(int, box)
+        color = label_color(label)
+        draw.rectangle([xmin, ymin, xmax, ymax], outline=color, width=2)
+
+        if show_labels:
+            text = f"{label}: {score:.2f}" if label else f"{score:.2f}"
+            patch, text_width, text_height = _label_patch(text, color)
+
+            # text box centered on the bounding box
+            text_x = (xmin + xmax) // 2 - text_width // 2
+            text_y = (ymin + ymax) // 2 - text_height // 2
+            image.paste(patch, (text_x, text_y), patch)
+
+    return image
+
+
+@METRICS.timer("save")
+def save_image(image, path, quality=JPEG_QUALITY):
+    """
+    Save an annotated image without touching matplotlib.
+
+    Args:
+        image: PIL Image
+        path: Output path, the format follows the extension
+        quality: JPEG quality (1-95), ignored for other formats
+    """
+    if os.path.splitext(path)[1].lower() in (".jpg", ".jpeg"):
+        image.save(path, quality=quality)
+    else:
+        image.save(path)
+
+
 def display_result(image, save=True, save_dir="results"):
     """
     Display and optionally save annotated PIL image with timestamped filename.
@@ -91,13 +199,19 @@ def display_result(image, save=True, save_dir="results"):
 
         now = datetime.now()
         
-        # Format: detection-HHMM-DD-MM.jpg
-        filename = now.strftime("detection-%H%M-%d-%m.jpg")
+        # Format: detection-HHMMSS-DD-MM.jpg, numbered when several results land in the same second
+        stem = now.strftime("detection-%H%M%S-%d-%m")
+        filename = f"{stem}.jpg"
+        counter = 1
+        while os.path.exists(os.path.join(save_dir, filename)):
+            filename = f"{stem}-{counter}.jpg"
+            counter += 1
         save_path = os.path.join(save_dir, filename)
-        image.save(save_path)
+        save_image(image, save_path)
         print(f"Image saved to {save_path}")
 
-    # Display image
+    # Display image, matplotlib is only imported when a window is needed
+    import matplotlib.pyplot as plt
     plt.imshow(image)
     plt.axis('off')
     plt.show()
\ No newline at end of file